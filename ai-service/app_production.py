@@ -13,12 +13,17 @@ import uuid
 import logging
 import base64
 import io
+import gc
+import atexit
+import threading
+from contextlib import nullcontext
 from datetime import datetime
 from pathlib import Path
 
 # 导入必要的库
 try:
-    from flask import Flask, request, jsonify, render_template_string
+    from flask import (Flask, Response, request, jsonify, render_template_string, send_file, stream_with_context,
+                       has_request_context)
     from flask_cors import CORS
     from ultralytics import YOLO
     import numpy as np
@@ -28,6 +33,32 @@ except ImportError as e:
     print(f"❌ 导入失败: {e}")
     sys.exit(1)
 
+# 可选依赖：进程内存统计
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+from phash_cache import PerceptualHashCache, compute_fingerprint
+from video_detection import iter_video_frames, iter_sequence_frames, detect_frame_stream, video_frame_count
+from job_queue import JobQueue, JobWorkerPool
+from traffic_capture import TrafficRecorder
+from stub_backend import StubYOLO
+from model_router import SpecialistModelCache, CropRoutedModel
+from prediction_log import PredictionLogger
+from compiled_model import CompiledClassifier, PooledPredictor, model_imgsz
+from buffer_pool import InputBufferPool
+from model_snapshot import load_snapshot, save_snapshot, snapshot_paths
+from backend_selector import select_fastest_backend, make_benchmark_images, probabilities
+from rpc_server import DetectionRpcServer
+from single_flight import SingleFlight, content_digest
+from inference_scheduler import PriorityScheduler
+from explanations import ExplanationService, make_explainer
+from slo_controller import SloController, build_quality_levels, FULL_QUALITY
+from embedding_index import EmbeddingIndex, attach_feature_capture
+from memory_budget import (MemoryBudget, MemoryBudgetExceeded, ImageTooLargeError,
+                           limit_decode_size, shrink_to_limit, estimate_decode_bytes)
+
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -366,6 +397,169 @@ UPLOAD_FOLDER = Path("uploads")
 UPLOAD_FOLDER.mkdir(exist_ok=True)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB
+ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp'}
+
+# 多图检测配置
+DETECT_BATCH_SIZE = int(os.environ.get('DETECT_BATCH_SIZE', '8'))
+DETECT_BATCH_MAX_IMAGES = int(os.environ.get('DETECT_BATCH_MAX_IMAGES', '256'))
+
+# 推理后端配置：yolo为真实模型，stub为合成延迟模型（用于容量规划）
+INFERENCE_BACKEND = os.environ.get('INFERENCE_BACKEND', 'yolo')
+STUB_LATENCY_CURVE = os.environ.get('STUB_LATENCY_CURVE', '1:25,8:90,32:300')
+STUB_JITTER = float(os.environ.get('STUB_JITTER', '0.1'))
+STUB_CPU_FRACTION = float(os.environ.get('STUB_CPU_FRACTION', '0.8'))
+STUB_CONFIDENCE = float(os.environ.get('STUB_CONFIDENCE', '0.85'))
+
+# 预融合模型快照：首次加载后在权重旁保存融合好的网络，之后启动以内存映射方式加载；
+# 启用后推理改为直接调用融合网络（不经过 ultralytics 预测器），默认关闭
+MODEL_SNAPSHOT_ENABLED = os.environ.get('MODEL_SNAPSHOT_ENABLED', '0') == '1'
+
+# TorchScript追踪（trace）或torch.compile（compile）推理路径，默认关闭；编译产物按权重哈希与torch版本缓存
+TORCH_COMPILE_MODE = os.environ.get('TORCH_COMPILE_MODE', '')
+TORCH_COMPILE_CACHE_DIR = os.environ.get('TORCH_COMPILE_CACHE_DIR', '')
+
+# 推理输入缓冲池：默认的 ultralytics 分类模型（预处理一致时）与直接调用网络的推理路径
+# （预融合快照 / TorchScript / torch.compile）复用预分配的输入缓冲
+INPUT_BUFFER_POOL_ENABLED = os.environ.get('INPUT_BUFFER_POOL_ENABLED', '1') == '1'
+INPUT_BUFFER_POOL_SIZE = int(os.environ.get('INPUT_BUFFER_POOL_SIZE', '4'))
+
+# 启动时推理后端自动选择（默认关闭）：对原始权重与导出产物测速，选用输出一致且最快的后端
+AUTO_BENCHMARK_ENABLED = os.environ.get('AUTO_BENCHMARK_ENABLED', '0') == '1'
+AUTO_BENCHMARK_EXPORT = os.environ.get('AUTO_BENCHMARK_EXPORT', '0') == '1'
+AUTO_BENCHMARK_TOLERANCE = float(os.environ.get('AUTO_BENCHMARK_TOLERANCE', '1e-3'))
+AUTO_BENCHMARK_ITERATIONS = int(os.environ.get('AUTO_BENCHMARK_ITERATIONS', '10'))
+
+# 作物专家模型路由配置（默认关闭）
+ROUTING_ENABLED = os.environ.get('ROUTING_ENABLED', '0') == '1'
+ROUTER_MODEL_PATH = Path(os.environ.get('ROUTER_MODEL_PATH', Path(__file__).parent / "crop_router.pt"))
+SPECIALIST_MODEL_DIR = Path(os.environ.get('SPECIALIST_MODEL_DIR', Path(__file__).parent / "specialists"))
+SPECIALIST_CACHE_BYTES = int(os.environ.get('SPECIALIST_CACHE_MB', '512')) * 1024 * 1024
+SPECIALIST_CACHE_MAX_MODELS = int(os.environ.get('SPECIALIST_CACHE_MAX_MODELS', '4'))
+
+# 内存预算配置：限制在途解码总内存，超大图像解码前降采样（downscale）或拒绝（reject）
+MEMORY_BUDGET_BYTES = int(os.environ.get('MEMORY_BUDGET_MB', '1024')) * 1024 * 1024
+MEMORY_WAIT_TIMEOUT = float(os.environ.get('MEMORY_WAIT_TIMEOUT', '5'))
+MAX_DECODE_PIXELS = int(os.environ.get('MAX_DECODE_PIXELS', str(24 * 1000 * 1000)))
+OVERSIZE_POLICY = os.environ.get('OVERSIZE_POLICY', 'downscale')
+
+# 特征提取与相似病例检索配置
+EMBEDDING_INDEX_ENABLED = os.environ.get('EMBEDDING_INDEX_ENABLED', '1') == '1'
+EMBEDDING_INDEX_DIR = Path(os.environ.get('EMBEDDING_INDEX_DIR', 'embeddings'))
+EMBEDDING_INDEX_DTYPE = os.environ.get('EMBEDDING_INDEX_DTYPE', 'float32')
+EMBEDDING_TOP_K = int(os.environ.get('EMBEDDING_TOP_K', '5'))
+EMBEDDING_MAX_TOP_K = int(os.environ.get('EMBEDDING_MAX_TOP_K', '100'))
+
+# 推理调度配置：交互请求与批量任务共享模型，按优先级类别与容量份额分配推理槽位，
+# 份额书写顺序即优先级顺序
+SCHEDULER_ENABLED = os.environ.get('SCHEDULER_ENABLED', '1') == '1'
+SCHEDULER_SLOTS = int(os.environ.get('SCHEDULER_SLOTS', '2'))
+SCHEDULER_SHARES = os.environ.get('SCHEDULER_SHARES', 'interactive:0.8,bulk:0.2')
+PRIORITY_HEADER = os.environ.get('PRIORITY_HEADER', 'X-Priority')
+# 各接口默认的优先级类别，请求头指定已配置的类别时以请求头为准
+ENDPOINT_PRIORITY = {
+    '/detect': 'interactive',
+    '/embed': 'interactive',
+    'rpc': 'interactive',
+    '/detect/batch': 'bulk',
+    '/detect/video': 'bulk',
+    'jobs': 'bulk'
+}
+
+# SLO自适应降级配置（SLO_P95_MS为0时关闭）：交互请求p95延迟接近SLO时按DEGRADE_STEPS逐级降低质量，
+# 可选步骤为 reduced_input（输入缩小到DEGRADE_IMGSZ）、small_model（换用DEGRADE_MODEL_PATH）、top1_only
+SLO_P95_MS = float(os.environ.get('SLO_P95_MS', '0'))
+SLO_WINDOW_SECONDS = float(os.environ.get('SLO_WINDOW_SECONDS', '30'))
+SLO_MIN_SAMPLES = int(os.environ.get('SLO_MIN_SAMPLES', '20'))
+SLO_RISK_RATIO = float(os.environ.get('SLO_RISK_RATIO', '0.9'))
+SLO_RECOVER_RATIO = float(os.environ.get('SLO_RECOVER_RATIO', '0.6'))
+SLO_COOLDOWN_SECONDS = float(os.environ.get('SLO_COOLDOWN_SECONDS', '10'))
+DEGRADE_STEPS = [step.strip() for step in os.environ.get('DEGRADE_STEPS', 'reduced_input,small_model,top1_only').split(',') if step.strip()]
+DEGRADE_IMGSZ = int(os.environ.get('DEGRADE_IMGSZ', '160'))
+DEGRADE_MODEL_PATH = os.environ.get('DEGRADE_MODEL_PATH', '')
+
+# 显著性图（Grad-CAM）解释配置：检测时保留模型输入，按detection_id请求后由后台线程以低优先级计算
+EXPLAIN_ENABLED = os.environ.get('EXPLAIN_ENABLED', '1') == '1'
+EXPLAIN_RETAIN_BYTES = int(os.environ.get('EXPLAIN_RETAIN_MB', '64')) * 1024 * 1024
+EXPLAIN_CACHE_BYTES = int(os.environ.get('EXPLAIN_CACHE_MB', '64')) * 1024 * 1024
+EXPLAIN_QUEUE_SIZE = int(os.environ.get('EXPLAIN_QUEUE_SIZE', '64'))
+EXPLAIN_WORKERS = int(os.environ.get('EXPLAIN_WORKERS', '1'))
+EXPLAIN_PRIORITY = os.environ.get('EXPLAIN_PRIORITY', 'background')
+# 启用解释且未自定义份额时，默认份额加入供解释计算使用的最低优先级background类别
+if EXPLAIN_ENABLED and 'SCHEDULER_SHARES' not in os.environ:
+    SCHEDULER_SHARES = 'interactive:0.75,bulk:0.2,background:0.05'
+
+# 相同内容在途请求合并配置
+COALESCE_ENABLED = os.environ.get('COALESCE_ENABLED', '1') == '1'
+
+# 感知哈希近重复缓存配置（默认关闭）
+PHASH_CACHE_ENABLED = os.environ.get('PHASH_CACHE_ENABLED', '0') == '1'
+PHASH_CACHE_SIZE = int(os.environ.get('PHASH_CACHE_SIZE', '512'))
+PHASH_MAX_DISTANCE = int(os.environ.get('PHASH_MAX_DISTANCE', '4'))
+PHASH_CACHE_TTL = float(os.environ.get('PHASH_CACHE_TTL', '300'))
+PHASH_CACHE_EVICTION = os.environ.get('PHASH_CACHE_EVICTION', 'lru')
+# 梯度数少于该值的纯色、低纹理图像不参与缓存
+PHASH_MIN_GRADIENTS = int(os.environ.get('PHASH_MIN_GRADIENTS', '16'))
+# 命中时颜色签名允许的最大通道差
+PHASH_MAX_COLOUR_DISTANCE = int(os.environ.get('PHASH_MAX_COLOUR_DISTANCE', '24'))
+
+# 视频 / 帧序列检测配置
+VIDEO_SAMPLE_FPS = float(os.environ.get('VIDEO_SAMPLE_FPS', '2'))
+VIDEO_BATCH_SIZE = int(os.environ.get('VIDEO_BATCH_SIZE', '16'))
+VIDEO_DEDUP_DISTANCE = int(os.environ.get('VIDEO_DEDUP_DISTANCE', '3'))
+VIDEO_SEGMENT_SECONDS = float(os.environ.get('VIDEO_SEGMENT_SECONDS', '2'))
+VIDEO_SMOOTHING = float(os.environ.get('VIDEO_SMOOTHING', '0.6'))
+VIDEO_MAX_FRAMES = int(os.environ.get('VIDEO_MAX_FRAMES', '3600'))
+# 视频上传大小上限（MB），单独放宽 /detect/video 的请求体限制
+VIDEO_MAX_UPLOAD_BYTES = int(os.environ.get('VIDEO_MAX_UPLOAD_MB', '512')) * 1024 * 1024
+
+# 异步批量任务配置
+JOB_STORAGE_DIR = Path(os.environ.get('JOB_STORAGE_DIR', 'jobs'))
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', '1'))
+JOB_BATCH_SIZE = int(os.environ.get('JOB_BATCH_SIZE', '16'))
+JOB_MAX_IMAGES = int(os.environ.get('JOB_MAX_IMAGES', '20000'))
+JOB_MAX_UPLOAD_BYTES = int(os.environ.get('JOB_MAX_UPLOAD_MB', '1024')) * 1024 * 1024
+JOB_MAX_YIELD_SECONDS = float(os.environ.get('JOB_MAX_YIELD_SECONDS', '2'))
+
+# 预测日志配置：后台批量写入滚动的压缩文件，队列满时丢弃（drop）或溢写到磁盘（spill）
+PREDICTION_LOG_ENABLED = os.environ.get('PREDICTION_LOG_ENABLED', '1') == '1'
+PREDICTION_LOG_DIR = Path(os.environ.get('PREDICTION_LOG_DIR', 'predictions'))
+PREDICTION_LOG_FORMAT = os.environ.get('PREDICTION_LOG_FORMAT', 'jsonl')
+PREDICTION_LOG_QUEUE_SIZE = int(os.environ.get('PREDICTION_LOG_QUEUE_SIZE', '10000'))
+PREDICTION_LOG_BATCH_SIZE = int(os.environ.get('PREDICTION_LOG_BATCH_SIZE', '256'))
+PREDICTION_LOG_FLUSH_SECONDS = float(os.environ.get('PREDICTION_LOG_FLUSH_SECONDS', '1'))
+PREDICTION_LOG_ROTATE_BYTES = int(os.environ.get('PREDICTION_LOG_ROTATE_MB', '64')) * 1024 * 1024
+PREDICTION_LOG_ROTATE_SECONDS = float(os.environ.get('PREDICTION_LOG_ROTATE_SECONDS', '3600'))
+PREDICTION_LOG_OVERFLOW = os.environ.get('PREDICTION_LOG_OVERFLOW', 'drop')
+
+# 二进制RPC通道配置（默认关闭），地址形如 unix:/tmp/crop-disease.sock 或 tcp:127.0.0.1:5050
+RPC_ADDRESS = os.environ.get('RPC_ADDRESS', '')
+RPC_WORKERS = int(os.environ.get('RPC_WORKERS', '4'))
+RPC_MAX_PIPELINE = int(os.environ.get('RPC_MAX_PIPELINE', '32'))
+
+# 流量采集配置（默认关闭）
+TRAFFIC_CAPTURE_ENABLED = os.environ.get('TRAFFIC_CAPTURE_ENABLED', '0') == '1'
+TRAFFIC_CAPTURE_DIR = Path(os.environ.get('TRAFFIC_CAPTURE_DIR', 'traffic'))
+TRAFFIC_CAPTURE_MODE = os.environ.get('TRAFFIC_CAPTURE_MODE', 'payload')
+TRAFFIC_CAPTURE_SEGMENT_BYTES = int(os.environ.get('TRAFFIC_CAPTURE_SEGMENT_MB', '256')) * 1024 * 1024
+TRAFFIC_CAPTURE_MAX_SEGMENTS = int(os.environ.get('TRAFFIC_CAPTURE_MAX_SEGMENTS', '8'))
+TRAFFIC_CAPTURE_SAMPLE_RATE = float(os.environ.get('TRAFFIC_CAPTURE_SAMPLE_RATE', '1.0'))
+
+class InflightCounter:
+    """统计在途的交互式检测请求数"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0
+        
+    def __enter__(self):
+        with self._lock:
+            self.value += 1
+        return self
+        
+    def __exit__(self, *exc_info):
+        with self._lock:
+            self.value -= 1
+            
+interactive_inflight = InflightCounter()
 
 class CropDiseaseDetector:
     def __init__(self):
@@ -681,13 +875,66 @@ class CropDiseaseDetector:
             }
         }
         
+        # 在途解码内存预算
+        self.memory_budget = MemoryBudget(MEMORY_BUDGET_BYTES, wait_timeout=MEMORY_WAIT_TIMEOUT)
+        
+        # 按优先级调度推理槽位
+        self.scheduler = PriorityScheduler(SCHEDULER_SLOTS, SCHEDULER_SHARES) if SCHEDULER_ENABLED else None
+        
+        # 相同内容的在途请求合并为一次推理
+        self.single_flight = SingleFlight() if COALESCE_ENABLED else None
+        
+        # 近重复结果缓存
+        self.phash_cache = PerceptualHashCache(
+            max_entries=PHASH_CACHE_SIZE,
+            max_distance=PHASH_MAX_DISTANCE,
+            ttl_seconds=PHASH_CACHE_TTL,
+            eviction=PHASH_CACHE_EVICTION,
+            min_gradients=PHASH_MIN_GRADIENTS,
+            max_colour_distance=PHASH_MAX_COLOUR_DISTANCE
+        ) if PHASH_CACHE_ENABLED else None
+        
         # 加载模型
+        self.routing_enabled = False
+        self.inference_backend = INFERENCE_BACKEND
+        self.backend_report = None
+        self.compile_info = None
+        self.snapshot_info = None
+        self.eager_model = None
         self.load_model()
+        self.buffer_pool = self.attach_buffer_pool()
+        
+        # SLO自适应降级的质量级别
+        self.small_model = self.load_small_model()
+        self.quality_levels = build_quality_levels(DEGRADE_STEPS, DEGRADE_IMGSZ, self.small_model is not None)
+        self.slo_controller = None
+        if SLO_P95_MS > 0 and self.model_loaded and len(self.quality_levels) > 1:
+            self.slo_controller = SloController(
+                self.quality_levels, SLO_P95_MS,
+                window_seconds=SLO_WINDOW_SECONDS,
+                min_samples=SLO_MIN_SAMPLES,
+                risk_ratio=SLO_RISK_RATIO,
+                recover_ratio=SLO_RECOVER_RATIO,
+                cooldown_seconds=SLO_COOLDOWN_SECONDS
+            )
+            print(f"🎚️ SLO自适应降级已启用: p95 {SLO_P95_MS:.0f}ms，质量级别 {[level['name'] for level in self.quality_levels]}")
+        
+        # 在通用模型最后一个全连接层前截取特征，供相似病例检索使用
+        self.embedding_model = self.eager_model or self.model
+        # 解释服务复制通用模型的网络，需在挂接特征截取钩子之前创建
+        self.explanations = self.create_explanation_service() if EXPLAIN_ENABLED and self.model_loaded else None
+        self.feature_capture = attach_feature_capture(self.embedding_model) if self.model_loaded else None
+        
+        if ROUTING_ENABLED and self.model_loaded:
+            self.load_router()
         
         print(f"✅ 检测器初始化完成，支持 {len(self.class_names)} 个类别")
         
     def load_model(self):
         """加载训练好的模型v1"""
+        if INFERENCE_BACKEND == 'stub':
+            return self.load_stub_model()
+            
         # 使用绝对路径确保能找到模型文件
         # 首先检查当前目录下的模型文件
         current_dir = Path(__file__).parent
@@ -701,11 +948,18 @@ class CropDiseaseDetector:
         if model_path.exists():
             try:
                 print(f"📦 加载训练模型v1: {model_path}")
-                self.model = YOLO(str(model_path))
+                self.model = self.load_weights(model_path)
                 print("✅ 训练模型v1加载成功")
                 print(f"📊 支持类别数: {len(self.model.names)}")
                 self.model_type = "custom_trained"
                 self.model_loaded = True
+                compiled = self.compile_model(model_path) if TORCH_COMPILE_MODE else None
+                if AUTO_BENCHMARK_ENABLED:
+                    self.select_backend(model_path, compiled)
+                elif compiled is not None:
+                    self.eager_model = self.model
+                    self.model = compiled
+                    self.inference_backend = f"torch-{TORCH_COMPILE_MODE}"
                 return True
             except Exception as e:
                 print(f"❌ 训练模型加载失败: {e}")
@@ -714,6 +968,226 @@ class CropDiseaseDetector:
             print(f"⚠️ 未找到训练模型，检查路径: {model_path}")
             self.load_fallback_model()
             
+    def load_weights(self, model_path):
+        """加载权重；启用快照时优先以内存映射方式加载预融合快照，快照缺失或失效时重新生成"""
+        if not MODEL_SNAPSHOT_ENABLED:
+            # 默认关闭：推理走 ultralytics 预测器（输入缓冲池由 attach_buffer_pool 挂接到默认路径）
+            self.snapshot_info = {'status': 'disabled'}
+            return YOLO(str(model_path))
+            
+        start = time.time()
+        snapshot_path, _ = snapshot_paths(model_path)
+        model, reason = load_snapshot(model_path)
+        if model is not None:
+            self.snapshot_info = {'path': str(snapshot_path), 'status': 'loaded',
+                                  'load_seconds': round(time.time() - start, 3)}
+            print(f"⚡ 已加载预融合快照，用时 {self.snapshot_info['load_seconds']}s: {snapshot_path}")
+            print("⚡ 推理后端: 直接调用融合网络（不经过 ultralytics 预测器）")
+            return model
+            
+        yolo = YOLO(str(model_path))
+        try:
+            model, agreement = save_snapshot(yolo, model_path)
+        except Exception as e:
+            print(f"⚠️ 预融合快照保存失败，使用原始模型: {e}")
+            self.snapshot_info = {'path': str(snapshot_path), 'status': 'failed', 'reason': str(e)}
+            # 融合可能已原地修改网络，重新加载原始模型
+            return YOLO(str(model_path))
+        self.snapshot_info = {'path': str(snapshot_path), 'status': 'created', 'reason': reason,
+                              'top1_agreement': agreement,
+                              'load_seconds': round(time.time() - start, 3)}
+        print(f"💾 已生成预融合快照（{reason}，合成图像Top-1一致率 {agreement:.0%}）: {snapshot_path}")
+        print("⚡ 推理后端: 直接调用融合网络（不经过 ultralytics 预测器）")
+        return model
+        
+    def create_explanation_service(self):
+        """基于通用模型构建显著性图解释服务，计算时占用调度器中优先级最低（或EXPLAIN_PRIORITY指定）的类别"""
+        try:
+            explainer, imgsz = make_explainer(self.embedding_model)
+        except Exception as e:
+            print(f"❌ 显著性图解释初始化失败: {e}")
+            return None
+        if explainer is None:
+            print("⚠️ 当前模型不支持显著性图解释")
+            return None
+            
+        slot = None
+        if self.scheduler is not None:
+            classes = list(self.scheduler.classes)
+            priority = EXPLAIN_PRIORITY if EXPLAIN_PRIORITY in classes else classes[-1]
+            slot = lambda: self.scheduler.slot(priority)
+        return ExplanationService(
+            explainer, imgsz,
+            retain_bytes=EXPLAIN_RETAIN_BYTES,
+            cache_bytes=EXPLAIN_CACHE_BYTES,
+            queue_size=EXPLAIN_QUEUE_SIZE,
+            workers=EXPLAIN_WORKERS,
+            slot=slot
+        )
+        
+    def retain_input(self, response, image):
+        """保留本次检测的模型输入，之后可按detection_id请求显著性图"""
+        if self.explanations is None or not response.get('success'):
+            return
+        primary = response['result']['primary']
+        if primary is None or primary['class_name'] not in self.class_names:
+            return
+        self.explanations.retain(response['detection_id'], image,
+                                 self.class_names.index(primary['class_name']), primary['class_name'])
+        
+    def load_small_model(self):
+        """加载降级用的小模型，类别顺序须与主模型一致"""
+        if not DEGRADE_MODEL_PATH or not self.model_loaded:
+            return None
+        path = Path(DEGRADE_MODEL_PATH)
+        if not path.exists():
+            print(f"⚠️ 未找到降级模型: {path}")
+            return None
+        try:
+            model = YOLO(str(path))
+        except Exception as e:
+            print(f"❌ 降级模型加载失败: {e}")
+            return None
+        if [model.names[i] for i in range(len(model.names))] != self.class_names:
+            print(f"⚠️ 降级模型类别与主模型不一致，不使用: {path}")
+            return None
+        print(f"✅ 降级模型已加载: {path}")
+        return model
+        
+    def current_quality(self):
+        """当前服务质量级别，未启用降级时始终为完整质量"""
+        return self.slo_controller.current() if self.slo_controller is not None else FULL_QUALITY
+        
+    def observe_latency(self, seconds):
+        """记录交互请求的端到端延迟，供SLO自适应降级判断"""
+        if self.slo_controller is not None:
+            self.slo_controller.observe(seconds)
+            
+    def attach_buffer_pool(self):
+        """
+        为推理模型挂接输入缓冲池：直接调用网络的模型（预融合快照 / TorchScript / torch.compile）直接使用；
+        默认的 ultralytics 分类模型封装为 PooledPredictor，在合成图像上Top-1与原预测器一致时才启用
+        """
+        if not INPUT_BUFFER_POOL_ENABLED:
+            return None
+        if not hasattr(self.model, 'buffer_pool'):
+            pooled = self.wrap_default_model()
+            if pooled is not None:
+                self.model = pooled
+        models = [model for model in (self.model, self.eager_model) if hasattr(model, 'buffer_pool')]
+        if not models:
+            print(f"⚠️ 推理输入缓冲池已启用，但推理后端 {self.inference_backend} 自行分配输入，缓冲池未挂接")
+            return None
+        pool = InputBufferPool(models[0].imgsz, max_batch=max(DETECT_BATCH_SIZE, JOB_BATCH_SIZE, VIDEO_BATCH_SIZE),
+                               max_buffers=INPUT_BUFFER_POOL_SIZE)
+        for model in models:
+            model.buffer_pool = pool
+        print(f"🧱 推理输入缓冲池已启用: 最大批大小 {pool.max_batch}，最多 {pool.max_buffers} 个缓冲")
+        return pool
+        
+    def wrap_default_model(self):
+        """将 ultralytics PyTorch 分类模型封装为预处理写入缓冲池的 PooledPredictor，不适用时返回None"""
+        model = self.model
+        if getattr(model, 'task', None) != 'classify' or not hasattr(getattr(model, 'model', None), 'parameters'):
+            return None
+        try:
+            pooled = PooledPredictor(model, model_imgsz(model.model))
+            # 预处理改由本服务完成，与 ultralytics 自带变换不一致（如版本间裁剪比例不同）时不启用
+            images = make_benchmark_images(8, size=pooled.imgsz)
+            expected = probabilities(model(images, verbose=False)).argmax(axis=1)
+            pooled.buffer_pool = InputBufferPool(pooled.imgsz, max_batch=len(images), max_buffers=1)
+            agreement = float((probabilities(pooled(images, verbose=False)).argmax(axis=1) == expected).mean())
+            pooled.buffer_pool = None
+        except Exception as e:
+            print(f"⚠️ 默认推理路径无法使用输入缓冲池: {e}")
+            return None
+        if agreement < 1.0:
+            print(f"⚠️ 缓冲池预处理与 ultralytics 预测器Top-1一致率为 {agreement:.0%}，默认推理路径不使用缓冲池")
+            return None
+        return pooled
+        
+    def compile_model(self, model_path):
+        """追踪或编译分类网络，推理时直接调用编译后的模块"""
+        try:
+            print(f"⚙️ 编译分类网络（{TORCH_COMPILE_MODE}）...")
+            compiled = CompiledClassifier(
+                self.model, model_path,
+                mode=TORCH_COMPILE_MODE,
+                cache_dir=TORCH_COMPILE_CACHE_DIR or None,
+                warmup_batch_size=DETECT_BATCH_SIZE
+            )
+            self.compile_info = compiled.info()
+            print(f"✅ 编译完成{'（使用缓存）' if compiled.cache_hit else ''}: {compiled.cache_path}")
+            return compiled
+        except Exception as e:
+            print(f"❌ 分类网络编译失败，继续使用原始模型: {e}")
+            return None
+            
+    def select_backend(self, model_path, compiled=None):
+        """在本机测速各推理后端，选用输出一致且最快的一个"""
+        try:
+            print("⏱️ 推理后端测速中...")
+            model, report = select_fastest_backend(
+                self.model, model_path, YOLO,
+                batch_size=DETECT_BATCH_SIZE,
+                tolerance=AUTO_BENCHMARK_TOLERANCE,
+                export_missing=AUTO_BENCHMARK_EXPORT,
+                iterations=AUTO_BENCHMARK_ITERATIONS,
+                extra_candidates=[(f"torch-{TORCH_COMPILE_MODE}", compiled)] if compiled is not None else ()
+            )
+        except Exception as e:
+            print(f"❌ 推理后端测速失败，继续使用原始模型: {e}")
+            return False
+        for entry in report['candidates']:
+            if 'median_ms' in entry:
+                print(f"   {entry['backend']}: {entry['median_ms']} ms/批，最大差异 {entry['max_abs_diff']}"
+                      f"{'' if entry['agrees'] else '（输出不一致，不参与选择）'}")
+            else:
+                print(f"   {entry['backend']}: 不可用（{entry['error']}）")
+        print(f"✅ 选用推理后端: {report['selected']}")
+        
+        # 特征提取依赖原始网络结构，选用导出后端时保留原始模型供 /embed 使用
+        self.eager_model = self.model
+        self.model = model
+        self.backend_report = report
+        self.inference_backend = report['selected']
+        return True
+        
+    def load_router(self):
+        """加载作物识别模型，之后由作物专家模型分类，缺少专家模型的作物仍使用通用模型"""
+        if not ROUTER_MODEL_PATH.exists():
+            print(f"⚠️ 未找到作物识别模型，专家路由未启用: {ROUTER_MODEL_PATH}")
+            return False
+        try:
+            print(f"📦 加载作物识别模型: {ROUTER_MODEL_PATH}")
+            router = YOLO(str(ROUTER_MODEL_PATH))
+            specialists = SpecialistModelCache(
+                YOLO, SPECIALIST_MODEL_DIR,
+                max_bytes=SPECIALIST_CACHE_BYTES,
+                max_models=SPECIALIST_CACHE_MAX_MODELS
+            )
+            self.model = CropRoutedModel(router, specialists, self.model, self.class_names)
+            self.routing_enabled = True
+            print(f"✅ 专家路由已启用，专家模型目录: {SPECIALIST_MODEL_DIR}")
+            return True
+        except Exception as e:
+            print(f"❌ 作物识别模型加载失败，继续使用通用模型: {e}")
+            return False
+            
+    def load_stub_model(self):
+        """加载合成延迟模型"""
+        print(f"🧪 使用合成延迟推理后端，延迟曲线: {STUB_LATENCY_CURVE}")
+        self.model = StubYOLO(
+            self.class_names,
+            latency_curve=STUB_LATENCY_CURVE,
+            jitter=STUB_JITTER,
+            cpu_fraction=STUB_CPU_FRACTION,
+            confidence=STUB_CONFIDENCE
+        )
+        self.model_type = "stub"
+        self.model_loaded = True
+        return True
+        
     def load_fallback_model(self):
         """加载备用模型"""
         try:
@@ -728,88 +1202,279 @@ class CropDiseaseDetector:
             self.model_type = "none"
             self.model_loaded = False
             
+    def open_image(self, image_data):
+        """解析图像头部并按尺寸上限设置解码方式，不解码像素，返回 (图像, 原始字节数)"""
+        raw_bytes = 0
+        # 处理不同类型的图像输入
+        if isinstance(image_data, str):
+            # Base64字符串
+            if image_data.startswith('data:image'):
+                image_data = image_data.split(',')[1]
+            image_bytes = base64.b64decode(image_data)
+            raw_bytes = len(image_data) + len(image_bytes)
+            image = Image.open(io.BytesIO(image_bytes))
+        elif isinstance(image_data, bytes):
+            # 字节数据
+            raw_bytes = len(image_data)
+            image = Image.open(io.BytesIO(image_data))
+        else:
+            # PIL Image或numpy array
+            image = image_data
+            
+        if isinstance(image, Image.Image):
+            original_size = image.size
+            try:
+                image = limit_decode_size(image, MAX_DECODE_PIXELS, OVERSIZE_POLICY)
+            except ImageTooLargeError:
+                self.memory_budget.oversize_rejected += 1
+                raise
+            if image.size != original_size:
+                # 标记已计数，解码后再次缩小时不重复统计
+                image.info['downscaled'] = True
+                self.memory_budget.downscaled += 1
+        return image, raw_bytes
+        
+    def decode_image(self, image):
+        """解码已限制尺寸的图像并转换为RGB；不支持draft的格式在解码后再缩小"""
+        if hasattr(image, 'mode') and image.mode != 'RGB':
+            image = image.convert('RGB')
+            
+        if isinstance(image, Image.Image) and image.size[0] * image.size[1] > MAX_DECODE_PIXELS:
+            counted = image.info.get('downscaled', False)
+            image = shrink_to_limit(image, MAX_DECODE_PIXELS)
+            if not counted:
+                image.info['downscaled'] = True
+                self.memory_budget.downscaled += 1
+        return image
+        
+    def load_image(self, image_data):
+        """打开、限制尺寸并解码为RGB图像，供视频帧等不经过 preprocess_image 的路径使用"""
+        image, _ = self.open_image(image_data)
+        return self.decode_image(image)
+        
+    def reserve_images(self, images, raw_bytes=0):
+        """按图像估算大小在全局内存预算中预留，返回上下文管理器"""
+        return self.memory_budget.reserve(sum(self.estimate_image_bytes(image) for image in images) + raw_bytes)
+        
     def preprocess_image(self, image_data):
         """预处理图像"""
         try:
-            # 处理不同类型的图像输入
-            if isinstance(image_data, str):
-                # Base64字符串
-                if image_data.startswith('data:image'):
-                    image_data = image_data.split(',')[1]
-                image_bytes = base64.b64decode(image_data)
-                image = Image.open(io.BytesIO(image_bytes))
-            elif isinstance(image_data, bytes):
-                # 字节数据
-                image = Image.open(io.BytesIO(image_data))
-            else:
-                # PIL Image或numpy array
+            # 已由 open_image 打开的图像不再重复限制尺寸
+            if isinstance(image_data, Image.Image):
                 image = image_data
+            else:
+                image, _ = self.open_image(image_data)
                 
-            # 转换为RGB
-            if hasattr(image, 'mode') and image.mode != 'RGB':
-                image = image.convert('RGB')
+            image = self.decode_image(image)
+                
+            # 基于极小缩略图计算感知哈希与颜色签名，供近重复缓存使用
+            if self.phash_cache is not None and isinstance(image, Image.Image):
+                image.info['fingerprint'] = compute_fingerprint(image)
                 
             return image
             
+        except ImageTooLargeError:
+            raise
         except Exception as e:
             logger.error(f"图像预处理失败: {e}")
             return None
             
+    def estimate_image_bytes(self, image, raw_bytes=0):
+        """估算处理单张图像的内存峰值"""
+        if isinstance(image, Image.Image):
+            return estimate_decode_bytes(image, raw_bytes)
+        return getattr(image, 'nbytes', 0) + raw_bytes
+        
     def detect_disease(self, image_data):
-        """检测植物病害"""
+        """检测植物病害；内容相同的请求在前一个仍在处理时直接等待其结果"""
+        # Base64输入先解码，不同上传方式的同一图像得到相同摘要，后续也无需再次解码
+        if isinstance(image_data, str) and self.single_flight is not None:
+            try:
+                image_data = base64.b64decode(image_data.split(',', 1)[1] if image_data.startswith('data:image') else image_data)
+            except ValueError:
+                pass
+        key = content_digest(image_data) if self.single_flight is not None else None
+        if key is None:
+            return self._detect_disease(image_data)
+            
+        response, shared = self.single_flight.do(key, lambda: self._detect_disease(image_data))
+        shared_id = response.get('detection_id')
+        # 每个调用方得到独立的响应外层，调用方补充的字段互不影响
+        response = dict(response)
+        if shared:
+            if response.get('success'):
+                response['detection_id'] = str(uuid.uuid4())
+                if self.explanations is not None:
+                    self.explanations.alias(response['detection_id'], shared_id)
+            response['timestamp'] = datetime.now().isoformat()
+            response['coalesced'] = True
+        return response
+        
+    def _detect_disease(self, image_data):
+        """检测单张图像"""
         try:
-            # 预处理图像
-            image = self.preprocess_image(image_data)
-            if image is None:
+            # 解析图像头部，按解码后大小预留内存
+            try:
+                image, raw_bytes = self.open_image(image_data)
+            except ImageTooLargeError:
+                raise
+            except Exception as e:
+                logger.error(f"图像预处理失败: {e}")
                 return self.create_error_response("图像预处理失败")
                 
-            # 使用模型进行检测
-            if self.model_loaded:
-                return self.classify_with_model(image)
-            else:
-                return self.simulate_detection()
+            with self.memory_budget.reserve(self.estimate_image_bytes(image, raw_bytes)):
+                # 预处理图像
+                image = self.preprocess_image(image)
+                if image is None:
+                    return self.create_error_response("图像预处理失败")
+                    
+                # 使用模型进行检测
+                if not self.model_loaded:
+                    return self.simulate_detection()
+                    
+                # 近重复图像直接复用最近的分类结果
+                fingerprint, response = self.lookup_cached_response(image)
+                if response is None:
+                    response = self.classify_with_model(image, fingerprint=fingerprint, quality=self.current_quality())
+                self.retain_input(response, image)
+                return response
                 
+        except (ImageTooLargeError, MemoryBudgetExceeded) as e:
+            return self.create_error_response(str(e))
         except Exception as e:
             logger.error(f"病害检测失败: {e}")
             return self.create_error_response(f"检测失败: {str(e)}")
             
-    def classify_with_model(self, image):
+    def extract_embedding(self, image_data):
+        """一次前向同时得到分类结果与倒数第二层特征，返回 (响应, 特征向量)"""
+        if self.feature_capture is None:
+            return self.create_error_response("当前模型不支持特征提取"), None
+        try:
+            try:
+                image, raw_bytes = self.open_image(image_data)
+            except ImageTooLargeError:
+                raise
+            except Exception as e:
+                logger.error(f"图像预处理失败: {e}")
+                return self.create_error_response("图像预处理失败"), None
+                
+            with self.memory_budget.reserve(self.estimate_image_bytes(image, raw_bytes)):
+                image = self.preprocess_image(image)
+                if image is None:
+                    return self.create_error_response("图像预处理失败"), None
+                    
+                with self.inference_slot(), self.feature_capture.capture() as features:
+                    results = self.embedding_model(image, verbose=False)
+                    
+            if not features or not results:
+                return self.create_error_response("特征提取失败"), None
+            classifications = self.build_classifications(results[0]) or []
+            response = self.format_classification_response(classifications)
+            self.retain_input(response, image)
+            return response, features[0][0]
+            
+        except (ImageTooLargeError, MemoryBudgetExceeded) as e:
+            return self.create_error_response(str(e)), None
+        except Exception as e:
+            logger.error(f"特征提取失败: {e}")
+            return self.create_error_response(f"特征提取失败: {str(e)}"), None
+            
+    def detect_batch(self, image_data_list):
+        """批量检测植物病害，返回与输入一一对应的响应"""
+        responses = [None] * len(image_data_list)
+        opened = []
+        
+        # 先解析全部图像头部，整批一次性预留内存
+        for i, image_data in enumerate(image_data_list):
+            try:
+                image, raw_bytes = self.open_image(image_data)
+                opened.append((i, image, raw_bytes))
+            except ImageTooLargeError as e:
+                responses[i] = self.create_error_response(str(e))
+            except Exception as e:
+                logger.error(f"图像预处理失败: {e}")
+                responses[i] = self.create_error_response("图像预处理失败")
+                
+        total_bytes = sum(self.estimate_image_bytes(image, raw_bytes) for _, image, raw_bytes in opened)
+        try:
+            with self.memory_budget.reserve(total_bytes):
+                self._detect_opened_batch(opened, responses)
+        except MemoryBudgetExceeded as e:
+            for i, _, _ in opened:
+                responses[i] = self.create_error_response(str(e))
+        return responses
+        
+    def _detect_opened_batch(self, opened, responses):
+        """对已解析头部的图像解码并批量推理"""
+        pending = []
+        for i, image, _ in opened:
+            try:
+                image = self.preprocess_image(image)
+                if image is None:
+                    responses[i] = self.create_error_response("图像预处理失败")
+                elif not self.model_loaded:
+                    responses[i] = self.simulate_detection()
+                else:
+                    fingerprint, cached_response = self.lookup_cached_response(image)
+                    if cached_response is not None:
+                        responses[i] = cached_response
+                        self.retain_input(cached_response, image)
+                    else:
+                        pending.append((i, image, fingerprint))
+            except Exception as e:
+                logger.error(f"病害检测失败: {e}")
+                responses[i] = self.create_error_response(f"检测失败: {str(e)}")
+                
+        if pending:
+            quality = self.current_quality()
+            try:
+                results = self.classify_batch([image for _, image, _ in pending], quality=quality)
+            except Exception as e:
+                logger.error(f"模型批量分类失败: {e}")
+                results = None
+                
+            for j, (i, image, fingerprint) in enumerate(pending):
+                if results is None:
+                    responses[i] = self.simulate_detection()
+                elif results[j]:
+                    # 降级结果不写入近重复缓存，避免负载回落后仍返回降级结果
+                    if fingerprint is not None and quality['level'] == 0:
+                        self.phash_cache.store(fingerprint, results[j])
+                    responses[i] = self.format_classification_response(results[j], quality)
+                    self.retain_input(responses[i], image)
+                else:
+                    responses[i] = self.create_error_response("未检测到有效的植物病害信息")
+                    
+    def lookup_cached_response(self, image):
+        """按感知哈希查找近重复结果，返回 (图像指纹, 命中时的响应)"""
+        fingerprint = image.info.get('fingerprint') if isinstance(image, Image.Image) else None
+        if fingerprint is None:
+            return None, None
+            
+        cached = self.phash_cache.lookup(fingerprint)
+        if cached is None:
+            return fingerprint, None
+            
+        classifications, distance = cached
+        response = self.format_classification_response(classifications)
+        response['cache'] = {'hit': True, 'hamming_distance': distance}
+        return fingerprint, response
+        
+    def classify_with_model(self, image, fingerprint=None, quality=None):
         """使用模型进行分类"""
+        quality = quality or FULL_QUALITY
         try:
             # 进行预测
-            results = self.model(image, verbose=False)
+            results = self.run_model(image, quality)
             
             if results and len(results) > 0:
-                result = results[0]
-                
-                # 检查是否有分类结果
-                if hasattr(result, 'probs') and result.probs is not None:
-                    # 获取Top-5结果
-                    top5_indices = result.probs.top5
-                    top5_confidences = result.probs.top5conf
-                    
-                    classifications = []
-                    for i, (idx, conf) in enumerate(zip(top5_indices, top5_confidences)):
-                        if idx < len(self.class_names):
-                            class_name = self.class_names[idx]
-                            
-                            # 解析类别信息
-                            crop_type, disease_name = self.parse_class_name(class_name)
-                            
-                            # 获取治疗建议
-                            treatment_info = self.get_treatment_info(class_name)
-                            
-                            classification = {
-                                'rank': i + 1,
-                                'class_name': class_name,
-                                'crop_type': crop_type,
-                                'disease_name': disease_name,
-                                'confidence': float(conf),
-                                'treatment_info': treatment_info
-                            }
-                            classifications.append(classification)
-                    
-                    return self.format_classification_response(classifications)
+                classifications = self.build_classifications(results[0], quality['top_k'])
+                if classifications is not None:
+                    # 降级结果不写入近重复缓存，避免负载回落后仍返回降级结果
+                    if fingerprint is not None and classifications and quality['level'] == 0:
+                        self.phash_cache.store(fingerprint, classifications)
+                        
+                    return self.format_classification_response(classifications, quality)
                     
             # 没有有效结果
             return self.create_error_response("未检测到有效的植物病害信息")
@@ -818,6 +1483,61 @@ class CropDiseaseDetector:
             logger.error(f"模型分类失败: {e}")
             return self.simulate_detection()
             
+    def classify_batch(self, images, quality=None):
+        """批量分类，返回每张图像的Top-5分类列表（无有效结果时为None）"""
+        if not images:
+            return []
+        if not self.model_loaded:
+            return [[self.simulate_classification()] for _ in images]
+            
+        quality = quality or FULL_QUALITY
+        results = self.run_model(list(images), quality)
+        return [self.build_classifications(result, quality['top_k']) for result in results]
+        
+    def run_model(self, source, quality):
+        """按质量级别选择模型与输入尺寸执行推理"""
+        model = self.small_model if quality['small_model'] else self.model
+        options = {'imgsz': quality['imgsz']} if quality['imgsz'] else {}
+        with self.inference_slot():
+            return model(source, verbose=False, **options)
+        
+    def inference_slot(self):
+        """占用一个推理槽位，类别取当前线程所处的优先级上下文"""
+        return self.scheduler.slot() if self.scheduler is not None else nullcontext()
+        
+    def build_classifications(self, result, top_k=5):
+        """将单个模型输出转换为Top-5（降级时为Top-k）分类列表"""
+        # 检查是否有分类结果
+        if not hasattr(result, 'probs') or result.probs is None:
+            return None
+            
+        # 获取Top-5结果
+        top5_indices = result.probs.top5
+        top5_confidences = result.probs.top5conf
+        
+        classifications = []
+        for i, (idx, conf) in enumerate(zip(top5_indices[:top_k], top5_confidences[:top_k])):
+            if idx < len(self.class_names):
+                classifications.append(self.build_classification(i + 1, self.class_names[idx], float(conf)))
+        return classifications
+        
+    def build_classification(self, rank, class_name, confidence):
+        """构建单条分类结果"""
+        # 解析类别信息
+        crop_type, disease_name = self.parse_class_name(class_name)
+        
+        # 获取治疗建议
+        treatment_info = self.get_treatment_info(class_name)
+        
+        return {
+            'rank': rank,
+            'class_name': class_name,
+            'crop_type': crop_type,
+            'disease_name': disease_name,
+            'confidence': confidence,
+            'treatment_info': treatment_info
+        }
+        
     def parse_class_name(self, class_name):
         """解析类别名称"""
         if "___" in class_name:
@@ -843,9 +1563,10 @@ class CropDiseaseDetector:
             "impact": "需要专业评估"
         })
         
-    def format_classification_response(self, classifications):
-        """格式化分类响应"""
+    def format_classification_response(self, classifications, quality=None):
+        """格式化分类响应，quality为服务本次请求的质量级别"""
         primary_result = classifications[0] if classifications else None
+        quality = quality or FULL_QUALITY
         
         return {
             'success': True,
@@ -860,21 +1581,20 @@ class CropDiseaseDetector:
                 'model_type': self.model_type,
                 'model_loaded': self.model_loaded,
                 'total_classes': len(self.class_names)
+            },
+            'quality': {
+                'level': quality['level'],
+                'name': quality['name']
             }
         }
         
     def simulate_detection(self):
         """模拟检测结果"""
-        simulation_result = {
-            'rank': 1,
-            'class_name': 'Tomato___Early_blight',
-            'crop_type': 'Tomato',
-            'disease_name': 'Early blight',
-            'confidence': 0.85,
-            'treatment_info': self.get_treatment_info('Tomato___Early_blight')
-        }
+        return self.format_classification_response([self.simulate_classification()])
         
-        return self.format_classification_response([simulation_result])
+    def simulate_classification(self):
+        """模拟单条分类结果"""
+        return self.build_classification(1, 'Tomato___Early_blight', 0.85)
         
     def create_error_response(self, message):
         """创建错误响应"""
@@ -888,6 +1608,151 @@ class CropDiseaseDetector:
 print("🚀 创建检测器实例...")
 detector = CropDiseaseDetector()
 
+def priority_scope(endpoint):
+    """进入请求所属的优先级类别：请求头指定已配置的类别时以请求头为准，否则按接口默认类别"""
+    if detector.scheduler is None:
+        return nullcontext()
+    name = request.headers.get(PRIORITY_HEADER, '').strip().lower() if has_request_context() else ''
+    if name not in detector.scheduler.classes:
+        name = ENDPOINT_PRIORITY.get(endpoint)
+    return detector.scheduler.priority(name)
+
+# 后台服务（任务线程、相似病例索引、流量采集、预测日志、RPC通道）只在服务进程中启动，
+# 批量评分等命令行工具导入本模块时只创建检测器
+job_queue = None
+job_workers = None
+embedding_index = None
+traffic_recorder = None
+prediction_logger = None
+rpc_server = None
+_services_started = False
+_services_lock = threading.Lock()
+
+def start_background_services():
+    """启动后台服务，重复调用时只启动一次"""
+    global job_queue, job_workers, embedding_index, traffic_recorder, prediction_logger, rpc_server, _services_started
+    with _services_lock:
+        if _services_started:
+            return
+        _services_started = True
+        
+        # 启动异步任务处理线程；启用推理调度时任务每批按bulk类别排队，否则在交互请求在途时于批次之间让行
+        job_queue = JobQueue(JOB_STORAGE_DIR, max_images=JOB_MAX_IMAGES)
+        job_workers = JobWorkerPool(
+            job_queue, detector,
+            workers=JOB_WORKERS,
+            batch_size=JOB_BATCH_SIZE,
+            is_busy=(lambda: interactive_inflight.value > 0) if detector.scheduler is None else None,
+            max_yield_seconds=JOB_MAX_YIELD_SECONDS,
+            priority_scope=lambda: priority_scope('jobs'),
+            on_records=log_job_records
+        )
+        job_workers.start()
+        
+        # 相似病例特征索引；模型更换导致特征维度变化时需指定新的索引目录
+        if EMBEDDING_INDEX_ENABLED and detector.feature_capture is not None:
+            try:
+                embedding_index = EmbeddingIndex(EMBEDDING_INDEX_DIR, dtype=EMBEDDING_INDEX_DTYPE)
+                print(f"✅ 相似病例索引已加载，共 {len(embedding_index)} 条")
+            except Exception as e:
+                print(f"❌ 相似病例索引加载失败: {e}")
+                
+        traffic_recorder = TrafficRecorder(
+            TRAFFIC_CAPTURE_DIR,
+            mode=TRAFFIC_CAPTURE_MODE,
+            segment_bytes=TRAFFIC_CAPTURE_SEGMENT_BYTES,
+            max_segments=TRAFFIC_CAPTURE_MAX_SEGMENTS,
+            sample_rate=TRAFFIC_CAPTURE_SAMPLE_RATE
+        ) if TRAFFIC_CAPTURE_ENABLED else None
+        
+        prediction_logger = PredictionLogger(
+            PREDICTION_LOG_DIR,
+            output_format=PREDICTION_LOG_FORMAT,
+            queue_size=PREDICTION_LOG_QUEUE_SIZE,
+            batch_size=PREDICTION_LOG_BATCH_SIZE,
+            flush_interval=PREDICTION_LOG_FLUSH_SECONDS,
+            rotate_bytes=PREDICTION_LOG_ROTATE_BYTES,
+            rotate_seconds=PREDICTION_LOG_ROTATE_SECONDS,
+            overflow=PREDICTION_LOG_OVERFLOW
+        ) if PREDICTION_LOG_ENABLED else None
+        
+        # 退出时写完队列中剩余的预测记录
+        if prediction_logger is not None:
+            atexit.register(prediction_logger.close)
+            
+        if RPC_ADDRESS:
+            try:
+                rpc_server = DetectionRpcServer(
+                    RPC_ADDRESS, rpc_detect, detector.class_names,
+                    workers=RPC_WORKERS,
+                    max_pipeline=RPC_MAX_PIPELINE,
+                    max_frame_bytes=app.config['MAX_CONTENT_LENGTH']
+                )
+                rpc_server.start()
+                print(f"✅ 二进制RPC通道已启动: {RPC_ADDRESS}")
+            except Exception as e:
+                rpc_server = None
+                print(f"❌ 二进制RPC通道启动失败: {e}")
+
+@app.before_request
+def ensure_background_services():
+    """直接以 app_production:app 部署时，在服务进程处理第一个请求前启动后台服务"""
+    if not _services_started:
+        start_background_services()
+
+def create_app():
+    """WSGI应用工厂（如 gunicorn 'app_production:create_app()'），启动后台服务后返回应用"""
+    start_background_services()
+    return app
+
+def log_prediction(endpoint, result):
+    """将预测结果放入异步日志队列，不在请求线程中写文件"""
+    if prediction_logger is None:
+        return
+    detection = result.get('result') or {}
+    primary = detection.get('primary') or {}
+    prediction_logger.log({
+        'detection_id': result.get('detection_id'),
+        'timestamp': result.get('timestamp'),
+        'endpoint': endpoint,
+        'success': bool(result.get('success')),
+        'error': result.get('error'),
+        'class_name': primary.get('class_name'),
+        'confidence': primary.get('confidence'),
+        'top5': [[item['class_name'], item['confidence']] for item in detection.get('top5', [])],
+        'processing_time': result.get('processing_time'),
+        'model_type': (result.get('model_info') or {}).get('model_type'),
+        'quality': (result.get('quality') or {}).get('name'),
+        'coalesced': bool(result.get('coalesced')),
+        'cache_hit': bool((result.get('cache') or {}).get('hit'))
+    })
+
+def log_job_records(job_id, records):
+    """批量任务的逐图结果写入预测日志，编号为 <任务编号>/<压缩包内路径>"""
+    if prediction_logger is None:
+        return
+    timestamp = datetime.now().isoformat()
+    for record in records:
+        top5 = record.get('top5') or []
+        log_prediction('/jobs', {
+            'detection_id': f"{job_id}/{record['path']}",
+            'timestamp': timestamp,
+            'success': record.get('success'),
+            'error': record.get('error'),
+            'result': {'primary': top5[0] if top5 else None, 'top5': top5},
+            'model_info': {'model_type': detector.model_type}
+        })
+
+def rpc_detect(image_bytes):
+    """二进制RPC通道的检测入口，与 /detect 共用同一检测路径"""
+    start_time = time.time()
+    with interactive_inflight, priority_scope('rpc'):
+        result = detector.detect_disease(image_bytes)
+    result['processing_time'] = round(time.time() - start_time, 3)
+    detector.observe_latency(result['processing_time'])
+    log_prediction('rpc', result)
+    return result
+
 @app.route('/', methods=['GET'])
 def home():
     """主页 - 显示图片上传界面"""
@@ -907,9 +1772,25 @@ def health_check():
         'timestamp': datetime.now().isoformat()
     })
 
+def get_process_rss():
+    """当前进程常驻内存（字节），无法获取时返回None"""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def allowed_file(filename):
+    """检查文件扩展名是否为支持的图像格式"""
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+
 @app.route('/detect', methods=['POST'])
 def detect_disease():
     """病害检测接口"""
+    arrival = time.time()
+    captured = None
     try:
         # 检查请求数据
         if 'image' not in request.files and not request.is_json:
@@ -928,8 +1809,7 @@ def detect_disease():
                 }), 400
                 
             # 检查文件类型
-            allowed_extensions = {'png', 'jpg', 'jpeg', 'gif', 'bmp'}
-            if '.' not in file.filename or file.filename.rsplit('.', 1)[1].lower() not in allowed_extensions:
+            if not allowed_file(file.filename):
                 return jsonify({
                     'success': False,
                     'error': '不支持的文件格式'
@@ -939,9 +1819,10 @@ def detect_disease():
             filename = f"{uuid.uuid4().hex}_{file.filename}"
             filepath = app.config['UPLOAD_FOLDER'] / filename
             file.save(filepath)
-            
-            # 读取图像
-            image = Image.open(filepath)
+            # 读取图像原始字节，检测时按内容摘要合并重复请求
+            image = filepath.read_bytes()
+            if traffic_recorder is not None:
+                captured = ('multipart', image, file.filename)
             
             # 清理临时文件
             try:
@@ -958,6 +1839,8 @@ def detect_disease():
                     'success': False,
                     'error': '未提供图像数据'
                 }), 400
+            if traffic_recorder is not None:
+                captured = ('json', request.get_data(), None)
             image = image_data
         else:
             return jsonify({
@@ -967,12 +1850,21 @@ def detect_disease():
             
         # 执行检测
         start_time = time.time()
-        result = detector.detect_disease(image)
+        with interactive_inflight, priority_scope('/detect'):
+            result = detector.detect_disease(image)
         processing_time = time.time() - start_time
         
         # 添加处理时间
         result['processing_time'] = round(processing_time, 3)
+        detector.observe_latency(processing_time)
+        log_prediction('/detect', result)
         
+        # 记录请求负载与到达时间，供性能回归回放使用
+        if captured is not None:
+            kind, payload, original_name = captured
+            traffic_recorder.capture(arrival, '/detect', kind, payload, filename=original_name,
+                                     status=200, processing_time=result['processing_time'])
+            
         return jsonify(result)
         
     except Exception as e:
@@ -982,6 +1874,444 @@ def detect_disease():
             'error': f'服务器内部错误: {str(e)}'
         }), 500
 
+@app.route('/detect/batch', methods=['POST'])
+def detect_batch():
+    """多图检测接口，支持 ?stream=ndjson 或 ?stream=sse 逐张流式返回"""
+    try:
+        # 收集输入：multipart多文件或JSON中的Base64列表
+        if request.files:
+            files = request.files.getlist('images') or request.files.getlist('image')
+            for file in files:
+                if not allowed_file(file.filename):
+                    return jsonify({
+                        'success': False,
+                        'error': f'不支持的文件格式: {file.filename}'
+                    }), 400
+            # 上传文件会在视图返回后关闭，流式响应前先取出原始字节
+            items = [(file.filename, file.read()) for file in files]
+        elif request.is_json:
+            images = request.get_json().get('images') or []
+            items = [(None, image_data) for image_data in images]
+        else:
+            items = []
+            
+        if not items:
+            return jsonify({
+                'success': False,
+                'error': '未提供图像数据'
+            }), 400
+        if len(items) > DETECT_BATCH_MAX_IMAGES:
+            return jsonify({
+                'success': False,
+                'error': f'单次最多检测 {DETECT_BATCH_MAX_IMAGES} 张图像'
+            }), 400
+            
+        stream_format = request.args.get('stream', '').lower()
+        if stream_format and stream_format not in ('ndjson', 'sse'):
+            return jsonify({
+                'success': False,
+                'error': '不支持的流式格式，可选 ndjson 或 sse'
+            }), 400
+            
+        def generate_results():
+            """逐批推理，每批完成后立即产出该批各图像的结果"""
+            for start in range(0, len(items), DETECT_BATCH_SIZE):
+                chunk = items[start:start + DETECT_BATCH_SIZE]
+                batch_start = time.time()
+                # 批量接口属于bulk类别，不计入交互请求在途数（后台任务不为其让行）
+                with priority_scope('/detect/batch'):
+                    responses = detector.detect_batch([data for _, data in chunk])
+                # 已处理的原始数据立即释放，避免整批请求数据常驻内存
+                for k in range(start, start + len(chunk)):
+                    items[k] = (items[k][0], None)
+                batch_time = round(time.time() - batch_start, 3)
+                for offset, ((filename, _), result) in enumerate(zip(chunk, responses)):
+                    result['index'] = start + offset
+                    result['filename'] = filename
+                    result['processing_time'] = batch_time
+                    log_prediction('/detect/batch', result)
+                    yield result
+                    
+        start_time = time.time()
+        if not stream_format:
+            results = list(generate_results())
+            return jsonify({
+                'success': True,
+                'total': len(results),
+                'results': results,
+                'processing_time': round(time.time() - start_time, 3)
+            })
+            
+        def stream():
+            count = 0
+            for result in generate_results():
+                count += 1
+                payload = json.dumps(result, ensure_ascii=False)
+                yield f"event: result\ndata: {payload}\n\n" if stream_format == 'sse' else payload + "\n"
+            summary = json.dumps({
+                'done': True,
+                'total': count,
+                'processing_time': round(time.time() - start_time, 3)
+            })
+            yield f"event: done\ndata: {summary}\n\n" if stream_format == 'sse' else summary + "\n"
+            
+        return Response(
+            stream_with_context(stream()),
+            mimetype='text/event-stream' if stream_format == 'sse' else 'application/x-ndjson',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
+        
+    except Exception as e:
+        logger.error(f"多图检测接口错误: {e}")
+        return jsonify({
+            'success': False,
+            'error': f'服务器内部错误: {str(e)}'
+        }), 500
+
+@app.route('/detect/video', methods=['POST'])
+def detect_video():
+    """视频 / 帧序列检测接口"""
+    video_path = None
+    try:
+        # 视频远大于单图上限，单独放宽本请求的大小限制
+        request.max_content_length = VIDEO_MAX_UPLOAD_BYTES
+        
+        sample_fps = float(request.form.get('sample_fps', VIDEO_SAMPLE_FPS))
+        frame_interval = float(request.form.get('frame_interval', 1.0))
+        
+        # 视频文件需落盘后由OpenCV流式解码
+        if 'video' in request.files:
+            file = request.files['video']
+            allowed_extensions = {'mp4', 'avi', 'mov', 'mkv', 'webm'}
+            if '.' not in file.filename or file.filename.rsplit('.', 1)[1].lower() not in allowed_extensions:
+                return jsonify({
+                    'success': False,
+                    'error': '不支持的视频格式'
+                }), 400
+            video_path = app.config['UPLOAD_FOLDER'] / f"{uuid.uuid4().hex}_{file.filename}"
+            file.save(video_path)
+            source_frames = video_frame_count(video_path)
+            frames = iter_video_frames(video_path, sample_fps=sample_fps, load_image=detector.load_image)
+        elif request.files.getlist('frames'):
+            source_frames = len(request.files.getlist('frames'))
+            frames = iter_sequence_frames(request.files.getlist('frames'), frame_interval=frame_interval,
+                                          load_image=detector.load_image)
+        else:
+            return jsonify({
+                'success': False,
+                'error': '未提供视频或帧序列'
+            }), 400
+            
+        start_time = time.time()
+        with priority_scope('/detect/video'):
+            segments, stats = detect_frame_stream(
+                detector, frames,
+                batch_size=VIDEO_BATCH_SIZE,
+                dedup_distance=VIDEO_DEDUP_DISTANCE,
+                segment_seconds=float(request.form.get('segment_seconds', VIDEO_SEGMENT_SECONDS)),
+                smoothing=VIDEO_SMOOTHING,
+                max_frames=VIDEO_MAX_FRAMES
+            )
+        processing_time = time.time() - start_time
+        # 已处理的抽样帧数与源帧总数，达到 VIDEO_MAX_FRAMES 时 truncated 为 true
+        stats['frames_processed'] = stats['frames_sampled']
+        stats['source_frames_total'] = source_frames
+        
+        result = {
+            'success': True,
+            'detection_id': str(uuid.uuid4()),
+            'timestamp': datetime.now().isoformat(),
+            'segments': [{
+                'start_frame': segment['start_frame'],
+                'end_frame': segment['end_frame'],
+                'start_time': round(segment['start_time'], 3),
+                'end_time': round(segment['end_time'], 3),
+                'frames': segment['frames'],
+                'primary': detector.build_classification(1, segment['class_name'], round(segment['confidence'], 4))
+            } for segment in segments],
+            'frame_stats': stats,
+            'model_info': {
+                'model_type': detector.model_type,
+                'model_loaded': detector.model_loaded,
+                'total_classes': len(detector.class_names)
+            },
+            'processing_time': round(processing_time, 3)
+        }
+        
+        # 每个分段记录一条预测，编号为 <检测编号>#<分段序号>
+        for index, segment in enumerate(result['segments']):
+            log_prediction('/detect/video', dict(
+                result,
+                detection_id=f"{result['detection_id']}#{index}",
+                result={'primary': segment['primary'], 'top5': [segment['primary']]}
+            ))
+        return jsonify(result)
+        
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except MemoryBudgetExceeded as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 503
+    except Exception as e:
+        logger.error(f"视频检测接口错误: {e}")
+        return jsonify({
+            'success': False,
+            'error': f'服务器内部错误: {str(e)}'
+        }), 500
+    finally:
+        if video_path is not None:
+            try:
+                os.remove(video_path)
+            except OSError:
+                pass
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    """提交批量检测任务（ZIP压缩包）"""
+    try:
+        # 压缩包通常远大于单图上限，单独放宽本请求的大小限制
+        request.max_content_length = JOB_MAX_UPLOAD_BYTES
+        
+        if 'archive' not in request.files:
+            return jsonify({
+                'success': False,
+                'error': '未提供压缩包'
+            }), 400
+            
+        file = request.files['archive']
+        if not file.filename.lower().endswith('.zip'):
+            return jsonify({
+                'success': False,
+                'error': '仅支持ZIP压缩包'
+            }), 400
+            
+        job = job_queue.submit(file)
+        return jsonify({
+            'success': True,
+            'job': job,
+            'status_url': f"/jobs/{job['id']}",
+            'results_url': f"/jobs/{job['id']}/results",
+            'timestamp': datetime.now().isoformat()
+        }), 202
+        
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        logger.error(f"任务提交错误: {e}")
+        return jsonify({
+            'success': False,
+            'error': f'服务器内部错误: {str(e)}'
+        }), 500
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """查询批量检测任务状态"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({
+            'success': False,
+            'error': '任务不存在'
+        }), 404
+        
+    return jsonify({
+        'success': True,
+        'job': job,
+        'progress': round(job['processed'] / job['total'], 4) if job['total'] else 0.0,
+        'timestamp': datetime.now().isoformat()
+    })
+
+@app.route('/jobs/<job_id>/results', methods=['GET'])
+def get_job_results(job_id):
+    """获取批量检测任务结果（JSONL）"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({
+            'success': False,
+            'error': '任务不存在'
+        }), 404
+    if job['status'] != 'completed':
+        return jsonify({
+            'success': False,
+            'error': f"任务尚未完成，当前状态: {job['status']}"
+        }), 409
+        
+    return send_file(
+        job_queue.result_path(job_id).resolve(),
+        mimetype='application/x-ndjson',
+        as_attachment=True,
+        download_name=f"{job_id}.jsonl"
+    )
+
+def explanation_payload(status):
+    """解释状态附带查询与热力图地址"""
+    detection_id = status['detection_id']
+    return dict(status, status_url=f"/explain/{detection_id}", heatmap_url=f"/explain/{detection_id}/heatmap.png")
+
+@app.route('/explain/<detection_id>', methods=['POST'])
+def request_explanation(detection_id):
+    """请求计算检测结果的显著性图，计算在后台低优先级线程中进行"""
+    if detector.explanations is None:
+        return jsonify({
+            'success': False,
+            'error': '当前模型不支持显著性图解释'
+        }), 501
+        
+    status = detector.explanations.request(detection_id)
+    if status is None:
+        return jsonify({
+            'success': False,
+            'error': '检测记录不存在或模型输入已被淘汰，请重新检测'
+        }), 404
+    if status['status'] == 'rejected':
+        return jsonify({
+            'success': False,
+            'error': '解释队列已满，请稍后重试'
+        }), 503
+        
+    return jsonify({
+        'success': True,
+        'explanation': explanation_payload(status),
+        'timestamp': datetime.now().isoformat()
+    }), 200 if status['status'] == 'done' else 202
+
+@app.route('/explain/<detection_id>', methods=['GET'])
+def get_explanation(detection_id):
+    """查询显著性图计算状态"""
+    if detector.explanations is None:
+        return jsonify({
+            'success': False,
+            'error': '当前模型不支持显著性图解释'
+        }), 501
+        
+    status = detector.explanations.status(detection_id)
+    if status is None:
+        return jsonify({
+            'success': False,
+            'error': '检测记录不存在'
+        }), 404
+        
+    return jsonify({
+        'success': True,
+        'explanation': explanation_payload(status),
+        'timestamp': datetime.now().isoformat()
+    })
+
+@app.route('/explain/<detection_id>/heatmap.png', methods=['GET'])
+def get_explanation_heatmap(detection_id):
+    """获取渲染好的显著性热力图（叠加在模型输入图像上的PNG）"""
+    if detector.explanations is None:
+        return jsonify({
+            'success': False,
+            'error': '当前模型不支持显著性图解释'
+        }), 501
+        
+    png = detector.explanations.heatmap(detection_id)
+    if png is not None:
+        return Response(png, mimetype='image/png', headers={'Cache-Control': 'private, max-age=3600'})
+        
+    status = detector.explanations.status(detection_id)
+    if status is None:
+        return jsonify({
+            'success': False,
+            'error': '检测记录不存在'
+        }), 404
+    return jsonify({
+        'success': False,
+        'error': f"热力图尚未生成，当前状态: {status['status']}",
+        'explanation': explanation_payload(status)
+    }), 409
+
+@app.route('/embed', methods=['POST'])
+def embed_image():
+    """提取图像特征并检索相似病例；store=1 时将本次病例写入索引"""
+    try:
+        if 'image' in request.files:
+            file = request.files['image']
+            if file.filename == '' or not allowed_file(file.filename):
+                return jsonify({
+                    'success': False,
+                    'error': '不支持的文件格式'
+                }), 400
+            image_data = file.read()
+            options = request.form
+            metadata = json.loads(options.get('metadata') or '{}')
+        elif request.is_json:
+            options = request.get_json()
+            image_data = options.get('image_data')
+            metadata = options.get('metadata') or {}
+        else:
+            image_data = None
+            
+        if not image_data:
+            return jsonify({
+                'success': False,
+                'error': '未提供图像数据'
+            }), 400
+        if not isinstance(metadata, dict):
+            return jsonify({
+                'success': False,
+                'error': 'metadata 必须为JSON对象'
+            }), 400
+            
+        flag = lambda name, default: str(request.args.get(name, options.get(name, default))).lower() in ('1', 'true', 'yes')
+        top_k = min(max(int(request.args.get('top_k', options.get('top_k', EMBEDDING_TOP_K))), 0), EMBEDDING_MAX_TOP_K)
+        
+        start_time = time.time()
+        with interactive_inflight, priority_scope('/embed'):
+            result, embedding = detector.extract_embedding(image_data)
+        if embedding is None:
+            return jsonify(result)
+            
+        result['embedding'] = {
+            'dim': int(embedding.shape[0]),
+            'vector': [round(float(value), 6) for value in embedding] if flag('include_embedding', '1') else None
+        }
+        
+        if embedding_index is not None:
+            search_start = time.time()
+            neighbors = embedding_index.search(embedding, k=top_k)[0]
+            records = embedding_index.get_metadata([case_id for case_id, _ in neighbors])
+            result['similar_cases'] = [dict(record, similarity=round(score, 4))
+                                       for record, (_, score) in zip(records, neighbors)]
+            result['search_time'] = round(time.time() - search_start, 4)
+            
+            # 检索后再写入，避免检索到本次病例自身
+            # 写入需显式指定 store=1，避免检索请求无意间不断扩大索引
+            if flag('store', '0'):
+                primary = result['result']['primary'] or {}
+                case = dict(metadata,
+                            detection_id=result['detection_id'],
+                            timestamp=result['timestamp'],
+                            class_name=primary.get('class_name'),
+                            confidence=primary.get('confidence'))
+                result['case_id'] = embedding_index.add(embedding, [case])[0]
+        else:
+            result['similar_cases'] = None
+            
+        result['processing_time'] = round(time.time() - start_time, 3)
+        log_prediction('/embed', result)
+        return jsonify(result)
+        
+    except (ValueError, json.JSONDecodeError) as e:
+        return jsonify({
+            'success': False,
+            'error': f'参数错误: {str(e)}'
+        }), 400
+    except Exception as e:
+        logger.error(f"特征提取接口错误: {e}")
+        return jsonify({
+            'success': False,
+            'error': f'服务器内部错误: {str(e)}'
+        }), 500
+
 @app.route('/classes', methods=['GET'])
 def get_classes():
     """获取支持的类别列表"""
@@ -992,6 +2322,33 @@ def get_classes():
         'timestamp': datetime.now().isoformat()
     })
 
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """获取服务运行指标"""
+    return jsonify({
+        'success': True,
+        'phash_cache': detector.phash_cache.stats() if detector.phash_cache is not None else None,
+        'jobs': job_workers.stats(),
+        'interactive_inflight': interactive_inflight.value,
+        'memory': detector.memory_budget.stats(),
+        'explanations': detector.explanations.stats() if detector.explanations is not None else None,
+        'degradation': detector.slo_controller.stats() if detector.slo_controller is not None else None,
+        'scheduler': detector.scheduler.stats() if detector.scheduler is not None else None,
+        'input_buffers': detector.buffer_pool.stats() if detector.buffer_pool is not None else None,
+        'coalescing': detector.single_flight.stats() if detector.single_flight is not None else None,
+        'routing': detector.model.stats() if detector.routing_enabled else None,
+        'embedding_index': embedding_index.stats() if embedding_index is not None else None,
+        'traffic_capture': traffic_recorder.stats() if traffic_recorder is not None else None,
+        'rpc': rpc_server.stats() if rpc_server is not None else None,
+        'prediction_log': prediction_logger.stats() if prediction_logger is not None else None,
+        'process': {
+            'pid': os.getpid(),
+            'rss_bytes': get_process_rss(),
+            'gc_collections': [generation['collections'] for generation in gc.get_stats()]
+        },
+        'timestamp': datetime.now().isoformat()
+    })
+
 @app.route('/model/info', methods=['GET'])
 def get_model_info():
     """获取模型信息"""
@@ -1002,12 +2359,23 @@ def get_model_info():
             'model_type': detector.model_type,
             'num_classes': len(detector.class_names),
             'architecture': 'YOLOv8 Classification',
-            'training_status': 'Custom trained on crop disease dataset' if detector.model_type == 'custom_trained' else 'Pretrained model'
+            'training_status': 'Custom trained on crop disease dataset' if detector.model_type == 'custom_trained' else 'Pretrained model',
+            'inference_backend': detector.inference_backend,
+            'backend_selection': detector.backend_report,
+            'compiled': detector.compile_info,
+            'snapshot': detector.snapshot_info,
+            'crop_routing': detector.routing_enabled,
+            'quality_levels': detector.quality_levels
         },
         'capabilities': {
             'classification': True,
             'detection': False,
-            'batch_processing': False
+            'batch_processing': True,
+            'video_processing': True,
+            'streaming_results': True,
+            'embeddings': detector.feature_capture is not None,
+            'adaptive_degradation': detector.slo_controller is not None,
+            'explanations': detector.explanations is not None
         },
         'timestamp': datetime.now().isoformat()
     })
@@ -1020,6 +2388,7 @@ if __name__ == '__main__':
     print(f"🎯 支持类别: {len(detector.class_names)} 个")
     print(f"📊 训练模型: {'✅ 是' if detector.model_type == 'custom_trained' else '❌ 否'}")
     print("🚀 服务启动中...")
+    start_background_services()
     
     try:
         app.run(
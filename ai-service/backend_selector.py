@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+推理后端自动选择
+启动时在本机对原始权重及其导出产物（TorchScript / ONNX Runtime / OpenVINO）逐一测速，
+校验输出与原始模型一致后选用配置批大小下最快的后端
+"""
+
+import time
+import logging
+import importlib.util
+from pathlib import Path
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# (后端名称, 导出格式, 产物后缀, 所需运行时模块)
+EXPORT_BACKENDS = [
+    ('torchscript', 'torchscript', '.torchscript', 'torch'),
+    ('onnxruntime', 'onnx', '.onnx', 'onnxruntime'),
+    ('openvino', 'openvino', '_openvino_model', 'openvino')
+]
+
+
+def runtime_available(module_name):
+    return importlib.util.find_spec(module_name) is not None
+
+
+def artifact_path(model_path, suffix):
+    model_path = Path(model_path)
+    return model_path.parent / f"{model_path.stem}{suffix}"
+
+
+def make_benchmark_images(count, size=224, seed=0):
+    """生成测速用的合成图像（低频色块叠加噪声，接近叶片照片的统计特征）"""
+    rng = np.random.default_rng(seed)
+    images = []
+    for _ in range(count):
+        base = rng.integers(0, 255, (8, 8, 3), dtype=np.uint8).repeat(size // 8, axis=0).repeat(size // 8, axis=1)
+        noise = rng.integers(-20, 20, base.shape)
+        images.append(np.clip(base.astype(np.int16) + noise, 0, 255).astype(np.uint8))
+    return images
+
+
+def probabilities(results):
+    """提取每张图像的完整类别概率"""
+    rows = []
+    for result in results:
+        data = result.probs.data
+        data = data.cpu().numpy() if hasattr(data, 'cpu') else np.asarray(data)
+        rows.append(data.astype(np.float32))
+    return np.stack(rows)
+
+
+def time_backend(model, images, batch_size, warmup=2, iterations=10):
+    """按批测速，返回 (每批耗时列表（秒）, 首批输出概率)"""
+    batch = images[:batch_size]
+    outputs = probabilities(model(batch, verbose=False))
+    for _ in range(warmup):
+        model(batch, verbose=False)
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        model(batch, verbose=False)
+        timings.append(time.perf_counter() - start)
+    return timings, outputs
+
+
+def prepare_artifact(model, model_path, export_format, suffix, export_missing, loader):
+    """返回可用的导出产物路径；产物缺失或早于权重文件时按需重新导出"""
+    path = artifact_path(model_path, suffix)
+    stale = path.exists() and path.stat().st_mtime < Path(model_path).stat().st_mtime
+    if path.exists() and not stale:
+        return path, None
+    if not export_missing:
+        return None, '导出产物已过期' if stale else '未找到导出产物'
+    # 直接调用网络的模型（如预融合快照）没有导出接口，此时从原始权重导出
+    exporter = model if hasattr(model, 'export') else loader(str(model_path))
+    exported = exporter.export(format=export_format, dynamic=export_format != 'torchscript', verbose=False)
+    return Path(exported), None
+
+
+def select_fastest_backend(model, model_path, loader, batch_size=8, tolerance=1e-3,
+                           export_missing=False, warmup=2, iterations=10, extra_candidates=()):
+    """
+    对原始模型与各导出产物测速，返回 (选中的模型, 测速报告)。
+    extra_candidates为已构建好的其他后端 [(名称, 模型)]；
+    输出概率与原始模型最大差异超过tolerance或Top-1不一致的后端不参与选择
+    """
+    images = make_benchmark_images(batch_size)
+    candidates = []
+
+    timings, reference = time_backend(model, images, batch_size, warmup, iterations)
+    candidates.append(({'backend': 'torch', 'artifact': str(model_path)}, model, timings, reference))
+
+    for backend, candidate in extra_candidates:
+        try:
+            timings, outputs = time_backend(candidate, images, batch_size, warmup, iterations)
+            candidates.append(({'backend': backend, 'artifact': None}, candidate, timings, outputs))
+        except Exception as e:
+            logger.warning(f"后端 {backend} 测速失败: {e}")
+            candidates.append(({'backend': backend, 'artifact': None, 'error': str(e)}, None, None, None))
+
+    for backend, export_format, suffix, runtime in EXPORT_BACKENDS:
+        entry = {'backend': backend, 'artifact': None}
+        if not runtime_available(runtime):
+            candidates.append((dict(entry, error=f"未安装 {runtime}"), None, None, None))
+            continue
+        try:
+            path, reason = prepare_artifact(model, model_path, export_format, suffix, export_missing, loader)
+            if path is None:
+                candidates.append((dict(entry, error=reason), None, None, None))
+                continue
+            entry['artifact'] = str(path)
+            candidate = loader(str(path))
+            timings, outputs = time_backend(candidate, images, batch_size, warmup, iterations)
+            candidates.append((entry, candidate, timings, outputs))
+        except Exception as e:
+            logger.warning(f"后端 {backend} 测速失败: {e}")
+            candidates.append((dict(entry, error=str(e)), None, None, None))
+
+    report = []
+    best = None
+    for entry, candidate, timings, outputs in candidates:
+        if timings is None:
+            report.append(dict(entry, agrees=False))
+            continue
+        max_diff = float(np.abs(outputs - reference).max())
+        top1_agreement = float((outputs.argmax(axis=1) == reference.argmax(axis=1)).mean())
+        median = float(np.median(timings))
+        entry.update({
+            'median_ms': round(median * 1000, 2),
+            'p90_ms': round(float(np.percentile(timings, 90)) * 1000, 2),
+            'images_per_second': round(batch_size / median, 1) if median > 0 else None,
+            'max_abs_diff': round(max_diff, 6),
+            'top1_agreement': top1_agreement,
+            'agrees': max_diff <= tolerance and top1_agreement == 1.0
+        })
+        report.append(entry)
+        if entry['agrees'] and (best is None or median < best[1]):
+            best = (entry['backend'], median, candidate)
+
+    selected, _, chosen = best
+    return chosen, {
+        'selected': selected,
+        'batch_size': batch_size,
+        'tolerance': tolerance,
+        'iterations': iterations,
+        'candidates': report
+    }
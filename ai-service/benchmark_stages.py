@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+推理链路分阶段微基准
+在固定输入和多种图像尺寸下分别计时预处理、模型分类、类别解析、治疗建议查询、响应格式化与JSON编码，
+结果可保存为基线，并与新结果对比以发现性能回退
+"""
+
+import sys
+import json
+import time
+import base64
+import platform
+import argparse
+from datetime import datetime
+from pathlib import Path
+
+DEFAULT_SIZES = '224x224,640x480,1920x1080,4000x3000'
+
+
+def measure(func, repeat, warmup):
+    """重复执行并返回耗时统计（毫秒）"""
+    for _ in range(warmup):
+        func()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        func()
+        timings.append((time.perf_counter_ns() - start) / 1e6)
+    timings.sort()
+    return {
+        'runs': repeat,
+        'median_ms': round(timings[len(timings) // 2], 4),
+        'p95_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 4),
+        'mean_ms': round(sum(timings) / len(timings), 4),
+        'min_ms': round(timings[0], 4)
+    }
+
+
+def run_benchmarks(args):
+    """执行全部阶段基准"""
+    sys.path.insert(0, str(Path(__file__).parent))
+    from app_production import app, detector
+    from load_test import make_synthetic_images
+    from flask import jsonify
+
+    sizes = [tuple(int(v) for v in size.split('x')) for size in args.sizes.split(',')]
+    stages = {}
+
+    def record(name, func, repeat=None):
+        stages[name] = measure(func, repeat or args.repeat, args.warmup)
+        print(f"  {name:<48} 中位数 {stages[name]['median_ms']:>10.4f} ms  p95 {stages[name]['p95_ms']:>10.4f} ms")
+
+    print("⏱️ 开始分阶段基准测试...")
+    sample_response = None
+    for (width, height), (_, jpeg_bytes) in zip(sizes, make_synthetic_images(sizes, 1, seed=args.seed)):
+        label = f"{width}x{height}"
+        encoded = base64.b64encode(jpeg_bytes).decode('ascii')
+
+        record(f"preprocess_image[bytes,{label}]", lambda: detector.preprocess_image(jpeg_bytes))
+        record(f"preprocess_image[base64,{label}]", lambda: detector.preprocess_image(encoded))
+
+        image = detector.preprocess_image(jpeg_bytes)
+        if detector.model_loaded:
+            record(f"classify_with_model[{label}]", lambda: detector.classify_with_model(image),
+                   repeat=args.model_repeat)
+        if sample_response is None:
+            sample_response = detector.classify_with_model(image) if detector.model_loaded \
+                else detector.simulate_detection()
+
+    classifications = sample_response['result']['top5'] if sample_response.get('success') \
+        else [detector.simulate_classification()]
+    class_names = detector.class_names
+
+    record("parse_class_name[all_classes]", lambda: [detector.parse_class_name(name) for name in class_names])
+    record("get_treatment_info[all_classes]", lambda: [detector.get_treatment_info(name) for name in class_names])
+    record("format_classification_response[top5]", lambda: detector.format_classification_response(classifications))
+
+    response = detector.format_classification_response(classifications)
+    record("json.dumps[response]", lambda: json.dumps(response, ensure_ascii=False))
+    with app.app_context():
+        record("flask.jsonify[response]", lambda: jsonify(response).get_data())
+
+    return {
+        'meta': {
+            'label': args.label,
+            'timestamp': datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+            'model_type': detector.model_type,
+            'model_loaded': detector.model_loaded,
+            'repeat': args.repeat,
+            'model_repeat': args.model_repeat,
+            'sizes': args.sizes
+        },
+        'stages': stages
+    }
+
+
+def compare(baseline, current, tolerance, min_delta_ms):
+    """对比两次结果，返回回退的阶段列表"""
+    regressions = []
+    print(f"\n📊 对比基线 {baseline['meta'].get('label') or baseline['meta']['timestamp']} "
+          f"(容差 {tolerance:.0%}，最小绝对差 {min_delta_ms} ms)")
+    for name, result in current['stages'].items():
+        base = baseline['stages'].get(name)
+        if base is None:
+            print(f"  🆕 {name:<48} {result['median_ms']:.4f} ms（基线中不存在）")
+            continue
+        old, new = base['median_ms'], result['median_ms']
+        change = (new - old) / old if old > 0 else 0.0
+        regressed = new - old > min_delta_ms and change > tolerance
+        marker = "❌" if regressed else ("✅" if change < -tolerance else "  ")
+        print(f"  {marker} {name:<48} {old:>10.4f} -> {new:>10.4f} ms ({change:+.1%})")
+        if regressed:
+            regressions.append({'stage': name, 'baseline_ms': old, 'current_ms': new, 'change': round(change, 4)})
+    for name in baseline['stages']:
+        if name not in current['stages']:
+            print(f"  ⚠️ {name:<48} 本次未测量")
+    return regressions
+
+
+def main():
+    """基准测试主流程"""
+    parser = argparse.ArgumentParser(description='推理链路分阶段微基准')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help='运行基准测试')
+    run_parser.add_argument('--output', type=str, default='stage_benchmark.json', help='结果JSON路径')
+    run_parser.add_argument('--sizes', type=str, default=DEFAULT_SIZES, help='图像尺寸列表')
+    run_parser.add_argument('--repeat', type=int, default=200, help='轻量阶段的重复次数')
+    run_parser.add_argument('--model-repeat', type=int, default=30, help='模型推理阶段的重复次数')
+    run_parser.add_argument('--warmup', type=int, default=5, help='预热次数')
+    run_parser.add_argument('--seed', type=int, default=42, help='合成图像随机种子')
+    run_parser.add_argument('--label', type=str, default=None, help='结果标签（如提交号）')
+    run_parser.add_argument('--baseline', type=str, default=None, help='运行后直接与该基线对比')
+    run_parser.add_argument('--tolerance', type=float, default=0.10, help='允许的相对回退比例')
+    run_parser.add_argument('--min-delta-ms', type=float, default=0.05, help='低于该绝对差不视为回退')
+
+    compare_parser = subparsers.add_parser('compare', help='对比两次结果')
+    compare_parser.add_argument('baseline', type=str, help='基线JSON')
+    compare_parser.add_argument('current', type=str, help='当前结果JSON')
+    compare_parser.add_argument('--tolerance', type=float, default=0.10, help='允许的相对回退比例')
+    compare_parser.add_argument('--min-delta-ms', type=float, default=0.05, help='低于该绝对差不视为回退')
+
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        current = run_benchmarks(args)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(current, f, ensure_ascii=False, indent=2)
+        print(f"💾 基准结果已保存: {args.output}")
+        if not args.baseline:
+            return
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+    else:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        with open(args.current, 'r', encoding='utf-8') as f:
+            current = json.load(f)
+
+    regressions = compare(baseline, current, args.tolerance, args.min_delta_ms)
+    if regressions:
+        print(f"\n❌ {len(regressions)} 个阶段超出容差")
+        sys.exit(1)
+    print("\n✅ 未发现性能回退")
+
+
+if __name__ == "__main__":
+    main()
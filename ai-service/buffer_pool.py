@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+推理输入缓冲池
+按批大小分档预分配NCHW浮点缓冲，预处理直接写入缓冲，请求之间复用；
+池内缓冲总数有上限，耗尽时临时分配一次性缓冲，不阻塞推理
+"""
+
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+
+def batch_bucket(batch_size, max_batch):
+    """批大小向上取到2的幂作为分档，超过max_batch时返回None"""
+    if batch_size > max_batch:
+        return None
+    bucket = 1
+    while bucket < batch_size:
+        bucket *= 2
+    return min(bucket, max_batch)
+
+
+class InputBufferPool:
+    def __init__(self, imgsz, max_batch=8, max_buffers=4, dtype=np.float32):
+        """
+        imgsz为模型输入尺寸，max_batch为可复用的最大批大小，max_buffers为池内缓冲总数上限。
+        缓冲按需创建，首次使用某一分档时分配，归还后留在池中供后续请求复用
+        """
+        self.imgsz = imgsz
+        self.max_batch = max_batch
+        self.max_buffers = max_buffers
+        self.dtype = np.dtype(dtype)
+
+        self._lock = threading.Lock()
+        self._free = {}
+        self._created = 0
+
+        self.acquired = 0
+        self.reused = 0
+        self.allocations = 0
+        self.overflow_allocations = 0
+        self.in_use = 0
+        self.peak_in_use = 0
+
+    def _buffer_bytes(self, bucket):
+        return bucket * 3 * self.imgsz * self.imgsz * self.dtype.itemsize
+
+    def _allocate(self, bucket):
+        return np.empty((bucket, 3, self.imgsz, self.imgsz), dtype=self.dtype)
+
+    @contextmanager
+    def acquire(self, batch_size, imgsz=None):
+        """
+        借出一个可容纳batch_size张图像的缓冲，返回形状为 (batch_size, 3, imgsz, imgsz) 的视图；
+        imgsz小于池的输入尺寸时（如降级缩小输入）复用同一块内存的前部
+        """
+        imgsz = imgsz or self.imgsz
+        bucket = batch_bucket(batch_size, self.max_batch) if imgsz <= self.imgsz else None
+        buffer = None
+        pooled = False
+        with self._lock:
+            self.acquired += 1
+            self.in_use += 1
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+            if bucket is not None:
+                # 优先使用同档缓冲，其次借用更大分档中最小的空闲缓冲
+                for size in sorted(size for size, free in self._free.items() if size >= bucket and free):
+                    buffer = self._free[size].pop()
+                    bucket = size
+                    pooled = True
+                    self.reused += 1
+                    break
+                if buffer is None and self._created < self.max_buffers:
+                    self._created += 1
+                    pooled = True
+                    self.allocations += 1
+            if not pooled:
+                self.overflow_allocations += 1
+
+        if buffer is None:
+            buffer = self._allocate(bucket) if pooled else np.empty((batch_size, 3, imgsz, imgsz), dtype=self.dtype)
+        try:
+            yield buffer.reshape(-1)[:batch_size * 3 * imgsz * imgsz].reshape(batch_size, 3, imgsz, imgsz)
+        finally:
+            with self._lock:
+                self.in_use -= 1
+                if pooled:
+                    self._free.setdefault(bucket, []).append(buffer)
+
+    def stats(self):
+        """缓冲池统计信息；reuse_rate越高说明每次请求新分配的输入内存越少"""
+        with self._lock:
+            pooled_bytes = sum(self._buffer_bytes(bucket) * len(buffers) for bucket, buffers in self._free.items())
+            idle = {str(bucket): len(buffers) for bucket, buffers in sorted(self._free.items())}
+            created = self._created
+        return {
+            'imgsz': self.imgsz,
+            'max_batch': self.max_batch,
+            'max_buffers': self.max_buffers,
+            'buffers': created,
+            'idle_by_batch': idle,
+            'idle_bytes': pooled_bytes,
+            'in_use': self.in_use,
+            'peak_in_use': self.peak_in_use,
+            'acquired': self.acquired,
+            'reused': self.reused,
+            'allocations': self.allocations,
+            'overflow_allocations': self.overflow_allocations,
+            'reuse_rate': round(self.reused / self.acquired, 4) if self.acquired else 0.0
+        }
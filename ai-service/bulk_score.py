@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+离线批量评分工具
+基于CropDiseaseDetector遍历图像目录，多进程解码、批量推理，结果流式写入JSONL或Parquet，
+支持断点续跑
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from PIL import Image
+
+from memory_budget import limit_decode_size
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.gif', '.webp'}
+
+
+def walk_images(root, extensions=IMAGE_EXTENSIONS, after=None):
+    """按路径分段字典序遍历图像，产出相对路径分段元组；after用于断点续跑时跳过已处理部分"""
+    def walk(directory, prefix):
+        try:
+            entries = sorted(os.scandir(directory), key=lambda entry: entry.name)
+        except OSError as e:
+            print(f"⚠️ 无法读取目录 {directory}: {e}")
+            return
+        for entry in entries:
+            parts = prefix + (entry.name,)
+            # 整个子树都已处理过时直接跳过
+            if after is not None and parts < after[:len(parts)]:
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                yield from walk(entry.path, parts)
+            elif os.path.splitext(entry.name)[1].lower() in extensions:
+                if after is None or parts > after:
+                    yield parts
+
+    yield from walk(root, ())
+
+
+def decode_chunk(root, chunk, max_side, max_pixels=24 * 1000 * 1000):
+    """
+    子进程中解码一组图像，缩放到max_side以内以减少进程间传输。
+    每个子进程一次只解码一张图像，解码前按max_pixels限制尺寸即可约束单进程内存
+    """
+    decoded = []
+    for parts in chunk:
+        path = os.path.join(root, *parts)
+        try:
+            with Image.open(path) as image:
+                # 超出像素上限且无法在DCT域降采样的图像直接拒绝，不做完整解码
+                limit_decode_size(image, max_pixels)
+                # JPEG可直接在DCT域降采样解码
+                image.draft('RGB', (max_side, max_side))
+                image = image.convert('RGB')
+                image.thumbnail((max_side, max_side))
+                decoded.append((parts, image, None))
+        except Exception as e:
+            decoded.append((parts, None, str(e)))
+    return decoded
+
+
+def iter_chunks(iterable, size):
+    """按固定大小分组"""
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class JsonlSink:
+    def __init__(self, path, offset):
+        """JSONL输出，续跑时截断到检查点记录的偏移"""
+        self.path = Path(path)
+        self.file = open(self.path, 'a+b')
+        self.file.truncate(offset)
+        self.file.seek(offset)
+
+    def write(self, records):
+        self.file.write(''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in records).encode('utf-8'))
+
+    def commit(self):
+        """刷盘并返回可写入检查点的状态"""
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        return {'output_offset': self.file.tell()}
+
+    def finish(self):
+        committed = self.commit()
+        self.file.close()
+        return committed
+
+
+class ParquetSink:
+    def __init__(self, path, part_index, rows_per_part):
+        """Parquet输出，按分片文件滚动写入，分片关闭后才计入检查点"""
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            print("❌ 输出Parquet需要安装pyarrow: pip install pyarrow")
+            sys.exit(1)
+        self.pa = pa
+        self.pq = pq
+        self.directory = Path(path)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.part_index = part_index
+        self.rows_per_part = rows_per_part
+        self.rows = []
+        self.schema = pa.schema([
+            ('path', pa.string()),
+            ('success', pa.bool_()),
+            ('error', pa.string()),
+            ('class_name', pa.string()),
+            ('crop_type', pa.string()),
+            ('disease_name', pa.string()),
+            ('confidence', pa.float64()),
+            ('top5', pa.string())
+        ])
+
+        # 清理上次中断遗留的未完成分片
+        for stale in self.directory.glob("*.parquet.tmp"):
+            stale.unlink()
+
+    def write(self, records):
+        for record in records:
+            record = dict(record)
+            record['top5'] = json.dumps(record.get('top5', []), ensure_ascii=False)
+            self.rows.append(record)
+
+    def _flush_part(self):
+        if not self.rows:
+            return
+        table = self.pa.Table.from_pylist(self.rows, schema=self.schema)
+        final_path = self.directory / f"part-{self.part_index:05d}.parquet"
+        tmp_path = final_path.with_suffix('.parquet.tmp')
+        self.pq.write_table(table, tmp_path)
+        os.replace(tmp_path, final_path)
+        self.part_index += 1
+        self.rows = []
+
+    def commit(self):
+        """只有写满一个分片时才真正落盘"""
+        if len(self.rows) >= self.rows_per_part:
+            self._flush_part()
+            return {'parts': self.part_index}
+        return None
+
+    def finish(self):
+        self._flush_part()
+        return {'parts': self.part_index}
+
+
+def load_checkpoint(path):
+    """读取检查点"""
+    if path.exists():
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return None
+
+
+def save_checkpoint(path, state):
+    """原子写入检查点"""
+    tmp_path = path.with_suffix(path.suffix + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def build_record(parts, classifications, error):
+    """构建单张图像的输出记录"""
+    record = {'path': '/'.join(parts), 'success': bool(classifications), 'error': error}
+    if classifications:
+        primary = classifications[0]
+        record.update({
+            'class_name': primary['class_name'],
+            'crop_type': primary['crop_type'],
+            'disease_name': primary['disease_name'],
+            'confidence': round(primary['confidence'], 6),
+            'top5': [{'class_name': item['class_name'], 'confidence': round(item['confidence'], 6)}
+                     for item in classifications]
+        })
+    else:
+        record.update({'class_name': None, 'crop_type': None, 'disease_name': None,
+                       'confidence': None, 'top5': []})
+    return record
+
+
+def main():
+    """批量评分主流程"""
+    parser = argparse.ArgumentParser(description='作物病害图像离线批量评分')
+    parser.add_argument('root', type=str, help='图像根目录')
+    parser.add_argument('--output', type=str, required=True, help='输出路径（.jsonl文件或Parquet目录）')
+    parser.add_argument('--format', type=str, default='auto', choices=['auto', 'jsonl', 'parquet'], help='输出格式')
+    parser.add_argument('--batch-size', type=int, default=32, help='推理批次大小')
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) - 1), help='解码进程数')
+    parser.add_argument('--prefetch', type=int, default=2, help='每个解码进程预取的批次数')
+    parser.add_argument('--max-side', type=int, default=640, help='解码后图像最长边')
+    parser.add_argument('--max-decode-pixels', type=int, default=24 * 1000 * 1000,
+                        help='解码前的像素上限，超出且无法降采样解码的图像记为失败')
+    parser.add_argument('--checkpoint', type=str, default=None, help='检查点文件路径（默认: 输出路径.ckpt）')
+    parser.add_argument('--checkpoint-every', type=int, default=20, help='每多少个批次保存一次检查点')
+    parser.add_argument('--rows-per-part', type=int, default=10000,
+                        help='Parquet每个分片的行数；检查点只在分片落盘后前进，中断时最多重算一个分片')
+    parser.add_argument('--restart', action='store_true', help='忽略已有检查点，从头开始')
+
+    args = parser.parse_args()
+
+    root = Path(args.root)
+    if not root.is_dir():
+        print(f"❌ 目录不存在: {root}")
+        sys.exit(1)
+
+    output_format = args.format
+    if output_format == 'auto':
+        output_format = 'jsonl' if args.output.endswith('.jsonl') else 'parquet'
+    checkpoint_path = Path(args.checkpoint or f"{args.output}.ckpt")
+
+    # 读取检查点
+    state = None if args.restart else load_checkpoint(checkpoint_path)
+    if state is not None and (state.get('root') != str(root.resolve()) or state.get('format') != output_format):
+        print("❌ 检查点与当前参数不一致，请使用 --restart 重新开始")
+        sys.exit(1)
+    if state is None:
+        state = {'root': str(root.resolve()), 'format': output_format, 'last_path': None,
+                 'processed': 0, 'failed': 0, 'output_offset': 0, 'parts': 0}
+        if args.restart and output_format == 'jsonl' and Path(args.output).exists():
+            Path(args.output).unlink()
+        if args.restart and output_format == 'parquet' and Path(args.output).is_dir():
+            # 重新开始时删除上次的分片，避免新旧结果混在一起
+            for part in Path(args.output).glob("part-*.parquet*"):
+                part.unlink()
+    else:
+        print(f"🔁 从检查点继续: 已处理 {state['processed']} 张，最后一张 {'/'.join(state['last_path'] or [])}")
+
+    # 导入服务模块会创建检测器实例并加载模型
+    sys.path.insert(0, str(Path(__file__).parent))
+    from app_production import detector
+
+    if output_format == 'jsonl':
+        sink = JsonlSink(args.output, state['output_offset'])
+    else:
+        sink = ParquetSink(args.output, state['parts'], args.rows_per_part)
+
+    after = tuple(state['last_path']) if state['last_path'] else None
+    chunks = iter_chunks(walk_images(str(root), after=after), args.batch_size)
+
+    start_time = time.time()
+    processed_this_run = 0
+    batches_since_checkpoint = 0
+    max_inflight = max(1, args.workers * args.prefetch)
+
+    print(f"🚀 开始批量评分: 解码进程 {args.workers}，批次大小 {args.batch_size}，输出 {output_format}")
+
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        # 有界的在途批次窗口，按提交顺序取回结果以保证检查点顺序
+        inflight = deque()
+        for chunk in chunks:
+            inflight.append(pool.submit(decode_chunk, str(root), chunk, args.max_side, args.max_decode_pixels))
+            if len(inflight) < max_inflight:
+                continue
+            processed_this_run += process_batch(detector, inflight.popleft().result(), sink, state)
+            batches_since_checkpoint += 1
+            if batches_since_checkpoint >= args.checkpoint_every:
+                if commit_checkpoint(sink, state, checkpoint_path):
+                    batches_since_checkpoint = 0
+                elapsed = time.time() - start_time
+                print(f"📊 已处理 {state['processed']} 张 (本次 {processed_this_run} 张，"
+                      f"{processed_this_run / max(elapsed, 1e-6):.1f} 张/秒)")
+
+        while inflight:
+            processed_this_run += process_batch(detector, inflight.popleft().result(), sink, state)
+
+    state.update(sink.finish())
+    save_checkpoint(checkpoint_path, state)
+
+    elapsed = time.time() - start_time
+    print(f"✅ 批量评分完成: 本次 {processed_this_run} 张，累计 {state['processed']} 张，失败 {state['failed']} 张")
+    print(f"⏱️ 耗时 {elapsed:.1f} 秒，{processed_this_run / max(elapsed, 1e-6):.1f} 张/秒")
+
+
+def process_batch(detector, decoded, sink, state):
+    """对一组已解码图像进行批量推理并写出结果"""
+    images = [image for _, image, _ in decoded if image is not None]
+    try:
+        with detector.reserve_images(images):
+            results = iter(detector.classify_batch(images))
+        batch_error = None
+    except Exception as e:
+        results = iter(())
+        batch_error = f"推理失败: {e}"
+
+    records = []
+    for parts, image, error in decoded:
+        classifications = None
+        if image is not None and batch_error is None:
+            classifications = next(results)
+        records.append(build_record(parts, classifications, error or batch_error))
+        if not classifications:
+            state['failed'] += 1
+
+    sink.write(records)
+    state['processed'] += len(decoded)
+    state['last_path'] = list(decoded[-1][0])
+    return len(decoded)
+
+
+def commit_checkpoint(sink, state, checkpoint_path):
+    """输出已落盘时保存检查点"""
+    committed = sink.commit()
+    if committed is None:
+        return False
+    state.update(committed)
+    save_checkpoint(checkpoint_path, state)
+    return True
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""
+TorchScript / torch.compile 推理路径
+加载时将分类网络融合并追踪（trace）或编译（compile）一次，推理时直接调用编译后的模块，
+绕过 ultralytics 预测器的逐次封装开销；编译产物按权重哈希与torch版本缓存在磁盘
+"""
+
+import os
+import hashlib
+import logging
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+
+def file_digest(path, chunk_size=1024 * 1024):
+    """权重文件的SHA-256摘要"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def resize_center_crop(image, imgsz):
+    """短边缩放到imgsz后中心裁剪为imgsz×imgsz的RGB图像；numpy输入按 ultralytics 约定视为BGR"""
+    if isinstance(image, np.ndarray):
+        image = Image.fromarray(np.ascontiguousarray(image[..., ::-1]))
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    # 与 torchvision Resize / CenterCrop 的取整方式保持一致
+    width, height = image.size
+    if width <= height:
+        size = (imgsz, int(imgsz * height / width))
+    else:
+        size = (int(imgsz * width / height), imgsz)
+    resized = image.resize(size, Image.BILINEAR)
+    left = int(round((resized.width - imgsz) / 2.0))
+    top = int(round((resized.height - imgsz) / 2.0))
+    return resized.crop((left, top, left + imgsz, top + imgsz))
+
+
+def preprocess(images, imgsz, out=None):
+    """
+    与 ultralytics 分类预处理一致：短边缩放到imgsz、中心裁剪、归一化到[0,1]，返回NCHW数组；
+    传入out（如缓冲池借出的缓冲）时直接写入out，不再分配新数组
+    """
+    batch = np.empty((len(images), 3, imgsz, imgsz), dtype=np.float32) if out is None else out
+    for i, image in enumerate(images):
+        cropped = np.asarray(resize_center_crop(image, imgsz))
+        np.divide(cropped.transpose(2, 0, 1), np.float32(255.0), out=batch[i])
+    return batch
+
+
+class CompiledProbs:
+    def __init__(self, probabilities):
+        """与 ultralytics Probs 一致的常用属性"""
+        self.data = probabilities
+        order = np.argsort(-probabilities)
+        self.top1 = int(order[0])
+        self.top1conf = float(probabilities[order[0]])
+        self.top5 = [int(i) for i in order[:5]]
+        self.top5conf = probabilities[order[:5]]
+
+
+class CompiledResult:
+    def __init__(self, probabilities, names):
+        self.probs = CompiledProbs(probabilities)
+        self.names = names
+
+
+def model_imgsz(module, default=224):
+    """训练时的输入尺寸"""
+    return int((getattr(module, 'args', None) or {}).get('imgsz', default))
+
+
+def fuse_for_inference(module):
+    """融合卷积与BN并切换到推理模式"""
+    if hasattr(module, 'fuse'):
+        module = module.fuse(verbose=False)
+    return module.float().eval()
+
+
+class DirectClassifier:
+    def __init__(self, module, names, imgsz):
+        """直接调用分类网络，不经过 ultralytics 预测器；调用方式与 YOLO 模型一致"""
+        import torch
+        self.torch = torch
+        self.model = module
+        self.module = module
+        self.names = names
+        self.imgsz = imgsz
+        self.buffer_pool = None
+
+    def __call__(self, source, verbose=False, imgsz=None, **kwargs):
+        images = list(source) if isinstance(source, (list, tuple)) else [source]
+        # 分类网络以全局池化结尾，可直接接受较小的输入尺寸
+        imgsz = imgsz or self.imgsz
+        if self.buffer_pool is None:
+            return self._infer(preprocess(images, imgsz))
+        with self.buffer_pool.acquire(len(images), imgsz) as batch:
+            return self._infer(preprocess(images, imgsz, out=batch))
+
+    def _infer(self, batch):
+        # from_numpy与输入数组共享内存，缓冲在推理完成后才归还
+        with self.torch.inference_mode():
+            output = self.module(self.torch.from_numpy(batch))
+        # 分类头在推理模式下返回 (softmax概率, logits)
+        if isinstance(output, (list, tuple)):
+            output = output[0]
+        probabilities = output.float().cpu().numpy()
+        return [CompiledResult(row, self.names) for row in probabilities]
+
+    predict = __call__
+
+
+class PooledPredictor:
+    def __init__(self, yolo, imgsz, buffer_pool=None):
+        """
+        默认 ultralytics 推理路径的输入缓冲：预处理（短边缩放+中心裁剪）直接写入池中的NCHW缓冲，
+        以张量形式交给预测器，预测器不再为每个请求新建数组；其余属性与方法转发给原模型
+        """
+        import torch
+        self.torch = torch
+        self.yolo = yolo
+        self.imgsz = imgsz
+        self.buffer_pool = buffer_pool
+
+    def __getattr__(self, name):
+        # 复制或反序列化时yolo尚未设置，避免无限递归
+        if name == 'yolo':
+            raise AttributeError(name)
+        return getattr(self.yolo, name)
+
+    def __call__(self, source, verbose=False, imgsz=None, **kwargs):
+        images = list(source) if isinstance(source, (list, tuple)) else [source]
+        imgsz = imgsz or self.imgsz
+        if self.buffer_pool is None:
+            return self.yolo(images, verbose=verbose, imgsz=imgsz, **kwargs)
+        # 张量输入由预测器直接使用；结果中的原图为转换后的副本，缓冲在推理完成后即可归还
+        with self.buffer_pool.acquire(len(images), imgsz) as batch:
+            preprocess(images, imgsz, out=batch)
+            return self.yolo(self.torch.from_numpy(batch), verbose=verbose, **kwargs)
+
+    predict = __call__
+
+
+class CompiledClassifier(DirectClassifier):
+    def __init__(self, yolo, model_path, mode='trace', cache_dir=None, warmup_batch_size=8):
+        """
+        yolo为 YOLO 模型或 DirectClassifier；
+        mode为trace时保存冻结后的TorchScript模块，后续启动直接加载；
+        mode为compile时使用torch.compile，编译缓存（Inductor）按同样的键保存在cache_dir下
+        """
+        import torch
+        if mode not in ('trace', 'compile'):
+            raise ValueError(f"不支持的编译方式: {mode}")
+        self.torch = torch
+        self.mode = mode
+        self.names = yolo.names
+        self.imgsz = getattr(yolo, 'imgsz', None) or model_imgsz(yolo.model)
+
+        model_path = Path(model_path)
+        cache_dir = Path(cache_dir) if cache_dir else model_path.parent / "compiled"
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        self.cache_key = f"{model_path.stem}-{file_digest(model_path)[:16]}-torch{torch.__version__}-{self.imgsz}"
+        self.cache_hit = False
+        self.buffer_pool = None
+
+        if mode == 'trace':
+            self.cache_path = cache_dir / f"{self.cache_key}.ts"
+            self.module = self._load_or_trace(yolo)
+        else:
+            self.cache_path = cache_dir / f"inductor-{self.cache_key}"
+            self.module = self._compile(yolo)
+        self.model = self.module
+
+        # 预热，torch.compile在首次调用时才真正编译
+        self([np.zeros((self.imgsz, self.imgsz, 3), dtype=np.uint8)] * warmup_batch_size)
+
+    def _load_or_trace(self, yolo):
+        torch = self.torch
+        if self.cache_path.exists():
+            try:
+                module = torch.jit.load(str(self.cache_path), map_location='cpu')
+                self.cache_hit = True
+                logger.info(f"加载已缓存的TorchScript模块: {self.cache_path}")
+                return module
+            except Exception as e:
+                logger.warning(f"TorchScript缓存不可用，重新追踪: {e}")
+
+        module = fuse_for_inference(yolo.model)
+        example = torch.zeros(1, 3, self.imgsz, self.imgsz)
+        with torch.no_grad():
+            traced = torch.jit.trace(module, example, strict=False)
+            traced = torch.jit.freeze(traced)
+        # 先写临时文件再替换，避免并发启动的进程读到不完整的缓存
+        tmp_path = self.cache_path.with_suffix(f".{os.getpid()}.tmp")
+        torch.jit.save(traced, str(tmp_path))
+        os.replace(tmp_path, self.cache_path)
+        logger.info(f"TorchScript模块已缓存: {self.cache_path}")
+        return traced
+
+    def _compile(self, yolo):
+        torch = self.torch
+        self.cache_hit = self.cache_path.exists()
+        os.environ['TORCHINDUCTOR_CACHE_DIR'] = str(self.cache_path)
+        import torch._inductor.config as inductor_config
+        inductor_config.fx_graph_cache = True
+        return torch.compile(fuse_for_inference(yolo.model))
+
+    def info(self):
+        return {
+            'mode': self.mode,
+            'imgsz': self.imgsz,
+            'cache_key': self.cache_key,
+            'cache_path': str(self.cache_path),
+            'cache_hit': self.cache_hit
+        }
@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+"""
+图像特征提取与相似病例检索
+在分类模型的最后一个全连接层前截取特征（与分类共用同一次前向），
+特征以只追加方式写入内存映射文件，按块批量计算余弦相似度取Top-K。
+索引只支持单进程读写，打开时对索引目录加排他文件锁
+"""
+
+import json
+import time
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows下不加文件锁
+    fcntl = None
+
+
+class FeatureCapture:
+    def __init__(self):
+        """收集前向过程中产生的特征，按线程隔离，并发请求互不干扰"""
+        self._local = threading.local()
+
+    def __call__(self, features):
+        buffer = getattr(self._local, 'buffer', None)
+        if buffer is not None:
+            buffer.append(np.asarray(features, dtype=np.float32).reshape(len(features), -1))
+
+    @contextmanager
+    def capture(self):
+        """在上下文内执行前向，产生的特征按批次顺序追加到返回的列表"""
+        self._local.buffer = []
+        try:
+            yield self._local.buffer
+        finally:
+            self._local.buffer = None
+
+
+def find_penultimate_layer(module):
+    """返回网络中最后一个全连接层（其输入即倒数第二层特征），不存在时返回None"""
+    last = None
+    for layer in module.modules():
+        if type(layer).__name__ == 'Linear':
+            last = layer
+    return last
+
+
+def attach_feature_capture(model):
+    """为模型挂载特征采集，返回 FeatureCapture；模型不支持时返回None"""
+    capture = FeatureCapture()
+    # 合成后端直接提供特征回调
+    if hasattr(model, 'feature_hook'):
+        model.feature_hook = capture
+        return capture
+
+    module = getattr(model, 'model', None)
+    if module is None or not hasattr(module, 'modules'):
+        return None
+    layer = find_penultimate_layer(module)
+    if layer is None:
+        return None
+    layer.register_forward_hook(lambda _, inputs, __: capture(inputs[0].detach().float().cpu().numpy()))
+    return capture
+
+
+def normalize(vectors):
+    """按行L2归一化，使内积即余弦相似度"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors[None, :]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class EmbeddingIndex:
+    def __init__(self, directory, dim=None, dtype='float32', chunk_bytes=16 * 1024 * 1024):
+        """
+        只追加的特征索引：vectors.bin 保存归一化后的定长特征，metadata.jsonl 逐行保存对应的病例信息。
+        dim为空时在首次写入时确定；检索时每块读取约chunk_bytes字节的特征。
+        各进程的行偏移只保存在内存中，多进程同时写入会错位，因此目录已被其他进程打开时抛出RuntimeError
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.vectors_path = self.directory / "vectors.bin"
+        self.metadata_path = self.directory / "metadata.jsonl"
+        self.header_path = self.directory / "index.json"
+        self.chunk_bytes = chunk_bytes
+
+        # 排他锁随进程持有，进程退出时由系统释放
+        self._lock_file = open(self.directory / "index.lock", 'a')
+        if fcntl is not None:
+            try:
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                self._lock_file.close()
+                raise RuntimeError(f"索引目录 {self.directory} 已被其他进程使用，特征索引只支持单进程读写")
+
+        self._lock = threading.Lock()
+        self._view = None
+        self._view_rows = 0
+        self._offsets = []
+
+        self.dim = dim
+        self.dtype = np.dtype(dtype)
+        if self.header_path.exists():
+            header = json.loads(self.header_path.read_text(encoding='utf-8'))
+            if dim is not None and header['dim'] != dim:
+                raise ValueError(f"索引特征维度为 {header['dim']}，与模型特征维度 {dim} 不一致")
+            self.dim = header['dim']
+            self.dtype = np.dtype(header['dtype'])
+
+        self.searches = 0
+        self.queries = 0
+        self.search_seconds_total = 0.0
+        self._recover()
+
+    @property
+    def row_bytes(self):
+        return self.dim * self.dtype.itemsize if self.dim else 0
+
+    @property
+    def chunk_rows(self):
+        """每块扫描的行数：按float32计算的块大小不超过chunk_bytes"""
+        return max(1, self.chunk_bytes // (self.dim * 4)) if self.dim else 1
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def _recover(self):
+        """读取元数据行偏移；写入中断时以两个文件中较短的一方为准截断多余部分"""
+        offsets = []
+        if self.metadata_path.exists():
+            with open(self.metadata_path, 'rb') as f:
+                position = 0
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        break
+                    offsets.append(position)
+                    position += len(line)
+            with open(self.metadata_path, 'r+b') as f:
+                f.truncate(position)
+
+        rows = 0
+        if self.dim and self.vectors_path.exists():
+            rows = self.vectors_path.stat().st_size // self.row_bytes
+        count = min(len(offsets), rows)
+        if count < len(offsets):
+            with open(self.metadata_path, 'r+b') as f:
+                f.truncate(offsets[count])
+        if self.dim and self.vectors_path.exists():
+            with open(self.vectors_path, 'r+b') as f:
+                f.truncate(count * self.row_bytes)
+        self._offsets = offsets[:count]
+
+    def add(self, vectors, metadata_list):
+        """追加特征与对应病例信息，返回分配的编号"""
+        vectors = normalize(vectors)
+        if len(vectors) != len(metadata_list):
+            raise ValueError("特征数量与病例信息数量不一致")
+
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+            if not self.header_path.exists():
+                self.header_path.write_text(json.dumps({'dim': self.dim, 'dtype': self.dtype.name}), encoding='utf-8')
+            if vectors.shape[1] != self.dim:
+                raise ValueError(f"特征维度 {vectors.shape[1]} 与索引维度 {self.dim} 不一致")
+
+            first_id = len(self._offsets)
+            # 先写特征再写元数据，中断时由 _recover 截断未配对的部分
+            with open(self.vectors_path, 'ab') as f:
+                f.write(vectors.astype(self.dtype).tobytes())
+            position = self.metadata_path.stat().st_size if self.metadata_path.exists() else 0
+            offsets = []
+            with open(self.metadata_path, 'ab') as f:
+                for i, metadata in enumerate(metadata_list):
+                    line = (json.dumps(dict(metadata, id=first_id + i), ensure_ascii=False) + '\n').encode('utf-8')
+                    f.write(line)
+                    offsets.append(position)
+                    position += len(line)
+            self._offsets.extend(offsets)
+            return list(range(first_id, first_id + len(metadata_list)))
+
+    def _rows(self):
+        """返回当前全部特征的只读内存映射；文件只追加，已映射的前缀始终有效"""
+        count = len(self._offsets)
+        if count == 0:
+            return None
+        if self._view is None or self._view_rows != count:
+            self._view = np.memmap(self.vectors_path, dtype=self.dtype, mode='r', shape=(count, self.dim))
+            self._view_rows = count
+        return self._view
+
+    def search(self, queries, k=5):
+        """批量余弦相似度检索，返回每个查询的 [(编号, 相似度), ...]（按相似度降序）"""
+        queries = normalize(queries)
+        with self._lock:
+            rows = self._rows()
+        if rows is None or k <= 0:
+            return [[] for _ in queries]
+        if queries.shape[1] != self.dim:
+            raise ValueError(f"查询维度 {queries.shape[1]} 与索引维度 {self.dim} 不一致")
+
+        start = time.perf_counter()
+        k = min(k, len(rows))
+        best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+        best_ids = np.zeros((len(queries), 0), dtype=np.int64)
+        # 分块扫描，控制每块转换后的特征与相似度矩阵大小；每块只保留候选Top-K
+        chunk_rows = self.chunk_rows
+        for begin in range(0, len(rows), chunk_rows):
+            block = np.asarray(rows[begin:begin + chunk_rows], dtype=np.float32)
+            scores = queries @ block.T
+            if scores.shape[1] > k:
+                top = np.argpartition(scores, -k, axis=1)[:, -k:]
+                scores = np.take_along_axis(scores, top, axis=1)
+            else:
+                top = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+            best_scores = np.concatenate([best_scores, scores], axis=1)
+            best_ids = np.concatenate([best_ids, top + begin], axis=1)
+            if best_scores.shape[1] > k:
+                keep = np.argpartition(best_scores, -k, axis=1)[:, -k:]
+                best_scores = np.take_along_axis(best_scores, keep, axis=1)
+                best_ids = np.take_along_axis(best_ids, keep, axis=1)
+
+        order = np.argsort(-best_scores, axis=1)
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        best_ids = np.take_along_axis(best_ids, order, axis=1)
+
+        self.searches += 1
+        self.queries += len(queries)
+        self.search_seconds_total += time.perf_counter() - start
+        return [[(int(i), float(s)) for i, s in zip(ids, scores)] for ids, scores in zip(best_ids, best_scores)]
+
+    def get_metadata(self, ids):
+        """按编号读取病例信息"""
+        records = []
+        if not ids:
+            return records
+        with open(self.metadata_path, 'rb') as f:
+            for i in ids:
+                f.seek(self._offsets[i])
+                records.append(json.loads(f.readline()))
+        return records
+
+    def stats(self):
+        """索引统计信息"""
+        return {
+            'directory': str(self.directory),
+            'vectors': len(self._offsets),
+            'dim': self.dim,
+            'dtype': self.dtype.name,
+            'size_mb': round(len(self._offsets) * self.row_bytes / 1024 / 1024, 2),
+            'searches': self.searches,
+            'queries': self.queries,
+            'search_ms_mean': round(self.search_seconds_total / self.searches * 1000, 2) if self.searches else None
+        }
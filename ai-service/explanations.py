@@ -0,0 +1,302 @@
+# -*- coding: utf-8 -*-
+"""
+显著性图（Grad-CAM）异步解释
+检测时保留预处理后的模型输入，用户按detection_id请求解释后由后台低优先级线程计算热力图，
+渲染好的PNG按字节上限缓存，读取时不占用推理线程
+"""
+
+import copy
+import time
+import queue
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import nullcontext
+
+import cv2
+import numpy as np
+
+from compiled_model import model_imgsz, preprocess, resize_center_crop
+
+logger = logging.getLogger(__name__)
+
+
+class _ByteLru:
+    """按总字节数淘汰最久未使用条目的缓存"""
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key, value, size):
+        if key in self._entries:
+            self.bytes -= self._entries.pop(key)[1]
+        self._entries[key] = (value, size)
+        self.bytes += size
+        while self.bytes > self.max_bytes and len(self._entries) > 1:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self.bytes -= evicted_size
+            self.evictions += 1
+
+
+def find_target_layer(module):
+    """Grad-CAM目标层：最后一个卷积块（含激活），没有时取最后一个Conv2d"""
+    import torch.nn as nn
+    target = None
+    for layer in module.modules():
+        if isinstance(getattr(layer, 'conv', None), nn.Conv2d):
+            target = layer
+        elif isinstance(layer, nn.Conv2d) and target is None:
+            target = layer
+    if target is None:
+        raise ValueError("模型中没有卷积层，无法计算Grad-CAM")
+    return target
+
+
+class GradCam:
+    def __init__(self, module, imgsz):
+        """
+        在模块的独立副本上计算Grad-CAM，不影响推理线程共用的模块。
+        钩子挂在模块上，会在任何线程的前向中触发，因此每个解释线程使用各自的副本
+        """
+        import torch
+        self.torch = torch
+        self.imgsz = imgsz
+        self.module = copy.deepcopy(module).float().eval()
+        for parameter in self.module.parameters():
+            parameter.requires_grad_(False)
+        self._local = threading.local()
+
+    def _replica(self):
+        """当前线程的模块副本及其目标层，首次使用时复制"""
+        replica = getattr(self._local, 'replica', None)
+        if replica is None:
+            module = copy.deepcopy(self.module)
+            replica = self._local.replica = (module, find_target_layer(module))
+        return replica
+
+    def __call__(self, image, class_index):
+        """返回与输入同尺寸、取值[0,1]的热力图"""
+        torch = self.torch
+        module, layer = self._replica()
+        captured = {}
+
+        def forward_hook(layer, inputs, output):
+            captured['activation'] = output
+            output.register_hook(lambda grad: captured.__setitem__('gradient', grad))
+
+        handle = layer.register_forward_hook(forward_hook)
+        try:
+            with torch.enable_grad():
+                # 参数不参与求导，令输入需要梯度以构建计算图
+                batch = torch.from_numpy(preprocess([image], self.imgsz)).requires_grad_(True)
+                output = module(batch)
+                # 分类头在推理模式下返回 (softmax概率, logits)，优先对logits求导
+                if isinstance(output, (list, tuple)):
+                    output = output[1] if len(output) > 1 else output[0]
+                output[0, class_index].backward()
+        finally:
+            handle.remove()
+
+        activation = captured['activation'][0].detach()
+        gradient = captured['gradient'][0].detach()
+        weights = gradient.mean(dim=(1, 2))
+        cam = torch.relu((weights[:, None, None] * activation).sum(dim=0)).float().numpy()
+        if cam.max() > 0:
+            cam = cam / cam.max()
+        return cv2.resize(cam, (self.imgsz, self.imgsz), interpolation=cv2.INTER_LINEAR)
+
+
+def make_explainer(model):
+    """
+    为模型构建解释函数 (图像, 类别索引) -> 热力图，返回 (解释函数, 输入尺寸)；
+    合成后端使用其saliency方法，YOLO模型与直接调用的网络使用Grad-CAM，其余返回 (None, None)
+    """
+    if hasattr(model, 'saliency'):
+        imgsz = getattr(model, 'imgsz', 224)
+        return (lambda image, class_index: model.saliency(image, class_index, imgsz)), imgsz
+    module = getattr(model, 'model', None)
+    if module is None or not hasattr(module, 'modules'):
+        return None, None
+    imgsz = getattr(model, 'imgsz', None) or model_imgsz(module)
+    return GradCam(module, imgsz), imgsz
+
+
+def render_heatmap(image, heatmap, alpha=0.45):
+    """将热力图以JET配色叠加在模型输入图像上，返回PNG字节"""
+    rgb = np.asarray(image.convert('RGB'))
+    if heatmap.shape != rgb.shape[:2]:
+        heatmap = cv2.resize(heatmap, (rgb.shape[1], rgb.shape[0]), interpolation=cv2.INTER_LINEAR)
+    colored = cv2.applyColorMap(np.uint8(np.clip(heatmap, 0, 1) * 255), cv2.COLORMAP_JET)
+    blended = cv2.addWeighted(cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR), 1 - alpha, colored, alpha, 0)
+    ok, encoded = cv2.imencode('.png', blended)
+    if not ok:
+        raise RuntimeError("热力图PNG编码失败")
+    return encoded.tobytes()
+
+
+class ExplanationService:
+    def __init__(self, explainer, imgsz, retain_bytes=64 * 1024 * 1024, cache_bytes=64 * 1024 * 1024,
+                 queue_size=64, workers=1, slot=None, max_jobs=4096):
+        """
+        explainer为 make_explainer 返回的解释函数；slot返回上下文管理器，计算前先进入（如占用低优先级推理槽位）。
+        保留的模型输入与渲染结果分别按字节上限淘汰
+        """
+        self.explainer = explainer
+        self.imgsz = imgsz
+        self.slot = slot
+        self.max_jobs = max_jobs
+
+        self._lock = threading.Lock()
+        self._inputs = _ByteLru(retain_bytes)
+        self._results = _ByteLru(cache_bytes)
+        self._jobs = OrderedDict()
+        self._queue = queue.Queue(maxsize=queue_size)
+
+        self.retained = 0
+        self.requested = 0
+        self.cache_hits = 0
+        self.computed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.compute_seconds = 0.0
+
+        # 工作线程在第一次请求解释时才启动，只导入检测器的命令行工具不会产生后台线程
+        self.workers = workers
+        self._threads = []
+
+    def _ensure_workers(self):
+        """在持有锁时启动工作线程"""
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._run, name=f"explain-worker-{len(self._threads)}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def retain(self, detection_id, image, class_index, class_name):
+        """保留检测时的模型输入（短边缩放+中心裁剪后的图像），供之后按detection_id解释"""
+        crop = resize_center_crop(image, self.imgsz)
+        with self._lock:
+            self._inputs.put(detection_id, (crop, class_index, class_name), self.imgsz * self.imgsz * 3)
+            self.retained += 1
+
+    def alias(self, detection_id, source_id):
+        """合并执行的请求共享同一份输入"""
+        with self._lock:
+            entry = self._inputs.get(source_id)
+            if entry is not None:
+                self._inputs.put(detection_id, entry, self.imgsz * self.imgsz * 3)
+
+    def _set_job(self, detection_id, **fields):
+        job = self._jobs.setdefault(detection_id, {'detection_id': detection_id})
+        job.update(fields)
+        self._jobs.move_to_end(detection_id)
+        while len(self._jobs) > self.max_jobs:
+            self._jobs.popitem(last=False)
+        return dict(job)
+
+    def status(self, detection_id):
+        """解释状态：done / queued / running / failed / available（可请求），未知的detection_id返回None"""
+        with self._lock:
+            job = self._jobs.get(detection_id)
+            if detection_id in self._results:
+                return dict(job or {'detection_id': detection_id}, status='done')
+            if job is not None and job['status'] != 'done':
+                return dict(job)
+            entry = self._inputs.get(detection_id)
+            if entry is not None:
+                return {'detection_id': detection_id, 'status': 'available', 'class_name': entry[2]}
+            return None
+
+    def request(self, detection_id):
+        """请求计算解释，已完成或已在排队时直接返回状态；队列已满返回状态 rejected"""
+        with self._lock:
+            self.requested += 1
+            if detection_id in self._results:
+                self.cache_hits += 1
+                return dict(self._jobs.get(detection_id) or {'detection_id': detection_id}, status='done')
+            job = self._jobs.get(detection_id)
+            if job is not None and job['status'] in ('queued', 'running'):
+                return dict(job)
+            entry = self._inputs.get(detection_id)
+            if entry is None:
+                return None
+            self._ensure_workers()
+            try:
+                self._queue.put_nowait(detection_id)
+            except queue.Full:
+                self.rejected += 1
+                return {'detection_id': detection_id, 'status': 'rejected'}
+            return self._set_job(detection_id, status='queued', class_name=entry[2],
+                                 requested_at=time.time(), error=None)
+
+    def heatmap(self, detection_id):
+        """已渲染的热力图PNG字节，未完成时返回None"""
+        with self._lock:
+            return self._results.get(detection_id)
+
+    def _run(self):
+        while True:
+            detection_id = self._queue.get()
+            with self._lock:
+                entry = self._inputs.get(detection_id)
+                self._set_job(detection_id, status='running')
+            if entry is None:
+                with self._lock:
+                    self.failed += 1
+                    self._set_job(detection_id, status='failed', error='模型输入已被淘汰，请重新检测')
+                continue
+
+            crop, class_index, _ = entry
+            start = time.perf_counter()
+            try:
+                with self.slot() if self.slot is not None else nullcontext():
+                    heatmap = self.explainer(crop, class_index)
+                png = render_heatmap(crop, heatmap)
+            except Exception as e:
+                logger.error(f"解释 {detection_id} 计算失败: {e}")
+                with self._lock:
+                    self.failed += 1
+                    self._set_job(detection_id, status='failed', error=str(e))
+                continue
+
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self._results.put(detection_id, png, len(png))
+                self.computed += 1
+                self.compute_seconds += elapsed
+                self._set_job(detection_id, status='done', finished_at=time.time(),
+                              compute_seconds=round(elapsed, 3))
+
+    def stats(self):
+        """解释服务统计信息"""
+        with self._lock:
+            return {
+                'queued': self._queue.qsize(),
+                'retained': self.retained,
+                'retained_inputs': len(self._inputs),
+                'retained_bytes': self._inputs.bytes,
+                'input_evictions': self._inputs.evictions,
+                'cached_heatmaps': len(self._results),
+                'cached_bytes': self._results.bytes,
+                'cache_evictions': self._results.evictions,
+                'requested': self.requested,
+                'cache_hits': self.cache_hits,
+                'computed': self.computed,
+                'failed': self.failed,
+                'rejected': self.rejected,
+                'mean_compute_ms': round(self.compute_seconds / self.computed * 1000, 2) if self.computed else None
+            }
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""
+按优先级调度模型推理
+每次前向推理前占用一个推理槽位；槽位空闲时按各优先级类别的容量份额（加权公平）挑选下一个等待者，
+份额相同时优先级高的类别先执行。批量任务每批重新排队，交互请求因此能在批次之间插队
+"""
+
+import time
+import threading
+from collections import deque, OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+
+
+def parse_shares(spec):
+    """解析容量份额，如 'interactive:0.8,bulk:0.2'；书写顺序即优先级顺序"""
+    shares = OrderedDict()
+    for item in spec.split(','):
+        name, share = item.split(':')
+        share = float(share)
+        if share <= 0:
+            raise ValueError(f"类别 {name} 的容量份额必须大于0")
+        shares[name.strip()] = share
+    if not shares:
+        raise ValueError("至少需要一个优先级类别")
+    return shares
+
+
+class _ClassState:
+    def __init__(self, name, share, rank, window):
+        self.name = name
+        self.share = share
+        self.rank = rank
+        self.waiters = deque()
+        self.running = 0
+        # 虚拟时间：已占用的推理时间除以份额，越小越先获得槽位
+        self.virtual_time = 0.0
+
+        self.granted = 0
+        self.service_seconds = 0.0
+        self.queue_times = deque(maxlen=window)
+        self.max_queue_time = 0.0
+
+
+class _Waiter:
+    def __init__(self):
+        self.event = threading.Event()
+        self.enqueued = time.perf_counter()
+
+
+class PriorityScheduler:
+    def __init__(self, slots=1, shares='interactive:0.8,bulk:0.2', default_class=None, window=1024):
+        """slots为可同时执行的推理数；shares为各类别容量份额，未指定类别的请求归入default_class（默认最高优先级）"""
+        shares = parse_shares(shares) if isinstance(shares, str) else OrderedDict(shares)
+        self.slots = slots
+        self.classes = OrderedDict((name, _ClassState(name, share, rank, window))
+                                   for rank, (name, share) in enumerate(shares.items()))
+        self.default_class = default_class or next(iter(self.classes))
+        if self.default_class not in self.classes:
+            raise ValueError(f"未知的默认类别: {self.default_class}")
+
+        self._lock = threading.Lock()
+        self._free = slots
+        self._local = threading.local()
+
+    def resolve(self, name):
+        """未知或未指定的类别归入默认类别"""
+        return name if name in self.classes else self.default_class
+
+    @contextmanager
+    def priority(self, name):
+        """设置当前线程后续推理所属的类别"""
+        previous = getattr(self._local, 'name', None)
+        self._local.name = self.resolve(name)
+        try:
+            yield self._local.name
+        finally:
+            self._local.name = previous
+
+    def current_class(self):
+        return getattr(self._local, 'name', None) or self.default_class
+
+    def _active(self, state):
+        return state.running > 0 or len(state.waiters) > 0
+
+    def _dispatch(self):
+        """在持有锁时把空闲槽位分配给虚拟时间最小的类别"""
+        while self._free > 0:
+            candidates = [state for state in self.classes.values() if state.waiters]
+            if not candidates:
+                return
+            state = min(candidates, key=lambda s: (s.virtual_time, s.rank))
+            waiter = state.waiters.popleft()
+            self._free -= 1
+            state.running += 1
+            state.granted += 1
+            queue_time = time.perf_counter() - waiter.enqueued
+            state.queue_times.append(queue_time)
+            state.max_queue_time = max(state.max_queue_time, queue_time)
+            waiter.event.set()
+
+    @contextmanager
+    def slot(self, name=None):
+        """占用一个推理槽位，name缺省时使用当前线程设置的类别"""
+        state = self.classes[self.resolve(name) if name else self.current_class()]
+        waiter = _Waiter()
+        with self._lock:
+            if not self._active(state):
+                # 空闲后重新活跃的类别不能用积攒的份额挤占其他类别
+                active = [s.virtual_time for s in self.classes.values() if s is not state and self._active(s)]
+                if active:
+                    state.virtual_time = max(state.virtual_time, min(active))
+            state.waiters.append(waiter)
+            self._dispatch()
+        waiter.event.wait()
+
+        start = time.perf_counter()
+        try:
+            yield state.name
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                state.running -= 1
+                state.service_seconds += elapsed
+                state.virtual_time += elapsed / state.share
+                self._free += 1
+                self._dispatch()
+
+    def stats(self):
+        """各类别排队时间与实际占用的容量比例"""
+        with self._lock:
+            total_service = sum(state.service_seconds for state in self.classes.values())
+            classes = {}
+            for name, state in self.classes.items():
+                queue_times = np.asarray(state.queue_times) * 1000
+                classes[name] = {
+                    'share': state.share,
+                    'waiting': len(state.waiters),
+                    'running': state.running,
+                    'granted': state.granted,
+                    'service_seconds': round(state.service_seconds, 3),
+                    'capacity_used': round(state.service_seconds / total_service, 4) if total_service else 0.0,
+                    'queue_ms': {
+                        'mean': round(float(queue_times.mean()), 2),
+                        'p50': round(float(np.percentile(queue_times, 50)), 2),
+                        'p95': round(float(np.percentile(queue_times, 95)), 2),
+                        'p99': round(float(np.percentile(queue_times, 99)), 2),
+                        'max': round(state.max_queue_time * 1000, 2)
+                    } if len(queue_times) else None
+                }
+            return {
+                'slots': self.slots,
+                'free_slots': self._free,
+                'default_class': self.default_class,
+                'classes': classes
+            }
@@ -0,0 +1,306 @@
+# -*- coding: utf-8 -*-
+"""
+异步批量检测任务队列
+任务信息保存在本地SQLite中，后台线程分批推理ZIP压缩包内的图像，服务重启后自动恢复
+"""
+
+import os
+import json
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+import zipfile
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from pathlib import Path
+
+from bulk_score import IMAGE_EXTENSIONS, build_record
+from memory_budget import MemoryBudgetExceeded
+
+logger = logging.getLogger(__name__)
+
+
+class JobQueue:
+    def __init__(self, storage_dir, max_images=20000, max_image_bytes=20 * 1024 * 1024):
+        """初始化任务队列"""
+        self.storage_dir = Path(storage_dir)
+        self.storage_dir.mkdir(parents=True, exist_ok=True)
+        self.db_path = self.storage_dir / "jobs.db"
+        self.max_images = max_images
+        self.max_image_bytes = max_image_bytes
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    filename TEXT,
+                    total INTEGER DEFAULT 0,
+                    processed INTEGER DEFAULT 0,
+                    failed INTEGER DEFAULT 0,
+                    result_offset INTEGER DEFAULT 0,
+                    error TEXT,
+                    created_at TEXT NOT NULL,
+                    started_at TEXT,
+                    finished_at TEXT
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, created_at)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(str(self.db_path), timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def archive_path(self, job_id):
+        return self.storage_dir / f"{job_id}.zip"
+
+    def result_path(self, job_id):
+        return self.storage_dir / f"{job_id}.jsonl"
+
+    def list_images(self, archive):
+        """压缩包内待检测的图像条目（按名称排序，保证续跑顺序一致）"""
+        entries = [info for info in archive.infolist()
+                   if not info.is_dir() and os.path.splitext(info.filename)[1].lower() in IMAGE_EXTENSIONS]
+        return sorted(entries, key=lambda info: info.filename)
+
+    def submit(self, file_storage):
+        """保存上传的压缩包并创建任务"""
+        job_id = uuid.uuid4().hex
+        archive_path = self.archive_path(job_id)
+        file_storage.save(archive_path)
+
+        try:
+            with zipfile.ZipFile(archive_path) as archive:
+                total = len(self.list_images(archive))
+        except zipfile.BadZipFile:
+            archive_path.unlink()
+            raise ValueError("无效的ZIP压缩包")
+        if total == 0:
+            archive_path.unlink()
+            raise ValueError("压缩包中没有可识别的图像")
+        if total > self.max_images:
+            archive_path.unlink()
+            raise ValueError(f"压缩包图像数量超过上限 {self.max_images}")
+
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, status, filename, total, created_at) VALUES (?, 'queued', ?, ?, ?)",
+                (job_id, file_storage.filename, total, datetime.now().isoformat())
+            )
+        return self.get(job_id)
+
+    def get(self, job_id):
+        """查询任务状态"""
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def counts(self):
+        """各状态任务数量"""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {row['status']: row['n'] for row in rows}
+
+    def recover(self):
+        """服务重启后将中断的任务重新放回队列，已完成的批次保留"""
+        with self._connect() as conn:
+            cursor = conn.execute("UPDATE jobs SET status = 'queued' WHERE status = 'running'")
+        if cursor.rowcount:
+            logger.info(f"恢复 {cursor.rowcount} 个中断的任务")
+
+    def claim_next(self):
+        """原子地领取最早的排队任务"""
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT id FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+                ).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', started_at = COALESCE(started_at, ?) WHERE id = ?",
+                    (datetime.now().isoformat(), row['id'])
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return self.get(row['id'])
+
+    def record_progress(self, job_id, processed, failed, result_offset):
+        """记录已落盘的进度"""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET processed = ?, failed = ?, result_offset = ? WHERE id = ?",
+                (processed, failed, result_offset, job_id)
+            )
+
+    def finish(self, job_id, error=None):
+        """标记任务结束并删除压缩包"""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ?",
+                ('failed' if error else 'completed', error, datetime.now().isoformat(), job_id)
+            )
+        try:
+            self.archive_path(job_id).unlink()
+        except OSError:
+            pass
+
+
+class JobWorkerPool:
+    def __init__(self, queue, detector, workers=1, batch_size=16, poll_interval=1.0,
+                 is_busy=None, max_yield_seconds=2.0, priority_scope=None, on_records=None):
+        """
+        后台任务处理线程池；is_busy返回True时在批次之间让出推理资源给交互请求。
+        priority_scope返回上下文管理器，处理线程在其中执行推理（如进入推理调度的bulk类别）；
+        on_records(任务编号, 结果记录列表)在每批结果写入后调用（如写入预测日志）
+        """
+        self.queue = queue
+        self.detector = detector
+        self.workers = workers
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.is_busy = is_busy
+        self.max_yield_seconds = max_yield_seconds
+        self.priority_scope = priority_scope
+        self.on_records = on_records
+        self._stop = threading.Event()
+        self._threads = []
+
+        self.batches = 0
+        self.images = 0
+        self.yield_seconds = 0.0
+        self.budget_retries = 0
+
+    def start(self):
+        """恢复中断任务并启动处理线程"""
+        self.queue.recover()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        """任务处理统计信息"""
+        return {
+            'workers': self.workers,
+            'batch_size': self.batch_size,
+            'batches': self.batches,
+            'images': self.images,
+            'yield_seconds': round(self.yield_seconds, 3),
+            'budget_retries': self.budget_retries,
+            'jobs': self.queue.counts()
+        }
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                job = self.queue.claim_next()
+            except Exception as e:
+                logger.error(f"领取任务失败: {e}")
+                job = None
+            if job is None:
+                self._stop.wait(self.poll_interval)
+                continue
+
+            try:
+                # 停止时未完成的任务保持running状态，下次启动时恢复
+                with self.priority_scope() if self.priority_scope is not None else nullcontext():
+                    done = self._process(job)
+                if done:
+                    self.queue.finish(job['id'])
+            except Exception as e:
+                logger.error(f"任务 {job['id']} 处理失败: {e}")
+                self.queue.finish(job['id'], error=str(e))
+
+    def _yield_to_interactive(self):
+        """交互请求在途时短暂等待，最多等待max_yield_seconds避免任务饿死"""
+        if self.is_busy is None:
+            return
+        waited = 0.0
+        while self.is_busy() and waited < self.max_yield_seconds:
+            time.sleep(0.01)
+            waited += 0.01
+        self.yield_seconds += waited
+
+    def _process(self, job):
+        """分批处理任务，全部完成返回True"""
+        job_id = job['id']
+        processed = job['processed']
+        failed = job['failed']
+
+        with zipfile.ZipFile(self.queue.archive_path(job_id)) as archive, \
+                open(self.queue.result_path(job_id), 'a+b') as results:
+            # 丢弃上次中断时未记录进度的结果
+            results.truncate(job['result_offset'])
+            results.seek(job['result_offset'])
+
+            entries = self.queue.list_images(archive)
+            start = processed
+            while start < len(entries):
+                if self._stop.is_set():
+                    return False
+                self._yield_to_interactive()
+
+                batch = entries[start:start + self.batch_size]
+                # 先解析图像头部并限制尺寸，整批按估算大小在全局内存预算中预留后再解码
+                opened = []
+                raw_bytes = 0
+                for info in batch:
+                    if info.file_size > self.queue.max_image_bytes:
+                        opened.append((info.filename, None, "图像文件过大"))
+                        continue
+                    try:
+                        image, size = self.detector.open_image(archive.read(info))
+                        opened.append((info.filename, image, None))
+                        raw_bytes += size
+                    except Exception as e:
+                        opened.append((info.filename, None, str(e)))
+
+                try:
+                    with self.detector.reserve_images([image for _, image, _ in opened if image is not None], raw_bytes):
+                        decoded = []
+                        for filename, image, error in opened:
+                            try:
+                                decoded.append((filename, self.detector.decode_image(image) if image is not None else None, error))
+                            except Exception as e:
+                                decoded.append((filename, None, str(e)))
+                        images = [image for _, image, _ in decoded if image is not None]
+                        classified = iter(self.detector.classify_batch(images))
+                except MemoryBudgetExceeded:
+                    # 交互请求占满内存预算时稍后重试本批，不计为失败
+                    self.budget_retries += 1
+                    self._stop.wait(self.poll_interval)
+                    continue
+
+                records = []
+                for filename, image, error in decoded:
+                    classifications = next(classified) if image is not None else None
+                    if not classifications:
+                        failed += 1
+                    records.append(build_record(filename.split('/'), classifications, error))
+                results.write(''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in records).encode('utf-8'))
+                results.flush()
+
+                processed += len(batch)
+                start += len(batch)
+                self.batches += 1
+                self.images += len(batch)
+                self.queue.record_progress(job_id, processed, failed, results.tell())
+                if self.on_records is not None:
+                    self.on_records(job_id, records)
+        return True
@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+AI服务压测工具
+以不同并发度向 /detect 发送合成图像或样例目录中的图像，统计吞吐、延迟分位数、错误率与服务端内存，
+结果保存为JSON以便跨版本对比
+"""
+
+import io
+import sys
+import math
+import json
+import time
+import base64
+import random
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+try:
+    import requests
+    import numpy as np
+    from PIL import Image
+except ImportError as e:
+    print(f"❌ 导入失败: {e}")
+    sys.exit(1)
+
+SAMPLE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp'}
+
+
+def textured_pixels(width, height, rng):
+    """
+    带低频结构的合成图像：随机色块场（在哈希缩略图尺度上有明显梯度）叠加条纹与细噪声。
+    单纯的渐变加噪声在缩成9x8缩略图后是单调的，所有图像的dHash都是0，会被近重复缓存整体命中
+    """
+    def field(cells, channels):
+        grid = (rng.random((cells, cells, channels)) * 255).astype(np.uint8)
+        return np.asarray(Image.fromarray(grid.squeeze()).resize((width, height), Image.BICUBIC), dtype=np.float32) / 255
+
+    blobs = field(int(rng.integers(4, 12)), 3)
+    x = np.linspace(0, 1, width)[None, :, None]
+    y = np.linspace(0, 1, height)[:, None, None]
+    angle = rng.uniform(0, np.pi)
+    stripes = 0.5 + 0.5 * np.sin((x * np.cos(angle) + y * np.sin(angle)) * rng.uniform(10, 40) * np.pi)
+    noise = rng.normal(0, 0.05, (height, width, 3))
+    pixels = blobs * 0.75 + stripes * 0.2 * rng.uniform(0.3, 1.0, 3) + noise
+    return (np.clip(pixels, 0, 1) * 255).astype(np.uint8)
+
+
+def encode_jpeg(pixels, quality=90):
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, 'JPEG', quality=quality)
+    return buffer.getvalue()
+
+
+def make_synthetic_images(sizes, per_size, seed=42):
+    """生成带纹理的合成JPEG图像，每张图像的感知哈希互不相同"""
+    rng = np.random.default_rng(seed)
+    images = []
+    for width, height in sizes:
+        for i in range(per_size):
+            images.append((f"synthetic_{width}x{height}_{i}.jpg", encode_jpeg(textured_pixels(width, height, rng))))
+    return images
+
+
+class SyntheticImageSource:
+    def __init__(self, sizes, per_size, seed=42):
+        """
+        每个请求生成一张不同的图像：在预先生成的底图上叠加随机低频扰动后重新编码，
+        使近重复缓存与请求合并无法命中，压测的是推理本身
+        """
+        rng = np.random.default_rng(seed)
+        self.bases = [(width, height, textured_pixels(width, height, rng)) for width, height in sizes
+                      for _ in range(per_size)]
+        self.counter = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.bases)
+
+    def mean_bytes(self):
+        return int(sum(len(encode_jpeg(pixels)) for _, _, pixels in self.bases) / len(self.bases))
+
+    def pick(self, rng):
+        with self.lock:
+            self.counter += 1
+            index = self.counter
+        width, height, base = self.bases[rng.randrange(len(self.bases))]
+        noise_rng = np.random.default_rng([index, rng.getrandbits(32)])
+        cells = int(noise_rng.integers(3, 8))
+        grid = (noise_rng.random((cells, cells, 3)) * 255).astype(np.uint8)
+        overlay = np.asarray(Image.fromarray(grid).resize((width, height), Image.BILINEAR), dtype=np.int16)
+        pixels = np.clip(base.astype(np.int16) * 0.6 + overlay * 0.4, 0, 255).astype(np.uint8)
+        return f"synthetic_{width}x{height}_{index}.jpg", encode_jpeg(pixels)
+
+
+def load_sample_images(folder, limit):
+    """读取样例目录中的图像"""
+    paths = sorted(p for p in Path(folder).rglob('*') if p.suffix.lower() in SAMPLE_EXTENSIONS)
+    return [(p.name, p.read_bytes()) for p in paths[:limit]]
+
+
+def percentile(sorted_values, q):
+    """最近秩法分位数"""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, math.ceil(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class RequestSender:
+    def __init__(self, base_url, mode, images, batch_size, timeout):
+        """按模式构造并发送请求；images为图像列表，或每次生成新图像的SyntheticImageSource"""
+        self.base_url = base_url.rstrip('/')
+        self.mode = mode
+        self.images = images
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.local = threading.local()
+        self.unique = isinstance(images, SyntheticImageSource)
+        # 预先编码Base64，避免压测端的编码开销计入延迟
+        self.encoded = ([base64.b64encode(data).decode('ascii') for _, data in images]
+                        if mode == 'base64' and not self.unique else None)
+
+    def session(self):
+        if not hasattr(self.local, 'session'):
+            self.local.session = requests.Session()
+        return self.local.session
+
+    def pick(self, rng):
+        if self.unique:
+            return self.images.pick(rng)
+        return self.images[rng.randrange(len(self.images))]
+
+    def prepare(self, rng):
+        """构造请求负载（不计入延迟）"""
+        if self.mode == 'multipart':
+            name, data = self.pick(rng)
+            return {'files': {'image': (name, data, 'image/jpeg')}}, 1
+        if self.mode == 'base64':
+            if self.encoded is not None:
+                encoded = self.encoded[rng.randrange(len(self.encoded))]
+            else:
+                encoded = base64.b64encode(self.pick(rng)[1]).decode('ascii')
+            return {'json': {'image_data': encoded}}, 1
+        picks = [self.pick(rng) for _ in range(self.batch_size)]
+        return {'files': [('images', (name, data, 'image/jpeg')) for name, data in picks]}, len(picks)
+
+    def send(self, payload):
+        """发送一个请求，返回 (是否成功, 命中近重复缓存的图像数, 合并执行的图像数)"""
+        path = '/detect/batch' if self.mode == 'batch' else '/detect'
+        response = self.session().post(f"{self.base_url}{path}", timeout=self.timeout, **payload)
+        body = response.json()
+        results = body.get('results', []) if self.mode == 'batch' else [body]
+        cache_hits = sum(1 for result in results if (result.get('cache') or {}).get('hit'))
+        coalesced = sum(1 for result in results if result.get('coalesced'))
+        return response.status_code == 200 and body.get('success', False), cache_hits, coalesced
+
+
+class RssSampler:
+    def __init__(self, base_url, interval):
+        """后台轮询 /metrics 采样服务端常驻内存"""
+        self.url = base_url.rstrip('/') + '/metrics'
+        self.interval = interval
+        self.samples = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def sample(self):
+        try:
+            rss = requests.get(self.url, timeout=5).json().get('process', {}).get('rss_bytes')
+        except Exception:
+            rss = None
+        if rss is not None:
+            self.samples.append(rss)
+        return rss
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def __enter__(self):
+        self.sample()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.sample()
+
+    def summary(self):
+        if not self.samples:
+            return None
+        to_mb = lambda value: round(value / 1024 / 1024, 1)
+        return {'start_mb': to_mb(self.samples[0]), 'peak_mb': to_mb(max(self.samples)),
+                'end_mb': to_mb(self.samples[-1])}
+
+
+def run_level(sender, concurrency, duration, max_requests, rss_interval, seed):
+    """以固定并发度压测一轮"""
+    latencies = []
+    errors = 0
+    images_done = 0
+    cache_hits = 0
+    coalesced = 0
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+    issued = [0]
+
+    def worker(worker_id):
+        nonlocal errors, images_done, cache_hits, coalesced
+        rng = random.Random(seed + worker_id)
+        while time.perf_counter() < deadline:
+            with lock:
+                if max_requests and issued[0] >= max_requests:
+                    return
+                issued[0] += 1
+            payload, count = sender.prepare(rng)
+            start = time.perf_counter()
+            try:
+                ok, hits, merged = sender.send(payload)
+            except Exception:
+                ok, hits, merged = False, 0, 0
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                cache_hits += hits
+                coalesced += merged
+                if ok:
+                    images_done += count
+                else:
+                    errors += 1
+
+    with RssSampler(sender.base_url, rss_interval) as sampler:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for future in [pool.submit(worker, i) for i in range(concurrency)]:
+                future.result()
+        wall = time.perf_counter() - started
+
+    latencies.sort()
+    to_ms = lambda value: round(value * 1000, 2) if value is not None else None
+    total = len(latencies)
+    return {
+        'concurrency': concurrency,
+        'requests': total,
+        'errors': errors,
+        'error_rate': round(errors / total, 4) if total else 0.0,
+        'duration_seconds': round(wall, 3),
+        'throughput_rps': round(total / wall, 2) if wall > 0 else 0.0,
+        'images_per_second': round(images_done / wall, 2) if wall > 0 else 0.0,
+        # 服务端近重复缓存命中与请求合并的图像数，较高时延迟反映的是缓存而非推理
+        'cache_hits': cache_hits,
+        'coalesced': coalesced,
+        'cache_hit_rate': round(cache_hits / images_done, 4) if images_done else 0.0,
+        'latency_ms': {
+            'mean': to_ms(sum(latencies) / total) if total else None,
+            'p50': to_ms(percentile(latencies, 50)),
+            'p95': to_ms(percentile(latencies, 95)),
+            'p99': to_ms(percentile(latencies, 99)),
+            'max': to_ms(latencies[-1]) if total else None
+        },
+        'server_rss': sampler.summary()
+    }
+
+
+def compare_reports(previous, current):
+    """按并发度对比两次压测结果"""
+    print(f"\n📊 与 {previous['meta'].get('label') or previous['meta']['started_at']} 对比:")
+    baseline = {level['concurrency']: level for level in previous['levels']}
+    for level in current['levels']:
+        old = baseline.get(level['concurrency'])
+        if old is None:
+            continue
+        def delta(new_value, old_value):
+            if not old_value or new_value is None:
+                return "n/a"
+            return f"{(new_value - old_value) / old_value * 100:+.1f}%"
+        print(f"  并发 {level['concurrency']:>3}: 吞吐 {delta(level['throughput_rps'], old['throughput_rps'])}，"
+              f"p95 {delta(level['latency_ms']['p95'], old['latency_ms']['p95'])}，"
+              f"p99 {delta(level['latency_ms']['p99'], old['latency_ms']['p99'])}，"
+              f"错误率 {old['error_rate']:.2%} -> {level['error_rate']:.2%}")
+
+
+def main():
+    """压测主流程"""
+    parser = argparse.ArgumentParser(description='作物病害检测AI服务压测')
+    parser.add_argument('--url', type=str, default='http://localhost:5000', help='服务地址')
+    parser.add_argument('--mode', type=str, default='multipart', choices=['multipart', 'base64', 'batch'], help='请求模式')
+    parser.add_argument('--concurrency', type=str, default='1,2,4,8,16', help='并发度列表，逗号分隔')
+    parser.add_argument('--duration', type=float, default=30.0, help='每个并发度的压测时长（秒）')
+    parser.add_argument('--max-requests', type=int, default=0, help='每个并发度的最大请求数（0为不限）')
+    parser.add_argument('--samples', type=str, default=None, help='样例图像目录（不指定时使用合成图像）')
+    parser.add_argument('--sample-limit', type=int, default=200, help='最多读取的样例图像数')
+    parser.add_argument('--sizes', type=str, default='256x256,640x480,1920x1080', help='合成图像尺寸列表')
+    parser.add_argument('--per-size', type=int, default=4, help='每种尺寸的合成底图数')
+    parser.add_argument('--fixed-images', action='store_true',
+                        help='合成图像固定不变（默认每个请求生成不同的图像，避免命中缓存）')
+    parser.add_argument('--batch-size', type=int, default=8, help='batch模式下每个请求的图像数')
+    parser.add_argument('--timeout', type=float, default=60.0, help='单个请求超时（秒）')
+    parser.add_argument('--warmup', type=int, default=5, help='正式压测前的预热请求数')
+    parser.add_argument('--rss-interval', type=float, default=0.5, help='服务端内存采样间隔（秒）')
+    parser.add_argument('--label', type=str, default=None, help='本次压测标签（如版本号）')
+    parser.add_argument('--output', type=str, default=None, help='结果JSON路径')
+    parser.add_argument('--compare', type=str, default=None, help='与之前的结果JSON对比')
+    parser.add_argument('--seed', type=int, default=42, help='随机种子')
+
+    args = parser.parse_args()
+
+    if args.samples:
+        images = load_sample_images(args.samples, args.sample_limit)
+        source = f"samples:{args.samples}"
+    else:
+        sizes = [tuple(int(v) for v in size.split('x')) for size in args.sizes.split(',')]
+        if args.fixed_images:
+            images = make_synthetic_images(sizes, args.per_size, seed=args.seed)
+            source = f"synthetic:{args.sizes}"
+        else:
+            images = SyntheticImageSource(sizes, args.per_size, seed=args.seed)
+            source = f"synthetic-unique:{args.sizes}"
+    if not images:
+        print("❌ 没有可用的测试图像")
+        sys.exit(1)
+
+    try:
+        health = requests.get(f"{args.url.rstrip('/')}/health", timeout=10).json()
+    except Exception as e:
+        print(f"❌ 无法连接服务 {args.url}: {e}")
+        sys.exit(1)
+
+    sender = RequestSender(args.url, args.mode, images, args.batch_size, args.timeout)
+    levels = [int(level) for level in args.concurrency.split(',')]
+
+    print(f"🚀 压测 {args.url} 模式 {args.mode}，图像 {len(images)} 张 ({source})")
+    warmup_rng = random.Random(args.seed)
+    for _ in range(args.warmup):
+        try:
+            sender.send(sender.prepare(warmup_rng)[0])
+        except Exception:
+            pass
+
+    report = {
+        'meta': {
+            'label': args.label,
+            'started_at': datetime.now().isoformat(),
+            'url': args.url,
+            'mode': args.mode,
+            'batch_size': args.batch_size if args.mode == 'batch' else 1,
+            'image_source': source,
+            'image_count': len(images),
+            'mean_image_bytes': (images.mean_bytes() if isinstance(images, SyntheticImageSource)
+                                 else int(sum(len(data) for _, data in images) / len(images))),
+            'duration_per_level': args.duration,
+            'max_requests_per_level': args.max_requests,
+            'server': {key: health.get(key) for key in ('version', 'model_type', 'model_loaded')}
+        },
+        'levels': []
+    }
+
+    for concurrency in levels:
+        result = run_level(sender, concurrency, args.duration, args.max_requests, args.rss_interval,
+                           args.seed + concurrency * 1000)
+        report['levels'].append(result)
+        latency = result['latency_ms']
+        rss = result['server_rss']
+        print(f"  并发 {concurrency:>3}: {result['throughput_rps']:>8.2f} req/s  "
+              f"p50 {latency['p50']} ms  p95 {latency['p95']} ms  p99 {latency['p99']} ms  "
+              f"错误率 {result['error_rate']:.2%}  缓存命中 {result['cache_hits']}  合并 {result['coalesced']}  "
+              f"RSS峰值 {rss['peak_mb'] if rss else 'n/a'} MB")
+        if result['cache_hit_rate'] > 0.1:
+            print(f"  ⚠️ {result['cache_hit_rate']:.0%} 的图像命中近重复缓存，延迟主要反映缓存而非推理")
+
+    output = Path(args.output or f"load_test_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"💾 压测结果已保存: {output}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            compare_reports(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
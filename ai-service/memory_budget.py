@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+图像解码内存预算
+按图像头部信息估算解码内存，在全局预算内为在途请求预留内存；超大图像在解码前降采样或拒绝
+"""
+
+import math
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+from PIL import Image
+
+
+class ImageTooLargeError(ValueError):
+    """图像解码后的尺寸超出限制"""
+
+
+class MemoryBudgetExceeded(RuntimeError):
+    """等待内存预算超时"""
+
+
+def limit_decode_size(image, max_pixels, policy='downscale'):
+    """在解码前限制图像尺寸：JPEG利用draft在DCT域降采样，其它格式超出硬上限时拒绝"""
+    width, height = image.size
+    if width * height <= max_pixels:
+        return image
+    if policy == 'reject':
+        raise ImageTooLargeError(f"图像尺寸 {width}x{height} 超出上限 {max_pixels} 像素")
+
+    ratio = math.sqrt(max_pixels / (width * height))
+    if image.format == 'JPEG':
+        # draft只修改解码配置，不会触发解码
+        image.draft('RGB', (max(1, int(width * ratio)), max(1, int(height * ratio))))
+
+    # draft最多缩小到1/8，仍超出4倍上限（或格式不支持draft）时拒绝，避免完整解码巨型图像
+    if image.size[0] * image.size[1] > max_pixels * 4:
+        raise ImageTooLargeError(f"图像尺寸 {width}x{height} 过大，无法在内存限制内解码")
+    return image
+
+
+def shrink_to_limit(image, max_pixels):
+    """解码后缩小到像素上限以内"""
+    width, height = image.size
+    if width * height <= max_pixels:
+        return image
+    ratio = math.sqrt(max_pixels / (width * height))
+    return image.resize((max(1, int(width * ratio)), max(1, int(height * ratio))), Image.BILINEAR, reducing_gap=2.0)
+
+
+def estimate_decode_bytes(image, raw_bytes=0):
+    """估算处理一张图像的内存峰值：原始数据 + 解码缓冲 + 模式转换产生的RGB副本"""
+    width, height = image.size
+    bands = len(image.getbands()) if hasattr(image, 'getbands') else 3
+    decoded = width * height * max(bands, 1)
+    converted = width * height * 3 if image.mode != 'RGB' else 0
+    return raw_bytes + decoded + converted
+
+
+class MemoryBudget:
+    def __init__(self, limit_bytes, wait_timeout=5.0, history=1024):
+        """全局解码内存预算；limit_bytes<=0 表示不限制，只做统计"""
+        self.limit_bytes = limit_bytes
+        self.wait_timeout = wait_timeout
+        self._condition = threading.Condition()
+        self._history = deque(maxlen=history)
+
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.reservations = 0
+        self.waits = 0
+        self.rejected = 0
+        self.downscaled = 0
+        self.oversize_rejected = 0
+
+    @contextmanager
+    def reserve(self, nbytes):
+        """预留内存，预算不足时等待，超时抛出MemoryBudgetExceeded"""
+        # 单个请求超过总预算时按总预算计，保证其能在空闲时独占执行
+        if self.limit_bytes > 0:
+            nbytes = min(nbytes, self.limit_bytes)
+        with self._condition:
+            if self.limit_bytes > 0 and self.in_use + nbytes > self.limit_bytes:
+                self.waits += 1
+                if not self._condition.wait_for(lambda: self.in_use + nbytes <= self.limit_bytes,
+                                                timeout=self.wait_timeout):
+                    self.rejected += 1
+                    raise MemoryBudgetExceeded("服务内存繁忙，请稍后重试")
+            self.in_use += nbytes
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+            self.reservations += 1
+            self._history.append(nbytes)
+        try:
+            yield nbytes
+        finally:
+            with self._condition:
+                self.in_use -= nbytes
+                self._condition.notify_all()
+
+    def stats(self):
+        """内存预算统计信息"""
+        with self._condition:
+            history = sorted(self._history)
+        to_mb = lambda value: round(value / 1024 / 1024, 2)
+        per_request = None
+        if history:
+            per_request = {
+                'samples': len(history),
+                'p50_mb': to_mb(history[len(history) // 2]),
+                'p95_mb': to_mb(history[min(len(history) - 1, int(len(history) * 0.95))]),
+                'max_mb': to_mb(history[-1])
+            }
+        return {
+            'limit_mb': to_mb(self.limit_bytes) if self.limit_bytes > 0 else None,
+            'in_use_mb': to_mb(self.in_use),
+            'peak_in_use_mb': to_mb(self.peak_in_use),
+            'reservations': self.reservations,
+            'waits': self.waits,
+            'rejected': self.rejected,
+            'downscaled': self.downscaled,
+            'oversize_rejected': self.oversize_rejected,
+            # 每次预留的估算字节数分布（估算值，并非实测峰值）
+            'per_request_reserved': per_request
+        }
@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""
+作物专家模型路由
+轻量作物识别模型先判断作物种类，再由对应作物的专家模型识别病害；专家模型按需加载到带内存上限的LRU缓存，
+输出仍映射回通用的39类索引，响应格式保持不变
+"""
+
+import time
+import logging
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+def crop_of(class_name):
+    """类别名称对应的作物（类别名前缀）"""
+    return class_name.split("___", 1)[0]
+
+
+def estimate_model_bytes(model, model_path):
+    """估算模型常驻内存：优先统计参数与缓冲区大小，无法获取时按权重文件大小的2倍估计"""
+    try:
+        module = model.model
+        tensors = list(module.parameters()) + list(module.buffers())
+        return sum(t.numel() * t.element_size() for t in tensors)
+    except Exception:
+        return Path(model_path).stat().st_size * 2
+
+
+class SpecialistModelCache:
+    def __init__(self, loader, model_dir, max_bytes=512 * 1024 * 1024, max_models=4):
+        """按作物加载专家模型（model_dir/<作物>.pt），超出数量或内存上限时淘汰最久未使用的模型"""
+        self.loader = loader
+        self.model_dir = Path(model_dir)
+        self.max_bytes = max_bytes
+        self.max_models = max_models
+
+        # 作物 -> (模型, 估算字节数)
+        self._models = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.load_failures = 0
+        self.evictions = 0
+        self.load_seconds_total = 0.0
+        self.load_seconds_max = 0.0
+
+    def model_path(self, crop):
+        return self.model_dir / f"{crop}.pt"
+
+    def available(self, crop):
+        return self.model_path(crop).exists()
+
+    def get(self, crop):
+        """获取作物专家模型，不存在时返回None"""
+        with self._lock:
+            entry = self._models.get(crop)
+            if entry is not None:
+                self._models.move_to_end(crop)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            load_lock = self._load_locks.setdefault(crop, threading.Lock())
+
+        if not self.available(crop):
+            return None
+
+        # 同一作物只加载一次，其他请求等待加载完成
+        with load_lock:
+            with self._lock:
+                entry = self._models.get(crop)
+                if entry is not None:
+                    self._models.move_to_end(crop)
+                    return entry[0]
+
+            start = time.perf_counter()
+            try:
+                model = self.loader(str(self.model_path(crop)))
+            except Exception as e:
+                self.load_failures += 1
+                logger.error(f"专家模型加载失败 {crop}: {e}")
+                return None
+            elapsed = time.perf_counter() - start
+            size = estimate_model_bytes(model, self.model_path(crop))
+
+            with self._lock:
+                self.loads += 1
+                self.load_seconds_total += elapsed
+                self.load_seconds_max = max(self.load_seconds_max, elapsed)
+                self._models[crop] = (model, size)
+                self._evict()
+            logger.info(f"专家模型 {crop} 加载完成，用时 {elapsed:.2f}s，约 {size / 1024 / 1024:.1f}MB")
+            return model
+
+    def _evict(self):
+        """淘汰最久未使用的模型，至少保留刚加载的一个"""
+        while len(self._models) > 1 and (
+                len(self._models) > self.max_models or
+                sum(size for _, size in self._models.values()) > self.max_bytes):
+            crop, _ = self._models.popitem(last=False)
+            self.evictions += 1
+            logger.info(f"淘汰专家模型: {crop}")
+
+    def stats(self):
+        """缓存统计信息"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            resident_bytes = sum(size for _, size in self._models.values())
+            return {
+                'resident': list(self._models.keys()),
+                'resident_mb': round(resident_bytes / 1024 / 1024, 1),
+                'max_mb': round(self.max_bytes / 1024 / 1024, 1),
+                'max_models': self.max_models,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'loads': self.loads,
+                'load_failures': self.load_failures,
+                'evictions': self.evictions,
+                'load_ms_mean': round(self.load_seconds_total / self.loads * 1000, 1) if self.loads else None,
+                'load_ms_max': round(self.load_seconds_max * 1000, 1) if self.loads else None
+            }
+
+
+class RoutedProbs:
+    def __init__(self, top5, top5conf):
+        """与ultralytics Probs一致的Top-5属性（索引为通用类别索引）"""
+        self.top5 = top5
+        self.top5conf = top5conf
+        self.top1 = top5[0] if top5 else None
+
+
+class RoutedResult:
+    def __init__(self, top5, top5conf, crop):
+        self.probs = RoutedProbs(top5, top5conf)
+        self.crop = crop
+
+
+class CropRoutedModel:
+    def __init__(self, router, specialists, fallback, class_names):
+        """以与通用模型相同的调用方式执行作物路由 + 专家分类"""
+        self.router = router
+        self.specialists = specialists
+        self.fallback = fallback
+        self.class_names = class_names
+        self.names = {i: name for i, name in enumerate(class_names)}
+        self.class_index = {name: i for i, name in enumerate(class_names)}
+
+        # 只有一个类别的作物无需专家模型
+        self.crop_classes = {}
+        for name in class_names:
+            self.crop_classes.setdefault(crop_of(name), []).append(name)
+
+        # 多个推理线程并发调用，统计计数需加锁
+        self._stats_lock = threading.Lock()
+        self.routed = {}
+        self.fallbacks = 0
+
+    def _map_specialist(self, crop, result):
+        """将专家模型输出映射为通用类别索引"""
+        top5, confidences = [], []
+        names = result.names
+        for idx, conf in zip(result.probs.top5, result.probs.top5conf):
+            name = names[int(idx)]
+            full_name = name if name in self.class_index else f"{crop}___{name}"
+            if full_name in self.class_index:
+                top5.append(self.class_index[full_name])
+                confidences.append(float(conf))
+        return top5, confidences
+
+    def __call__(self, source, verbose=False, **kwargs):
+        """kwargs（如降级时的imgsz）原样传给作物识别、专家与通用模型"""
+        images = list(source) if isinstance(source, (list, tuple)) else [source]
+        crop_results = self.router(images, verbose=False, **kwargs)
+
+        outputs = [None] * len(images)
+        groups = {}
+        for i, crop_result in enumerate(crop_results):
+            crop = crop_result.names[crop_result.probs.top1]
+            crop_conf = float(crop_result.probs.top1conf)
+            with self._stats_lock:
+                self.routed[crop] = self.routed.get(crop, 0) + 1
+            if len(self.crop_classes.get(crop, [])) == 1:
+                name = self.crop_classes[crop][0]
+                outputs[i] = RoutedResult([self.class_index[name]], [crop_conf], crop)
+            else:
+                groups.setdefault(crop, []).append((i, crop_conf))
+
+        # 同一作物的图像合并为一批交给专家模型
+        fallback_indices = []
+        for crop, members in groups.items():
+            specialist = self.specialists.get(crop) if crop in self.crop_classes else None
+            if specialist is None:
+                fallback_indices.extend(i for i, _ in members)
+                continue
+            results = specialist([images[i] for i, _ in members], verbose=False, **kwargs)
+            for (i, crop_conf), result in zip(members, results):
+                top5, confidences = self._map_specialist(crop, result)
+                # 联合概率 = 作物置信度 × 病害置信度
+                outputs[i] = RoutedResult(top5, [crop_conf * conf for conf in confidences], crop)
+
+        # 没有专家模型的作物交给通用模型
+        if fallback_indices:
+            with self._stats_lock:
+                self.fallbacks += len(fallback_indices)
+            fallback_results = self.fallback([images[i] for i in fallback_indices], verbose=False, **kwargs)
+            for i, result in zip(fallback_indices, fallback_results):
+                outputs[i] = result
+        return outputs
+
+    def stats(self):
+        """路由统计信息"""
+        with self._stats_lock:
+            routed, fallbacks = dict(self.routed), self.fallbacks
+        return {
+            'routed_by_crop': routed,
+            'fallbacks': fallbacks,
+            'specialist_cache': self.specialists.stats()
+        }
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+预融合模型快照
+首次加载权重后，将融合完成、处于推理模式的FP32网络序列化到权重文件旁；
+之后启动时以内存映射方式加载快照，跳过 ultralytics 的模型构建、FP16转换与层融合。
+源权重的大小、修改时间、SHA-256或 torch / ultralytics 版本变化时快照自动失效；
+生成快照时在合成图像上与原始模型比较Top-1，不一致时不保存
+"""
+
+import os
+import json
+import time
+import logging
+from pathlib import Path
+
+from backend_selector import make_benchmark_images, probabilities
+from compiled_model import DirectClassifier, file_digest, fuse_for_inference, model_imgsz
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FORMAT = 1
+
+
+def snapshot_paths(model_path):
+    """快照文件与描述文件路径，如 crop_disease_yolo.fused.pt / crop_disease_yolo.fused.json"""
+    model_path = Path(model_path)
+    return (model_path.parent / f"{model_path.stem}.fused.pt",
+            model_path.parent / f"{model_path.stem}.fused.json")
+
+
+def runtime_versions():
+    import torch
+    try:
+        import ultralytics
+        ultralytics_version = ultralytics.__version__
+    except Exception:
+        ultralytics_version = None
+    return {'torch': torch.__version__, 'ultralytics': ultralytics_version}
+
+
+def source_fingerprint(model_path):
+    stat = Path(model_path).stat()
+    return {
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'sha256': file_digest(model_path)
+    }
+
+
+def snapshot_is_valid(model_path):
+    """检查快照是否与当前权重和运行环境匹配，返回 (是否有效, 原因)"""
+    snapshot_path, meta_path = snapshot_paths(model_path)
+    if not snapshot_path.exists() or not meta_path.exists():
+        return False, '快照不存在'
+    try:
+        meta = json.loads(meta_path.read_text(encoding='utf-8'))
+    except (OSError, json.JSONDecodeError):
+        return False, '快照描述文件损坏'
+    if meta.get('format') != SNAPSHOT_FORMAT or meta.get('versions') != runtime_versions():
+        return False, '运行环境版本已变化'
+
+    source = meta.get('source', {})
+    stat = Path(model_path).stat()
+    if stat.st_size != source.get('size'):
+        return False, '权重文件已变化'
+    # 修改时间变化时再比较内容摘要，避免仅被touch或重新拷贝的权重导致快照重建
+    if stat.st_mtime_ns != source.get('mtime_ns') and file_digest(model_path) != source.get('sha256'):
+        return False, '权重文件已变化'
+    return True, None
+
+
+def load_snapshot(model_path):
+    """以内存映射方式加载快照，返回 (DirectClassifier, None)；快照缺失或失效时返回 (None, 原因)"""
+    import torch
+    valid, reason = snapshot_is_valid(model_path)
+    if not valid:
+        return None, reason
+    snapshot_path, _ = snapshot_paths(model_path)
+    try:
+        try:
+            snapshot = torch.load(str(snapshot_path), map_location='cpu', mmap=True, weights_only=False)
+        except TypeError:
+            # torch 2.1 之前不支持mmap参数，退回普通加载
+            snapshot = torch.load(str(snapshot_path), map_location='cpu', weights_only=False)
+    except Exception as e:
+        logger.warning(f"快照加载失败: {e}")
+        return None, f"快照加载失败: {e}"
+    return DirectClassifier(snapshot['model'], snapshot['names'], snapshot['imgsz']), None
+
+
+def save_snapshot(yolo, model_path):
+    """
+    融合网络并保存快照，返回 (基于融合网络的 DirectClassifier, Top-1一致率)；
+    与原始模型的Top-1不完全一致时抛出ValueError，不写入快照
+    """
+    import torch
+    # 先以未融合的原始模型在合成图像上计算参考输出，融合会原地修改网络
+    module = yolo.model
+    names = dict(yolo.names)
+    imgsz = model_imgsz(module)
+    images = make_benchmark_images(8, size=imgsz)
+    expected = probabilities(yolo(images, verbose=False)).argmax(axis=1)
+    module = fuse_for_inference(module)
+    direct = DirectClassifier(module, names, imgsz)
+    agreement = float((probabilities(direct(images, verbose=False)).argmax(axis=1) == expected).mean())
+    if agreement < 1.0:
+        raise ValueError(f"快照与原始模型的Top-1一致率为 {agreement:.2%}")
+    snapshot_path, meta_path = snapshot_paths(model_path)
+
+    # 先写临时文件再替换；描述文件最后写入，描述文件存在即表示快照完整
+    if meta_path.exists():
+        meta_path.unlink()
+    tmp_path = snapshot_path.with_suffix(f".{os.getpid()}.tmp")
+    torch.save({'model': module, 'names': names, 'imgsz': imgsz}, str(tmp_path))
+    os.replace(tmp_path, snapshot_path)
+    meta = {
+        'format': SNAPSHOT_FORMAT,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'versions': runtime_versions(),
+        'source': source_fingerprint(model_path),
+        'imgsz': imgsz,
+        'top1_agreement': agreement
+    }
+    tmp_meta = meta_path.with_suffix(f".{os.getpid()}.tmp")
+    tmp_meta.write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding='utf-8')
+    os.replace(tmp_meta, meta_path)
+    return direct, agreement
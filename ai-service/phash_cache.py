@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+感知哈希近重复结果缓存
+固定机位和连拍图像几乎相同但字节不同，按dHash汉明距离复用最近的分类结果。
+纯色、低纹理图像的dHash几乎全部相同，这类图像不参与缓存；命中时还要求颜色签名接近
+"""
+
+import copy
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from PIL import Image
+
+# dhash: 差值哈希; colour: 4x4 RGB缩略图像素; gradients: 相邻像素差异明显的位置数
+ImageFingerprint = namedtuple('ImageFingerprint', ['dhash', 'colour', 'gradients'])
+
+
+def _dhash_bits(pixels, hash_size, gradient_threshold=0):
+    value = 0
+    gradients = 0
+    width = hash_size + 1
+    for row in range(hash_size):
+        offset = row * width
+        for col in range(hash_size):
+            left, right = pixels[offset + col], pixels[offset + col + 1]
+            value = (value << 1) | (left > right)
+            gradients += abs(left - right) > gradient_threshold
+    return value, gradients
+
+
+def compute_dhash(image, hash_size=8):
+    """计算图像的dHash（差值哈希），返回hash_size*hash_size位整数"""
+    # 先在RGB上缩成极小缩略图再转灰度，避免对整幅大图做灰度转换
+    thumb = image.resize((hash_size + 1, hash_size), Image.BILINEAR, reducing_gap=2.0)
+    return _dhash_bits(list(thumb.convert('L').getdata()), hash_size)[0]
+
+
+def compute_fingerprint(image, hash_size=8, gradient_threshold=2):
+    """计算dHash、颜色签名与梯度数，用于判断图像是否足以按哈希复用结果"""
+    thumb = image.resize((hash_size + 1, hash_size), Image.BILINEAR, reducing_gap=2.0)
+    value, gradients = _dhash_bits(list(thumb.convert('L').getdata()), hash_size, gradient_threshold)
+    colour = bytes(thumb.resize((4, 4), Image.BILINEAR).convert('RGB').tobytes())
+    return ImageFingerprint(value, colour, gradients)
+
+
+def colour_distance(a, b):
+    """两个颜色签名的最大通道差"""
+    return max(abs(x - y) for x, y in zip(a, b))
+
+
+def hamming_distance(a, b):
+    """两个哈希值的汉明距离"""
+    return bin(a ^ b).count('1')
+
+
+class PerceptualHashCache:
+    def __init__(self, max_entries=512, max_distance=4, ttl_seconds=300, eviction='lru',
+                 min_gradients=16, max_colour_distance=24):
+        """
+        初始化感知哈希缓存。梯度数少于min_gradients的图像（纯色、低纹理）不查找也不写入；
+        汉明距离在阈值内的条目还需颜色签名的最大通道差不超过max_colour_distance才算命中
+        """
+        if eviction not in ('lru', 'fifo'):
+            raise ValueError(f"不支持的淘汰策略: {eviction}")
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self.ttl_seconds = ttl_seconds
+        self.eviction = eviction
+        self.min_gradients = min_gradients
+        self.max_colour_distance = max_colour_distance
+
+        # 哈希值 -> (写入时间, 颜色签名, 分类结果列表)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.exact_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.skipped = 0
+        self.colour_rejects = 0
+
+    def cacheable(self, fingerprint):
+        """哈希全0、全1或梯度过少的图像无法区分，不参与缓存"""
+        return fingerprint.dhash not in (0, (1 << 64) - 1) and fingerprint.gradients >= self.min_gradients
+
+    def _expired(self, stored_at, now):
+        return self.ttl_seconds > 0 and now - stored_at > self.ttl_seconds
+
+    def lookup(self, fingerprint):
+        """查找汉明距离在阈值内且颜色接近的最近结果，返回 (分类结果副本, 距离) 或 None"""
+        if not self.cacheable(fingerprint):
+            with self._lock:
+                self.skipped += 1
+            return None
+        now = time.time()
+        image_hash = fingerprint.dhash
+        with self._lock:
+            best_hash, best_distance = None, self.max_distance + 1
+            rejected = False
+            expired = []
+            for key, (stored_at, colour, _) in self._entries.items():
+                if self._expired(stored_at, now):
+                    expired.append(key)
+                    continue
+                distance = hamming_distance(key, image_hash)
+                if distance >= best_distance:
+                    continue
+                if colour_distance(colour, fingerprint.colour) > self.max_colour_distance:
+                    rejected = True
+                    continue
+                best_hash, best_distance = key, distance
+                if distance == 0:
+                    break
+            for key in expired:
+                del self._entries[key]
+                self.evictions += 1
+
+            if best_hash is None:
+                self.misses += 1
+                self.colour_rejects += rejected
+                return None
+
+            self.hits += 1
+            if best_distance == 0:
+                self.exact_hits += 1
+            if self.eviction == 'lru':
+                self._entries.move_to_end(best_hash)
+            # 返回副本，避免各响应共享并修改同一份结果
+            return copy.deepcopy(self._entries[best_hash][2]), best_distance
+
+    def store(self, fingerprint, classifications):
+        """写入分类结果，超出容量时按策略淘汰；无法区分的图像不写入"""
+        if self.max_entries <= 0 or not self.cacheable(fingerprint):
+            return
+        with self._lock:
+            if fingerprint.dhash in self._entries:
+                del self._entries[fingerprint.dhash]
+            self._entries[fingerprint.dhash] = (time.time(), fingerprint.colour, copy.deepcopy(classifications))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """缓存统计信息"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'max_distance': self.max_distance,
+                'ttl_seconds': self.ttl_seconds,
+                'eviction': self.eviction,
+                'hits': self.hits,
+                'exact_hits': self.exact_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'skipped_low_texture': self.skipped,
+                'colour_rejects': self.colour_rejects,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+            }
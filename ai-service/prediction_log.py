@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+"""
+预测结果异步日志
+检测接口只把记录放入有界队列，后台线程批量写入按大小/时间滚动的压缩JSONL或Parquet文件，
+队列满时丢弃或溢写到磁盘，服务退出时写完剩余记录
+"""
+
+import os
+import gzip
+import json
+import time
+import queue
+import logging
+import threading
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# Parquet列定义，JSONL输出使用相同字段
+PREDICTION_FIELDS = [
+    ('detection_id', 'string'),
+    ('timestamp', 'string'),
+    ('endpoint', 'string'),
+    ('success', 'bool'),
+    ('error', 'string'),
+    ('class_name', 'string'),
+    ('confidence', 'float64'),
+    ('top5', 'string'),
+    ('processing_time', 'float64'),
+    ('model_type', 'string'),
+    ('quality', 'string'),
+    ('coalesced', 'bool'),
+    ('cache_hit', 'bool')
+]
+
+
+class _JsonlSegment:
+    """gzip压缩的JSONL分段，每次批量写入追加一个gzip成员"""
+    suffix = '.jsonl.gz'
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'ab')
+
+    def write(self, records):
+        lines = ''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in records)
+        self.file.write(gzip.compress(lines.encode('utf-8'), compresslevel=6))
+        self.file.flush()
+
+    def size(self):
+        return self.file.tell()
+
+    def close(self):
+        self.file.close()
+
+
+class _ParquetSegment:
+    """zstd压缩的Parquet分段，每次批量写入追加一个行组"""
+    suffix = '.parquet'
+
+    def __init__(self, path):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        self.pa = pa
+        self.path = path
+        self.schema = pa.schema([(name, getattr(pa, 'bool_' if kind == 'bool' else kind)())
+                                 for name, kind in PREDICTION_FIELDS])
+        self.writer = pq.ParquetWriter(path, self.schema, compression='zstd')
+
+    def write(self, records):
+        rows = [dict(record, top5=json.dumps(record.get('top5'), ensure_ascii=False)) for record in records]
+        self.writer.write_table(self.pa.Table.from_pylist(rows, schema=self.schema))
+
+    def size(self):
+        return self.path.stat().st_size
+
+    def close(self):
+        self.writer.close()
+
+
+class PredictionLogger:
+    def __init__(self, directory, output_format='jsonl', queue_size=10000, batch_size=256, flush_interval=1.0,
+                 rotate_bytes=64 * 1024 * 1024, rotate_seconds=3600, overflow='drop'):
+        """
+        初始化预测日志；overflow为drop时队列满直接丢弃，为spill时写入溢写文件，队列空闲后再并入正式分段。
+        正在写入的分段以 .part 结尾，滚动后才改为正式文件名
+        """
+        if overflow not in ('drop', 'spill'):
+            raise ValueError(f"不支持的溢出策略: {overflow}")
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.output_format = output_format
+        if output_format == 'parquet':
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                logger.warning("未安装pyarrow，预测日志改用JSONL格式")
+                self.output_format = 'jsonl'
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.rotate_bytes = rotate_bytes
+        self.rotate_seconds = rotate_seconds
+        self.overflow = overflow
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._segment = None
+        self._segment_opened = 0.0
+        self._spill_path = self.directory / "spill.jsonl"
+        self._spill_lock = threading.Lock()
+        self._stopping = threading.Event()
+
+        self.logged = 0
+        self.written = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.flushes = 0
+        self.write_errors = 0
+        self.segments = 0
+
+        # 上次异常退出遗留的未完成JSONL分段中已写入的gzip成员仍可读取，直接改为正式文件；
+        # Parquet分段缺少文件尾无法读取，保留原文件供人工处理
+        for stale in self.directory.glob("*.jsonl.gz.part"):
+            os.replace(stale, stale.with_suffix(''))
+
+        self._thread = threading.Thread(target=self._run, name="prediction-log", daemon=True)
+        self._thread.start()
+
+    def log(self, record):
+        """记录一条预测，不阻塞调用方"""
+        self.logged += 1
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            if self.overflow == 'spill':
+                self._spill(record)
+            else:
+                self.dropped += 1
+
+    def _spill(self, record):
+        try:
+            with self._spill_lock:
+                with open(self._spill_path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + '\n')
+            self.spilled += 1
+        except OSError as e:
+            self.dropped += 1
+            logger.error(f"预测日志溢写失败: {e}")
+
+    def _open_segment(self):
+        segment_type = _ParquetSegment if self.output_format == 'parquet' else _JsonlSegment
+        name = f"predictions-{time.strftime('%Y%m%d_%H%M%S')}-{int(time.time() * 1000) % 1000:03d}{segment_type.suffix}"
+        self._segment = segment_type(self.directory / f"{name}.part")
+        self._segment_opened = time.time()
+        self.segments += 1
+
+    def _close_segment(self):
+        if self._segment is None:
+            return
+        self._segment.close()
+        os.replace(self._segment.path, self._segment.path.with_suffix(''))
+        self._segment = None
+
+    def _write(self, records):
+        """写入一批记录，失败时返回False"""
+        if not records:
+            return True
+        try:
+            if self._segment is None:
+                self._open_segment()
+            self._segment.write(records)
+            self.written += len(records)
+            self.flushes += 1
+            if self._segment.size() >= self.rotate_bytes or time.time() - self._segment_opened >= self.rotate_seconds:
+                self._close_segment()
+            return True
+        except Exception as e:
+            self.write_errors += 1
+            logger.error(f"预测日志写入失败: {e}")
+            return False
+
+    def _replay_spill(self):
+        """
+        队列空闲时把溢写文件中的记录并入正式分段；上次中断时未并入完的记录优先处理。
+        写入失败时把尚未写入的记录留在 .replay 文件中，下次再试，全部写入后才删除
+        """
+        replay_path = self._spill_path.with_suffix('.replay')
+        if not replay_path.exists():
+            with self._spill_lock:
+                if not self._spill_path.exists():
+                    return
+                os.replace(self._spill_path, replay_path)
+        with open(replay_path, 'r', encoding='utf-8') as f:
+            while True:
+                # 记录当前批次的起始位置，写入失败时从这里保留剩余记录
+                position = f.tell()
+                lines = [line for line in (f.readline() for _ in range(self.batch_size)) if line]
+                if not lines:
+                    break
+                records = []
+                for line in lines:
+                    try:
+                        records.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        continue
+                if not self._write(records):
+                    self._keep_unreplayed(f, position, replay_path)
+                    return
+        replay_path.unlink()
+
+    def _keep_unreplayed(self, f, position, replay_path):
+        """只保留 .replay 文件中从position起尚未写入的记录"""
+        f.seek(position)
+        remaining_path = replay_path.with_suffix('.remaining')
+        with open(remaining_path, 'w', encoding='utf-8') as out:
+            for line in f:
+                out.write(line)
+        os.replace(remaining_path, replay_path)
+
+    def _drain(self, limit):
+        records = []
+        while len(records) < limit:
+            try:
+                records.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return records
+
+    def _run(self):
+        while not self._stopping.is_set():
+            # 攒满一批或到达刷新间隔时写入一次
+            records = []
+            deadline = time.time() + self.flush_interval
+            while len(records) < self.batch_size and not self._stopping.is_set():
+                timeout = deadline - time.time()
+                if timeout <= 0:
+                    break
+                try:
+                    records.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+                records.extend(self._drain(self.batch_size - len(records)))
+            self._write(records)
+
+            if self._queue.qsize() == 0:
+                self._replay_spill()
+            if self._segment is not None and time.time() - self._segment_opened >= self.rotate_seconds:
+                self._close_segment()
+
+        # 停止时由后台线程自己写完剩余记录并关闭分段，分段始终只有一个写入线程
+        while True:
+            records = self._drain(self.batch_size)
+            if not records:
+                break
+            self._write(records)
+        self._replay_spill()
+        self._close_segment()
+
+    def close(self, timeout=10.0):
+        """停止后台线程，等待其写完队列与溢写文件中剩余的记录并关闭当前分段"""
+        if self._stopping.is_set():
+            return
+        self._stopping.set()
+        self._thread.join(timeout=timeout)
+        if self._thread.is_alive():
+            # 后台线程仍在写入，不在此处并发关闭分段；未关闭的JSONL分段在下次启动时恢复
+            logger.warning(f"预测日志后台线程 {timeout}s 内未退出，剩余 {self._queue.qsize()} 条记录未写入")
+
+    def stats(self):
+        """预测日志统计信息"""
+        return {
+            'directory': str(self.directory),
+            'format': self.output_format,
+            'overflow': self.overflow,
+            'queued': self._queue.qsize(),
+            'logged': self.logged,
+            'written': self.written,
+            'dropped': self.dropped,
+            'spilled': self.spilled,
+            'flushes': self.flushes,
+            'write_errors': self.write_errors,
+            'segments': self.segments
+        }
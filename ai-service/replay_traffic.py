@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+流量回放工具
+按原始到达间隔（可加速N倍）将 traffic_capture 采集的 /detect 请求回放到候选版本，
+输出与采集时的延迟、吞吐对比
+"""
+
+import sys
+import json
+import hashlib
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+from load_test import textured_pixels, encode_jpeg, percentile
+
+try:
+    import requests
+    import numpy as np
+except ImportError as e:
+    print(f"❌ 导入失败: {e}")
+    sys.exit(1)
+
+
+def load_entries(capture_dir):
+    """读取采集目录（或单个分段）中的全部请求记录，按到达时间排序"""
+    capture_dir = Path(capture_dir)
+    segments = [capture_dir] if (capture_dir / "requests.jsonl").exists() \
+        else sorted(path for path in capture_dir.glob("segment-*") if path.is_dir())
+    entries = []
+    for segment in segments:
+        with open(segment / "requests.jsonl", 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # 采集进程中断时最后一行可能不完整
+                    continue
+                entry['segment'] = segment
+                entries.append(entry)
+    entries.sort(key=lambda entry: entry['arrival'])
+    return entries
+
+
+class PayloadSource:
+    def __init__(self):
+        """
+        提供回放负载：优先读取保存的原始负载，仅有引用时按摘要合成同尺寸的带纹理图像。
+        合成图像以请求摘要为种子，原始内容相同的请求得到相同图像，不同请求的图像互不相同
+        """
+        self._lock = threading.Lock()
+        self.synthesized = 0
+
+    @staticmethod
+    def has_blob(entry):
+        return (entry['segment'] / "blobs" / entry['sha256']).exists()
+
+    def get(self, entry):
+        blob = entry['segment'] / "blobs" / entry['sha256']
+        if blob.exists():
+            return entry['kind'], blob.read_bytes()
+
+        width, height = entry.get('width'), entry.get('height')
+        if not width or not height:
+            return None, None
+        seed = int(hashlib.sha256(entry['sha256'].encode('ascii')).hexdigest()[:16], 16)
+        payload = encode_jpeg(textured_pixels(width, height, np.random.default_rng(seed)))
+        with self._lock:
+            self.synthesized += 1
+        # 合成负载统一以multipart发送
+        return 'multipart', payload
+
+
+def summarize(values):
+    """延迟分位数（毫秒）"""
+    values = sorted(value for value in values if value is not None)
+    to_ms = lambda value: round(value * 1000, 2) if value is not None else None
+    return {
+        'count': len(values),
+        'p50': to_ms(percentile(values, 50)),
+        'p95': to_ms(percentile(values, 95)),
+        'p99': to_ms(percentile(values, 99)),
+        'max': to_ms(values[-1]) if values else None
+    }
+
+
+def diff(recorded, replayed):
+    """相对变化"""
+    if recorded in (None, 0) or replayed is None:
+        return None
+    return round((replayed - recorded) / recorded, 4)
+
+
+def main():
+    """回放主流程"""
+    parser = argparse.ArgumentParser(description='作物病害检测流量回放')
+    parser.add_argument('capture', type=str, help='采集目录或单个分段目录')
+    parser.add_argument('--url', type=str, default='http://localhost:5000', help='候选服务地址')
+    parser.add_argument('--speed', type=float, default=1.0, help='回放速度倍数（2表示2倍速）')
+    parser.add_argument('--limit', type=int, default=0, help='最多回放的请求数（0为全部）')
+    parser.add_argument('--max-inflight', type=int, default=64, help='最大在途请求数')
+    parser.add_argument('--timeout', type=float, default=60.0, help='单个请求超时（秒）')
+    parser.add_argument('--label', type=str, default=None, help='候选版本标签')
+    parser.add_argument('--output', type=str, default=None, help='结果JSON路径')
+    parser.add_argument('--allow-synthetic', action='store_true',
+                        help='允许回放只记录了摘要的请求（以合成图像代替，延迟对比仅供参考）')
+
+    args = parser.parse_args()
+
+    entries = load_entries(args.capture)
+    if args.limit:
+        entries = entries[:args.limit]
+    if not entries:
+        print("❌ 没有可回放的请求")
+        sys.exit(1)
+
+    reference_only = sum(1 for entry in entries if not PayloadSource.has_blob(entry))
+    if reference_only and not args.allow_synthetic:
+        print(f"❌ {reference_only} 个请求只记录了摘要（reference模式），没有原始负载；"
+              f"合成图像与真实图像的推理开销不同，如仍需回放请加 --allow-synthetic")
+        sys.exit(1)
+
+    source = PayloadSource()
+    local = threading.local()
+    results = [None] * len(entries)
+    base_url = args.url.rstrip('/')
+
+    def send(index, entry, scheduled):
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        lag = time.perf_counter() - scheduled
+        kind, payload = source.get(entry)
+        if payload is None:
+            results[index] = {'skipped': True}
+            return
+        start = time.perf_counter()
+        try:
+            if kind == 'json':
+                response = local.session.post(f"{base_url}{entry['endpoint']}", data=payload,
+                                              headers={'Content-Type': 'application/json'}, timeout=args.timeout)
+            else:
+                response = local.session.post(f"{base_url}{entry['endpoint']}",
+                                              files={'image': (entry.get('filename') or 'replay.jpg', payload)},
+                                              timeout=args.timeout)
+            body = response.json()
+            ok = response.status_code == 200 and body.get('success', False)
+            server_time = body.get('processing_time')
+            cache_hit = bool((body.get('cache') or {}).get('hit'))
+            coalesced = bool(body.get('coalesced'))
+        except Exception:
+            ok, server_time, cache_hit, coalesced = False, None, False, False
+        results[index] = {'ok': ok, 'latency': time.perf_counter() - start, 'server_time': server_time,
+                          'cache_hit': cache_hit, 'coalesced': coalesced,
+                          'lag': lag, 'finished': time.perf_counter()}
+
+    first_arrival = entries[0]['arrival']
+    recorded_span = entries[-1]['arrival'] - first_arrival
+    print(f"🚀 回放 {len(entries)} 个请求到 {base_url}（原始时长 {recorded_span:.1f} 秒，{args.speed}x）")
+
+    # 开环调度：按到达时间发出请求，不等待前一个请求完成
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.max_inflight) as pool:
+        for index, entry in enumerate(entries):
+            scheduled = start + (entry['arrival'] - first_arrival) / args.speed
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(send, index, entry, scheduled)
+    done = [result for result in results if result and not result.get('skipped')]
+    wall = (max(result['finished'] for result in done) - start) if done else 0.0
+
+    errors = sum(1 for result in done if not result['ok'])
+    recorded_server = summarize([entry.get('processing_time') for entry in entries])
+    replay_server = summarize([result['server_time'] for result in done])
+    replay_client = summarize([result['latency'] for result in done])
+    recorded_rps = len(entries) / recorded_span if recorded_span > 0 else None
+    replay_rps = len(done) / wall if wall > 0 else None
+
+    report = {
+        'meta': {
+            'label': args.label,
+            'timestamp': datetime.now().isoformat(),
+            'url': base_url,
+            'capture': str(args.capture),
+            'speed': args.speed,
+            'requests': len(entries),
+            'skipped': len(entries) - len(done),
+            'synthesized_payloads': source.synthesized
+        },
+        'recorded': {
+            'duration_seconds': round(recorded_span, 3),
+            'throughput_rps': round(recorded_rps * args.speed, 2) if recorded_rps else None,
+            'server_processing_ms': recorded_server
+        },
+        'replay': {
+            'duration_seconds': round(wall, 3),
+            'throughput_rps': round(replay_rps, 2) if replay_rps else None,
+            'errors': errors,
+            'error_rate': round(errors / len(done), 4) if done else 0.0,
+            # 由近重复缓存或请求合并应答的请求，这部分延迟不反映推理
+            'cache_hits': sum(1 for result in done if result['cache_hit']),
+            'coalesced': sum(1 for result in done if result['coalesced']),
+            'server_processing_ms': replay_server,
+            'client_latency_ms': replay_client,
+            'max_dispatch_lag_ms': round(max(result['lag'] for result in done) * 1000, 2) if done else None
+        },
+        'diff': {
+            'throughput': diff(recorded_rps * args.speed if recorded_rps else None, replay_rps),
+            'server_p50': diff(recorded_server['p50'], replay_server['p50']),
+            'server_p95': diff(recorded_server['p95'], replay_server['p95']),
+            'server_p99': diff(recorded_server['p99'], replay_server['p99'])
+        }
+    }
+
+    print(f"📊 服务端处理耗时 p50 {recorded_server['p50']} -> {replay_server['p50']} ms，"
+          f"p95 {recorded_server['p95']} -> {replay_server['p95']} ms，"
+          f"p99 {recorded_server['p99']} -> {replay_server['p99']} ms")
+    print(f"📊 客户端延迟 p50 {replay_client['p50']} ms，p95 {replay_client['p95']} ms，"
+          f"p99 {replay_client['p99']} ms，错误率 {report['replay']['error_rate']:.2%}")
+    print(f"📊 吞吐 {report['recorded']['throughput_rps']} -> {report['replay']['throughput_rps']} req/s")
+    print(f"📊 缓存命中 {report['replay']['cache_hits']}，合并 {report['replay']['coalesced']}，"
+          f"合成负载 {source.synthesized}")
+
+    output = Path(args.output or f"replay_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"💾 回放结果已保存: {output}")
+
+
+if __name__ == "__main__":
+    main()
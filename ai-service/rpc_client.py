@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+二进制RPC检测通道客户端
+协议参考实现，也可用于验证通道与对比HTTP接口的开销：
+  python rpc_client.py unix:/tmp/crop-disease.sock leaf1.jpg leaf2.jpg --repeat 100 --pipeline 16
+"""
+
+import sys
+import time
+import socket
+import argparse
+import threading
+from pathlib import Path
+
+from rpc_server import (OP_DETECT, OP_PING, STATUS_OK, FRAME_LENGTH,
+                        parse_address, pack_request, unpack_response, read_frame)
+
+
+class RpcError(RuntimeError):
+    """服务端返回错误状态"""
+
+
+class DetectionRpcClient:
+    def __init__(self, address, timeout=60.0, max_frame_bytes=1024 * 1024):
+        """建立长连接；同一客户端可被多个线程共享，请求按编号匹配响应"""
+        family, connect_address = parse_address(address)
+        self.sock = socket.socket(family, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(connect_address)
+        if family == socket.AF_INET:
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.rfile = self.sock.makefile('rb')
+        self.max_frame_bytes = max_frame_bytes
+
+        self._send_lock = threading.Lock()
+        self._receive_lock = threading.Lock()
+        self._next_id = 0
+        self._responses = {}
+
+    def close(self):
+        self.rfile.close()
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def send(self, payload, op=OP_DETECT):
+        """发送请求但不等待响应，返回请求编号"""
+        with self._send_lock:
+            self._next_id = (self._next_id + 1) & 0xFFFFFFFF
+            request_id = self._next_id
+            self.sock.sendall(pack_request(request_id, payload, op))
+        return request_id
+
+    def receive(self, request_id):
+        """等待指定请求的响应，返回 (状态, 服务端耗时毫秒, 结果或错误信息)"""
+        while True:
+            with self._receive_lock:
+                if request_id in self._responses:
+                    return self._responses.pop(request_id)
+                body = read_frame(self.rfile, self.max_frame_bytes)
+                if body is None:
+                    raise ConnectionError("连接已被服务端关闭")
+                response_id, status, processing_ms, payload = unpack_response(body)
+                if response_id == request_id:
+                    return status, processing_ms, payload
+                self._responses[response_id] = (status, processing_ms, payload)
+
+    def detect(self, image_bytes):
+        """检测单张图像，返回 [(类别编号, 置信度)]"""
+        status, _, payload = self.receive(self.send(image_bytes))
+        if status != STATUS_OK:
+            raise RpcError(payload)
+        return payload
+
+    def detect_many(self, images, pipeline=16):
+        """流水线检测：保持最多pipeline个在途请求，按输入顺序返回结果（失败项为RpcError）"""
+        results = [None] * len(images)
+        pending = []
+        for index, image_bytes in enumerate(images):
+            pending.append((index, self.send(image_bytes)))
+            if len(pending) >= pipeline:
+                self._collect(pending.pop(0), results)
+        for item in pending:
+            self._collect(item, results)
+        return results
+
+    def _collect(self, item, results):
+        index, request_id = item
+        status, _, payload = self.receive(request_id)
+        results[index] = payload if status == STATUS_OK else RpcError(payload)
+
+    def ping(self):
+        start = time.perf_counter()
+        self.receive(self.send(b'', op=OP_PING))
+        return time.perf_counter() - start
+
+
+def main():
+    """命令行检测与吞吐测试"""
+    parser = argparse.ArgumentParser(description='作物病害检测二进制RPC客户端')
+    parser.add_argument('address', type=str, help='服务地址，如 unix:/tmp/crop-disease.sock 或 tcp:127.0.0.1:5050')
+    parser.add_argument('images', nargs='+', type=str, help='图像文件')
+    parser.add_argument('--repeat', type=int, default=1, help='重复发送次数')
+    parser.add_argument('--pipeline', type=int, default=16, help='单连接最大在途请求数')
+
+    args = parser.parse_args()
+
+    payloads = [Path(path).read_bytes() for path in args.images]
+    images = payloads * args.repeat
+    with DetectionRpcClient(args.address) as client:
+        print(f"📡 已连接 {args.address}，往返延迟 {client.ping() * 1000:.2f} ms")
+        start = time.perf_counter()
+        results = client.detect_many(images, pipeline=args.pipeline)
+        elapsed = time.perf_counter() - start
+
+    for path, result in zip(args.images, results):
+        if isinstance(result, RpcError):
+            print(f"❌ {path}: {result}")
+        else:
+            top = ', '.join(f"{class_id}:{confidence:.3f}" for class_id, confidence in result)
+            print(f"✅ {path}: {top}")
+    errors = sum(1 for result in results if isinstance(result, RpcError))
+    sent = sum(len(payload) + FRAME_LENGTH.size for payload in images)
+    print(f"📊 {len(images)} 个请求，用时 {elapsed:.2f} 秒，{len(images) / elapsed:.1f} req/s，"
+          f"错误 {errors} 个，发送 {sent / 1024 / 1024:.1f} MB")
+    if errors:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+"""
+二进制RPC检测通道
+供后端服务通过本地Unix套接字或TCP长连接调用，请求直接携带原始图像字节，响应为紧凑的类别编号与置信度，
+同一连接上可连续发送多个请求（流水线），响应按完成顺序返回并以请求编号对应
+
+帧格式（大端）：uint32 帧长度 + 帧内容
+  请求：uint8 版本 | uint8 操作码 | uint16 保留 | uint32 请求编号 | 图像字节
+  响应：uint8 版本 | uint8 状态 | uint16 结果数 | uint32 请求编号 | float32 服务端耗时(毫秒) |
+        结果数 × (uint16 类别编号 | float32 置信度)；状态非0时结果部分为UTF-8错误信息
+"""
+
+import os
+import stat
+import time
+import errno
+import socket
+import struct
+import logging
+import threading
+import socketserver
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+PROTOCOL_VERSION = 1
+
+OP_DETECT = 1
+OP_PING = 2
+
+STATUS_OK = 0
+STATUS_ERROR = 1
+STATUS_BAD_REQUEST = 2
+
+FRAME_LENGTH = struct.Struct('!I')
+REQUEST_HEADER = struct.Struct('!BBHI')
+RESPONSE_HEADER = struct.Struct('!BBHIf')
+RESULT_ENTRY = struct.Struct('!Hf')
+
+
+def parse_address(address):
+    """解析监听地址：unix:/path/to.sock 或 tcp:host:port，返回 (协议族, 地址)"""
+    if address.startswith('unix:'):
+        return socket.AF_UNIX, address[len('unix:'):]
+    if address.startswith('tcp:'):
+        host, port = address[len('tcp:'):].rsplit(':', 1)
+        return socket.AF_INET, (host, int(port))
+    raise ValueError(f"不支持的RPC地址: {address}（可选 unix:/path 或 tcp:host:port）")
+
+
+def read_exact(stream, size):
+    """读取定长数据，连接关闭时返回None"""
+    data = bytearray()
+    while len(data) < size:
+        chunk = stream.read(size - len(data))
+        if not chunk:
+            return None
+        data.extend(chunk)
+    return bytes(data)
+
+
+def read_frame(stream, max_frame_bytes):
+    """读取一帧，连接关闭时返回None"""
+    header = read_exact(stream, FRAME_LENGTH.size)
+    if header is None:
+        return None
+    (length,) = FRAME_LENGTH.unpack(header)
+    if length > max_frame_bytes:
+        raise ValueError(f"帧长度 {length} 超出上限 {max_frame_bytes}")
+    return read_exact(stream, length)
+
+
+def pack_request(request_id, payload, op=OP_DETECT):
+    body = REQUEST_HEADER.pack(PROTOCOL_VERSION, op, 0, request_id) + payload
+    return FRAME_LENGTH.pack(len(body)) + body
+
+
+def pack_response(request_id, status, processing_ms, results=(), message=''):
+    if status == STATUS_OK:
+        payload = b''.join(RESULT_ENTRY.pack(class_id, confidence) for class_id, confidence in results)
+        count = len(results)
+    else:
+        payload = message.encode('utf-8')
+        count = 0
+    body = RESPONSE_HEADER.pack(PROTOCOL_VERSION, status, count, request_id, processing_ms) + payload
+    return FRAME_LENGTH.pack(len(body)) + body
+
+
+def unpack_response(body):
+    """解析响应帧内容，返回 (请求编号, 状态, 服务端耗时毫秒, [(类别编号, 置信度)] 或错误信息)"""
+    _, status, count, request_id, processing_ms = RESPONSE_HEADER.unpack_from(body)
+    offset = RESPONSE_HEADER.size
+    if status != STATUS_OK:
+        return request_id, status, processing_ms, body[offset:].decode('utf-8', errors='replace')
+    results = [RESULT_ENTRY.unpack_from(body, offset + i * RESULT_ENTRY.size) for i in range(count)]
+    return request_id, status, processing_ms, results
+
+
+class _ConnectionHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        server = self.server.rpc
+        server.on_connect()
+        if self.connection.family == socket.AF_INET:
+            # 响应帧很小，关闭Nagle算法避免延迟确认造成的等待
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        write_lock = threading.Lock()
+        # 限制单个连接的在途请求数；达到上限时暂停读取，由传输层对客户端形成背压
+        slots = threading.BoundedSemaphore(server.max_pipeline)
+
+        def send(frame):
+            with write_lock:
+                self.wfile.write(frame)
+                self.wfile.flush()
+            server.count_bytes(sent=len(frame))
+
+        def process(request_id, payload, received):
+            try:
+                status, results, message = server.handle_detect(payload)
+                processing_ms = (time.perf_counter() - received) * 1000
+                send(pack_response(request_id, status, processing_ms, results, message))
+            except OSError:
+                pass
+            finally:
+                slots.release()
+
+        try:
+            while True:
+                try:
+                    body = read_frame(self.rfile, server.max_frame_bytes)
+                except ValueError as e:
+                    send(pack_response(0, STATUS_BAD_REQUEST, 0.0, message=str(e)))
+                    break
+                if body is None:
+                    break
+                received = time.perf_counter()
+                server.count_bytes(received=len(body) + FRAME_LENGTH.size)
+                if len(body) < REQUEST_HEADER.size:
+                    send(pack_response(0, STATUS_BAD_REQUEST, 0.0, message="请求帧过短"))
+                    break
+                version, op, _, request_id = REQUEST_HEADER.unpack_from(body)
+                if version != PROTOCOL_VERSION:
+                    send(pack_response(request_id, STATUS_BAD_REQUEST, 0.0, message=f"不支持的协议版本: {version}"))
+                    break
+                if op == OP_PING:
+                    send(pack_response(request_id, STATUS_OK, 0.0))
+                    continue
+                if op != OP_DETECT:
+                    send(pack_response(request_id, STATUS_BAD_REQUEST, 0.0, message=f"不支持的操作: {op}"))
+                    continue
+
+                slots.acquire()
+                server.executor.submit(process, request_id, body[REQUEST_HEADER.size:], received)
+        except OSError:
+            pass
+        finally:
+            # 等待本连接的在途请求完成后再关闭
+            for _ in range(server.max_pipeline):
+                slots.acquire()
+            server.on_disconnect()
+
+
+class _ThreadingUnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class _ThreadingTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def remove_stale_socket(path):
+    """
+    清理上次异常退出遗留的Unix套接字文件。只有连接被拒绝（无进程监听）时才删除；
+    仍有进程在监听或路径不是套接字时抛出OSError，避免抢占其他实例的地址
+    """
+    try:
+        mode = os.stat(path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise OSError(errno.EEXIST, f"{path} 已存在且不是套接字文件")
+
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except ConnectionRefusedError:
+        os.remove(path)
+        return
+    except FileNotFoundError:
+        return
+    finally:
+        probe.close()
+    raise OSError(errno.EADDRINUSE, f"{path} 上已有其他进程在监听")
+
+
+class DetectionRpcServer:
+    def __init__(self, address, detect, class_names, workers=4, max_pipeline=32, max_frame_bytes=16 * 1024 * 1024):
+        """
+        detect为单张检测函数（输入原始图像字节，返回与 /detect 相同的响应字典），
+        所有请求仍经由同一检测路径处理，此处只负责传输与编解码
+        """
+        self.address = address
+        self.detect = detect
+        self.class_index = {name: i for i, name in enumerate(class_names)}
+        self.max_pipeline = max_pipeline
+        self.max_frame_bytes = max_frame_bytes
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rpc-detect")
+
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+        self.active_connections = 0
+        self.connections = 0
+        self.requests = 0
+        self.errors = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.detect_seconds_total = 0.0
+
+    def start(self):
+        family, bind_address = parse_address(self.address)
+        if family == socket.AF_UNIX:
+            remove_stale_socket(bind_address)
+            self._server = _ThreadingUnixServer(bind_address, _ConnectionHandler)
+        else:
+            self._server = _ThreadingTCPServer(bind_address, _ConnectionHandler)
+        self._server.rpc = self
+        self._thread = threading.Thread(target=self._server.serve_forever, name="rpc-server", daemon=True)
+        self._thread.start()
+        logger.info(f"二进制RPC通道已监听: {self.address}")
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            family, bind_address = parse_address(self.address)
+            if family == socket.AF_UNIX and os.path.exists(bind_address):
+                os.remove(bind_address)
+        self.executor.shutdown(wait=False)
+
+    def on_connect(self):
+        with self._lock:
+            self.active_connections += 1
+            self.connections += 1
+
+    def on_disconnect(self):
+        with self._lock:
+            self.active_connections -= 1
+
+    def count_bytes(self, received=0, sent=0):
+        with self._lock:
+            self.bytes_in += received
+            self.bytes_out += sent
+
+    def handle_detect(self, payload):
+        """执行检测，返回 (状态, [(类别编号, 置信度)], 错误信息)"""
+        start = time.perf_counter()
+        try:
+            response = self.detect(payload)
+        except Exception as e:
+            logger.error(f"RPC检测失败: {e}")
+            response = {'success': False, 'error': str(e)}
+        with self._lock:
+            self.requests += 1
+            self.detect_seconds_total += time.perf_counter() - start
+            if not response.get('success'):
+                self.errors += 1
+        if not response.get('success'):
+            return STATUS_ERROR, (), response.get('error', '检测失败')
+        results = [(self.class_index[item['class_name']], item['confidence'])
+                   for item in response['result']['top5'] if item['class_name'] in self.class_index]
+        return STATUS_OK, results, ''
+
+    def stats(self):
+        """RPC通道统计信息"""
+        return {
+            'address': self.address,
+            'active_connections': self.active_connections,
+            'connections': self.connections,
+            'requests': self.requests,
+            'errors': self.errors,
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'detect_ms_mean': round(self.detect_seconds_total / self.requests * 1000, 2) if self.requests else None
+        }
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+相同请求合并执行（single-flight）
+内容摘要相同的请求在首个请求计算期间到达时，等待并共享其结果，不再重复推理
+"""
+
+import hashlib
+import threading
+
+
+def content_digest(image_data):
+    """计算图像原始字节的摘要，非字节输入返回None"""
+    if isinstance(image_data, (bytes, bytearray, memoryview)):
+        return hashlib.blake2b(image_data, digest_size=16).hexdigest()
+    return None
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+        self.leaders = 0
+        self.coalesced = 0
+        self.max_waiters = 0
+
+    def do(self, key, fn):
+        """执行fn；相同key已在执行时等待其结果。返回 (结果, 是否为共享结果)"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+            else:
+                call.waiters += 1
+                self.coalesced += 1
+                self.max_waiters = max(self.max_waiters, call.waiters)
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+            return call.result, False
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self):
+        """合并执行统计信息"""
+        with self._lock:
+            inflight = len(self._calls)
+        total = self.leaders + self.coalesced
+        return {
+            'inflight': inflight,
+            'executed': self.leaders,
+            'coalesced': self.coalesced,
+            'coalesce_rate': round(self.coalesced / total, 4) if total else 0.0,
+            'max_waiters': self.max_waiters
+        }
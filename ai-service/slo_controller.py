@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+SLO自适应降级
+持续统计近期交互请求的p95延迟，接近SLO时逐级降低服务质量（缩小输入尺寸、换用小模型、只输出Top-1），
+延迟回落后逐级恢复；级别之间有冷却时间与上下阈值差，避免频繁切换
+"""
+
+import time
+import logging
+import threading
+from collections import deque
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 可用的降级步骤，按从轻到重的顺序逐级叠加
+DEGRADE_STEPS = ('reduced_input', 'small_model', 'top1_only')
+
+FULL_QUALITY = {'level': 0, 'name': 'full', 'imgsz': None, 'small_model': False, 'top_k': 5}
+
+
+def build_quality_levels(steps, reduced_imgsz=None, small_model_available=False):
+    """按配置的步骤生成质量级别列表，每一级包含之前各级的全部降级；缺少所需资源的步骤跳过"""
+    levels = [dict(FULL_QUALITY)]
+    for step in steps:
+        if step not in DEGRADE_STEPS:
+            raise ValueError(f"未知的降级步骤: {step}")
+        if step == 'reduced_input' and not reduced_imgsz:
+            continue
+        if step == 'small_model' and not small_model_available:
+            continue
+        level = dict(levels[-1], level=len(levels), name=step)
+        if step == 'reduced_input':
+            level['imgsz'] = reduced_imgsz
+        elif step == 'small_model':
+            level['small_model'] = True
+        else:
+            level['top_k'] = 1
+        levels.append(level)
+    return levels
+
+
+class SloController:
+    def __init__(self, levels, slo_ms, window_seconds=30.0, min_samples=20, risk_ratio=0.9,
+                 recover_ratio=0.6, cooldown_seconds=10.0):
+        """
+        p95超过 slo_ms * risk_ratio 时降一级，低于 slo_ms * recover_ratio 时升一级；
+        每次切换后只用切换之后的延迟样本判断，且至少间隔cooldown_seconds
+        """
+        self.levels = levels
+        self.slo_ms = slo_ms
+        self.window_seconds = window_seconds
+        self.min_samples = min_samples
+        self.risk_ratio = risk_ratio
+        self.recover_ratio = recover_ratio
+        self.cooldown_seconds = cooldown_seconds
+
+        self._lock = threading.Lock()
+        self._samples = deque()
+        self._level = 0
+        self._changed_at = time.monotonic()
+        self._last_p95 = None
+
+        self.observed = 0
+        self.step_downs = 0
+        self.step_ups = 0
+        self.served = [0] * len(levels)
+
+    def current(self):
+        """当前质量级别"""
+        level = self.levels[self._level]
+        self.served[level['level']] += 1
+        return level
+
+    def observe(self, latency_seconds):
+        """记录一个请求的端到端延迟，必要时切换质量级别"""
+        now = time.monotonic()
+        with self._lock:
+            self.observed += 1
+            self._samples.append((now, latency_seconds * 1000))
+            while self._samples and now - self._samples[0][0] > self.window_seconds:
+                self._samples.popleft()
+            if len(self._samples) < self.min_samples or now - self._changed_at < self.cooldown_seconds:
+                return
+
+            p95 = float(np.percentile([latency for _, latency in self._samples], 95))
+            self._last_p95 = p95
+            if p95 > self.slo_ms * self.risk_ratio and self._level < len(self.levels) - 1:
+                self._switch(self._level + 1, p95, now)
+                self.step_downs += 1
+            elif p95 < self.slo_ms * self.recover_ratio and self._level > 0:
+                self._switch(self._level - 1, p95, now)
+                self.step_ups += 1
+
+    def _switch(self, level, p95, now):
+        logger.warning(f"p95延迟 {p95:.0f}ms（SLO {self.slo_ms:.0f}ms），服务质量切换为 "
+                       f"{self.levels[level]['name']}（级别 {level}）")
+        self._level = level
+        self._changed_at = now
+        self._samples.clear()
+
+    def stats(self):
+        """降级状态与各级别服务的请求数"""
+        with self._lock:
+            return {
+                'slo_p95_ms': self.slo_ms,
+                'recent_p95_ms': round(self._last_p95, 2) if self._last_p95 is not None else None,
+                'level': self._level,
+                'quality': self.levels[self._level]['name'],
+                'levels': [level['name'] for level in self.levels],
+                'observed': self.observed,
+                'step_downs': self.step_downs,
+                'step_ups': self.step_ups,
+                'served_by_level': {level['name']: count for level, count in zip(self.levels, self.served)}
+            }
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+合成延迟模型推理后端
+与ultralytics分类模型调用接口一致，按可配置的批次延迟曲线耗时并消耗CPU，返回接近真实的类别分布，
+用于在没有真实权重的机器上调优批处理、准入控制和工作线程配置
+"""
+
+import time
+import bisect
+import threading
+import hashlib
+
+import numpy as np
+from PIL import Image
+
+
+def parse_latency_curve(spec):
+    """解析延迟曲线，如 '1:25,8:90,32:300'（批大小:毫秒），按批大小排序"""
+    points = []
+    for item in spec.split(','):
+        batch, latency = item.split(':')
+        points.append((int(batch), float(latency)))
+    points.sort()
+    if not points:
+        raise ValueError("延迟曲线不能为空")
+    return points
+
+
+class StubProbs:
+    def __init__(self, probabilities):
+        """模拟 ultralytics Probs 的常用属性"""
+        self.data = probabilities
+        order = np.argsort(-probabilities)
+        self.top1 = int(order[0])
+        self.top1conf = float(probabilities[order[0]])
+        self.top5 = [int(i) for i in order[:5]]
+        self.top5conf = probabilities[order[:5]]
+
+
+class StubResult:
+    def __init__(self, probabilities, names):
+        self.probs = StubProbs(probabilities)
+        self.names = names
+
+
+class StubYOLO:
+    def __init__(self, class_names, latency_curve='1:25,8:90,32:300', jitter=0.1, cpu_fraction=0.8,
+                 confidence=0.85, class_weights=None, seed=0, embedding_dim=256, imgsz=224):
+        """初始化合成后端；cpu_fraction为延迟中实际占用CPU的比例，其余时间休眠；延迟曲线对应输入尺寸imgsz"""
+        self.names = {i: name for i, name in enumerate(class_names)}
+        self.imgsz = imgsz
+        self.num_classes = len(class_names)
+        self.curve = parse_latency_curve(latency_curve) if isinstance(latency_curve, str) else latency_curve
+        self.jitter = jitter
+        self.cpu_fraction = min(max(cpu_fraction, 0.0), 1.0)
+        self.confidence = confidence
+        self.rng = np.random.default_rng(seed)
+        self._rng_lock = threading.Lock()
+
+        # 类别先验：默认健康类与常见病害更常见
+        if class_weights is None:
+            class_weights = [3.0 if name.endswith('healthy') else 1.0 for name in class_names]
+        weights = np.asarray(class_weights, dtype=np.float64)
+        self.prior = weights / weights.sum()
+
+        # 合成特征：同类图像的特征聚集在各自的类中心附近
+        self.embedding_dim = embedding_dim
+        self.centroids = np.random.default_rng(seed).normal(size=(self.num_classes, embedding_dim)).astype(np.float32)
+        self.feature_hook = None
+
+        self._burn_buffer = b'\0' * (1 << 20)
+        self.calls = 0
+        self.images = 0
+
+    def batch_latency(self, batch_size):
+        """按曲线线性插值得到批次延迟（毫秒），超出范围时按端点斜率外推"""
+        sizes = [size for size, _ in self.curve]
+        if len(self.curve) == 1:
+            return self.curve[0][1] * batch_size / self.curve[0][0]
+        index = bisect.bisect_left(sizes, batch_size)
+        if index < len(sizes) and sizes[index] == batch_size:
+            return self.curve[index][1]
+        index = min(max(index, 1), len(sizes) - 1)
+        (x0, y0), (x1, y1) = self.curve[index - 1], self.curve[index]
+        return max(0.0, y0 + (y1 - y0) * (batch_size - x0) / (x1 - x0))
+
+    def _consume(self, seconds):
+        """按比例消耗CPU（哈希大块内存时释放GIL，与真实推理内核行为相近）并休眠剩余时间"""
+        burn_until = time.perf_counter() + seconds * self.cpu_fraction
+        while time.perf_counter() < burn_until:
+            hashlib.sha256(self._burn_buffer).digest()
+        remaining = seconds * (1 - self.cpu_fraction)
+        if remaining > 0:
+            time.sleep(remaining)
+
+    def _image_seed(self, image):
+        """同一图像得到相同结果，便于验证缓存与合并逻辑"""
+        if isinstance(image, Image.Image):
+            data = image.resize((8, 8)).tobytes()
+        elif isinstance(image, np.ndarray):
+            data = np.ascontiguousarray(image[::max(1, image.shape[0] // 8), ::max(1, image.shape[1] // 8)]).tobytes()
+        else:
+            data = str(image).encode('utf-8')
+        return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'little')
+
+    def _probabilities(self, image):
+        """返回 (类别概率, 倒数第二层特征)"""
+        rng = np.random.default_rng(self._image_seed(image))
+        true_class = rng.choice(self.num_classes, p=self.prior)
+        # 置信度集中程度围绕配置值波动，其余概率按Dirichlet分布分给其他类别
+        top1 = float(np.clip(rng.normal(self.confidence, 0.1), 0.2, 0.999))
+        rest = rng.dirichlet(np.full(self.num_classes - 1, 0.3)) * (1 - top1)
+        probabilities = np.insert(rest, true_class, top1)
+        features = self.centroids[true_class] + rng.normal(scale=0.5, size=self.embedding_dim)
+        return probabilities.astype(np.float32), features.astype(np.float32)
+
+    def __call__(self, source, verbose=False, imgsz=None, **kwargs):
+        images = source if isinstance(source, (list, tuple)) else [source]
+        latency = self.batch_latency(len(images)) / 1000
+        # 指定较小输入尺寸时按像素数等比缩短延迟
+        if imgsz:
+            latency *= (imgsz / self.imgsz) ** 2
+        if self.jitter > 0:
+            with self._rng_lock:
+                latency *= float(self.rng.lognormal(0.0, self.jitter))
+        self._consume(latency)
+
+        self.calls += 1
+        self.images += len(images)
+        outputs = [self._probabilities(image) for image in images]
+        if self.feature_hook is not None:
+            self.feature_hook(np.stack([features for _, features in outputs]))
+        return [StubResult(probabilities, self.names) for probabilities, _ in outputs]
+
+    def saliency(self, image, class_index, size=224):
+        """合成显著性图：以图像决定的位置为中心的若干高斯斑块，耗时约为单张推理的两倍（前向+反向）"""
+        self._consume(self.batch_latency(1) * 2 / 1000)
+        rng = np.random.default_rng(self._image_seed(image) ^ class_index)
+        ys, xs = np.mgrid[0:size, 0:size].astype(np.float32)
+        heatmap = np.zeros((size, size), dtype=np.float32)
+        for _ in range(rng.integers(1, 4)):
+            cy, cx = rng.uniform(0.2, 0.8, size=2) * size
+            sigma = rng.uniform(0.08, 0.2) * size
+            heatmap += rng.uniform(0.5, 1.0) * np.exp(-((ys - cy) ** 2 + (xs - cx) ** 2) / (2 * sigma ** 2))
+        return heatmap / heatmap.max()
+
+    predict = __call__
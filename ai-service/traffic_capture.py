@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+线上流量采集
+按到达时间记录 /detect 请求的负载（或仅记录其摘要引用）到本地滚动日志，供 replay_traffic.py 回放
+"""
+
+import io
+import json
+import base64
+import time
+import queue
+import random
+import shutil
+import hashlib
+import logging
+import threading
+from pathlib import Path
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+
+class TrafficRecorder:
+    def __init__(self, directory, mode='payload', segment_bytes=256 * 1024 * 1024, max_segments=8,
+                 sample_rate=1.0, queue_size=1024):
+        """初始化流量采集器；mode为payload时保存原始负载，为reference时只保存摘要与图像尺寸"""
+        if mode not in ('payload', 'reference'):
+            raise ValueError(f"不支持的采集模式: {mode}")
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.mode = mode
+        self.segment_bytes = segment_bytes
+        self.max_segments = max_segments
+        self.sample_rate = sample_rate
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._segment = None
+        self._index_file = None
+        self._segment_size = 0
+        self._segment_blobs = set()
+
+        self.recorded = 0
+        self.dropped = 0
+
+        self._thread = threading.Thread(target=self._run, name="traffic-capture", daemon=True)
+        self._thread.start()
+
+    def capture(self, arrival, endpoint, kind, payload, filename=None, status=None, processing_time=None):
+        """在请求处理完成后调用，写入操作在后台线程完成，队列满时直接丢弃"""
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return
+        try:
+            self._queue.put_nowait({
+                'arrival': arrival,
+                'endpoint': endpoint,
+                'kind': kind,
+                'filename': filename,
+                'status': status,
+                'processing_time': processing_time,
+                'payload': payload
+            })
+        except queue.Full:
+            self.dropped += 1
+
+    def stats(self):
+        """采集统计信息"""
+        return {
+            'mode': self.mode,
+            'directory': str(self.directory),
+            'sample_rate': self.sample_rate,
+            'recorded': self.recorded,
+            'dropped': self.dropped,
+            'queued': self._queue.qsize(),
+            'segments': len(self.list_segments())
+        }
+
+    def list_segments(self):
+        return sorted(path for path in self.directory.glob("segment-*") if path.is_dir())
+
+    def _open_segment(self):
+        self._segment = self.directory / f"segment-{time.strftime('%Y%m%d_%H%M%S')}-{int(time.time() * 1000) % 1000:03d}"
+        (self._segment / "blobs").mkdir(parents=True, exist_ok=True)
+        if self._index_file is not None:
+            self._index_file.close()
+        self._index_file = open(self._segment / "requests.jsonl", 'a', encoding='utf-8')
+        self._segment_size = 0
+        self._segment_blobs = set()
+
+        # 超出保留数量时删除最早的分段
+        segments = self.list_segments()
+        for stale in segments[:max(0, len(segments) - self.max_segments)]:
+            shutil.rmtree(stale, ignore_errors=True)
+
+    def _describe(self, payload, kind):
+        """提取负载摘要；reference模式下回放端据此合成同尺寸图像"""
+        image_bytes = payload
+        if kind == 'json':
+            try:
+                image_data = json.loads(payload).get('image_data', '')
+                if image_data.startswith('data:image'):
+                    image_data = image_data.split(',', 1)[1]
+                image_bytes = base64.b64decode(image_data)
+            except Exception:
+                image_bytes = b''
+        info = {'sha256': hashlib.sha256(payload).hexdigest(), 'size': len(payload)}
+        try:
+            with Image.open(io.BytesIO(image_bytes)) as image:
+                info.update({'format': image.format, 'width': image.width, 'height': image.height})
+        except Exception:
+            pass
+        return info
+
+    def _write(self, item):
+        if self._segment is None or self._segment_size >= self.segment_bytes:
+            self._open_segment()
+
+        payload = item.pop('payload')
+        item.update(self._describe(payload, item['kind']))
+        if self.mode == 'payload' and item['sha256'] not in self._segment_blobs:
+            # 同一分段内相同负载只保存一次
+            (self._segment / "blobs" / item['sha256']).write_bytes(payload)
+            self._segment_blobs.add(item['sha256'])
+            self._segment_size += len(payload)
+
+        line = json.dumps(item, ensure_ascii=False) + '\n'
+        self._index_file.write(line)
+        self._index_file.flush()
+        self._segment_size += len(line)
+        self.recorded += 1
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                self._write(item)
+            except Exception as e:
+                logger.error(f"流量采集写入失败: {e}")
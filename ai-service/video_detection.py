@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""
+视频 / 帧序列检测
+流式解码帧，跳过近似重复的相邻帧，批量推理后按时间窗口平滑输出分段结果
+"""
+
+import io
+
+import cv2
+from PIL import Image
+
+from phash_cache import compute_fingerprint, hamming_distance, colour_distance
+
+
+def iter_video_frames(video_path, sample_fps=2.0, load_image=None):
+    """流式读取视频帧，按目标帧率抽样，产出 (帧序号, 时间戳, RGB图像)；load_image用于限制帧尺寸"""
+    capture = cv2.VideoCapture(str(video_path))
+    if not capture.isOpened():
+        raise ValueError("无法打开视频文件")
+
+    try:
+        fps = capture.get(cv2.CAP_PROP_FPS) or 25.0
+        step = max(1, int(round(fps / sample_fps))) if sample_fps > 0 else 1
+        frame_index = 0
+        while True:
+            # 非抽样帧只grab不解码
+            if frame_index % step != 0:
+                if not capture.grab():
+                    break
+                frame_index += 1
+                continue
+
+            ok, frame = capture.read()
+            if not ok:
+                break
+            image = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+            if load_image is not None:
+                image = load_image(image)
+            yield frame_index, frame_index / fps, image
+            frame_index += 1
+    finally:
+        capture.release()
+
+
+def video_frame_count(video_path):
+    """视频容器记录的总帧数，无法获取时返回None"""
+    capture = cv2.VideoCapture(str(video_path))
+    try:
+        count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+        return count or None
+    finally:
+        capture.release()
+
+
+def iter_sequence_frames(frame_files, frame_interval=1.0, load_image=None):
+    """
+    读取上传的帧序列（按上传顺序），产出 (帧序号, 时间戳, RGB图像)；
+    load_image接收帧的原始字节，用于在解码前限制尺寸
+    """
+    for frame_index, frame_file in enumerate(frame_files):
+        if load_image is not None:
+            image = load_image(frame_file.read())
+        else:
+            image = Image.open(io.BytesIO(frame_file.read()))
+            if image.mode != 'RGB':
+                image = image.convert('RGB')
+        yield frame_index, frame_index * frame_interval, image
+
+
+class TemporalSegmenter:
+    def __init__(self, segment_seconds=2.0, smoothing=0.6):
+        """按时间窗口累计指数平滑后的类别得分"""
+        self.segment_seconds = segment_seconds
+        self.smoothing = smoothing
+        self.segments = []
+        self._smoothed = {}
+        self._window = None
+
+    def _open_window(self, window_index, frame_index, timestamp):
+        self._window = {
+            'index': window_index,
+            'start_frame': frame_index,
+            'end_frame': frame_index,
+            'start_time': timestamp,
+            'end_time': timestamp,
+            'frames': 0,
+            'scores': {}
+        }
+
+    def _close_window(self):
+        window = self._window
+        self._window = None
+        if window is None or not window['scores']:
+            return
+        class_name, score = max(window['scores'].items(), key=lambda item: item[1])
+        segment = {
+            'start_frame': window['start_frame'],
+            'end_frame': window['end_frame'],
+            'start_time': window['start_time'],
+            'end_time': window['end_time'],
+            'frames': window['frames'],
+            'class_name': class_name,
+            'confidence': score / window['frames']
+        }
+
+        # 相邻窗口结论一致时合并，避免输出大量重复分段
+        previous = self.segments[-1] if self.segments else None
+        if previous is not None and previous['class_name'] == class_name:
+            total = previous['frames'] + segment['frames']
+            previous['confidence'] = (previous['confidence'] * previous['frames'] +
+                                      segment['confidence'] * segment['frames']) / total
+            previous['frames'] = total
+            previous['end_frame'] = segment['end_frame']
+            previous['end_time'] = segment['end_time']
+        else:
+            self.segments.append(segment)
+
+    def add(self, frame_index, timestamp, classifications):
+        """加入一帧的Top-5结果"""
+        window_index = int(timestamp // self.segment_seconds) if self.segment_seconds > 0 else 0
+        if self._window is None or self._window['index'] != window_index:
+            self._close_window()
+            self._open_window(window_index, frame_index, timestamp)
+
+        # 指数平滑：未出现在当前Top-5中的类别得分逐步衰减
+        current = {item['class_name']: item['confidence'] for item in classifications}
+        for class_name in set(self._smoothed) | set(current):
+            value = self.smoothing * self._smoothed.get(class_name, 0.0) + \
+                (1 - self.smoothing) * current.get(class_name, 0.0)
+            if value < 1e-4:
+                self._smoothed.pop(class_name, None)
+            else:
+                self._smoothed[class_name] = value
+
+        window = self._window
+        window['end_frame'] = frame_index
+        window['end_time'] = timestamp
+        window['frames'] += 1
+        for class_name, value in self._smoothed.items():
+            window['scores'][class_name] = window['scores'].get(class_name, 0.0) + value
+
+    def finish(self):
+        """结束并返回全部分段"""
+        self._close_window()
+        return self.segments
+
+
+def detect_frame_stream(detector, frames, batch_size=16, dedup_distance=3,
+                        segment_seconds=2.0, smoothing=0.6, max_frames=0, dedup_colour_distance=12):
+    """
+    对帧流进行去重、批量推理与时间平滑，内存占用只与批大小相关。
+    相邻帧的dHash距离与颜色签名差异都在阈值内才视为重复，低纹理帧的dHash相同不足以判定重复；
+    达到max_frames时停止，并在统计中标记 truncated
+    """
+    segmenter = TemporalSegmenter(segment_seconds=segment_seconds, smoothing=smoothing)
+    stats = {
+        'frames_sampled': 0,
+        'frames_duplicate': 0,
+        'frames_classified': 0,
+        'frames_failed': 0,
+        'batches': 0,
+        'truncated': False
+    }
+
+    # 批内条目: (帧序号, 时间戳, 图像)；重复帧的图像为None，沿用前一帧的结果
+    batch = []
+    pending_images = 0
+    last_fingerprint = None
+    last_classifications = None
+
+    def flush():
+        nonlocal pending_images, last_classifications
+        if not batch:
+            return
+        images = [image for _, _, image in batch if image is not None]
+        results = iter(())
+        if images:
+            # 批内帧在推理期间占用的内存计入全局预算
+            with detector.reserve_images(images):
+                results = iter(detector.classify_batch(images))
+        if images:
+            stats['batches'] += 1
+        for frame_index, timestamp, image in batch:
+            if image is not None:
+                last_classifications = next(results)
+                if last_classifications:
+                    stats['frames_classified'] += 1
+                else:
+                    stats['frames_failed'] += 1
+            if last_classifications:
+                segmenter.add(frame_index, timestamp, last_classifications)
+        batch.clear()
+        pending_images = 0
+
+    frames = iter(frames)
+    for frame_index, timestamp, image in frames:
+        stats['frames_sampled'] += 1
+        stats['last_frame'] = frame_index
+        stats['last_timestamp'] = round(timestamp, 3)
+
+        # 与上一张保留帧几乎相同则跳过推理
+        fingerprint = compute_fingerprint(image)
+        if (last_fingerprint is not None
+                and hamming_distance(fingerprint.dhash, last_fingerprint.dhash) <= dedup_distance
+                and colour_distance(fingerprint.colour, last_fingerprint.colour) <= dedup_colour_distance):
+            batch.append((frame_index, timestamp, None))
+            stats['frames_duplicate'] += 1
+        else:
+            last_fingerprint = fingerprint
+            batch.append((frame_index, timestamp, image))
+            pending_images += 1
+
+        if pending_images >= batch_size or len(batch) >= batch_size * 8:
+            flush()
+
+        if max_frames and stats['frames_sampled'] >= max_frames:
+            # 还有剩余帧时说明被截断
+            stats['truncated'] = next(frames, None) is not None
+            break
+
+    flush()
+    return segmenter.finish(), stats
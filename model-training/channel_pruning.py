@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+YOLOv8分类网络的结构化通道剪枝
+以BN缩放系数的绝对值衡量通道重要性，按目标稀疏度移除卷积输出通道，并同步裁剪下游卷积/全连接层的输入。
+剪枝后得到更窄的普通网络，不依赖稀疏算子即可在CPU上提速
+"""
+
+import copy
+
+import torch.nn as nn
+from ultralytics.nn.modules import Conv, C2f, Classify
+
+
+def _prunable(block):
+    """只处理 Conv2d + BatchNorm2d 的普通卷积块（不含分组卷积）"""
+    return (isinstance(block, Conv) and type(block.conv) is nn.Conv2d and block.conv.groups == 1
+            and isinstance(block.bn, nn.BatchNorm2d))
+
+
+def _input_block(layer):
+    """层内第一个读取上一层输出的卷积块"""
+    if isinstance(layer, C2f):
+        return layer.cv1
+    if isinstance(layer, Classify):
+        return layer.conv
+    if isinstance(layer, Conv):
+        return layer
+    return None
+
+
+def _output_block(layer):
+    """层内产生该层输出的卷积块"""
+    if isinstance(layer, C2f):
+        return layer.cv2
+    if isinstance(layer, Conv):
+        return layer
+    return None
+
+
+def keep_count(channels, sparsity, round_to=8):
+    """剪枝后保留的通道数，取round_to的整数倍以利于CPU向量化，至少保留round_to个"""
+    keep = int(round(channels * (1 - sparsity) / round_to)) * round_to
+    return min(channels, max(round_to, keep))
+
+
+def select_channels(block, sparsity, round_to=8):
+    """按BN缩放系数绝对值保留最重要的通道，返回升序的通道索引"""
+    importance = block.bn.weight.detach().abs()
+    keep = keep_count(len(importance), sparsity, round_to)
+    return importance.topk(keep).indices.sort().values
+
+
+def prune_outputs(block, keep):
+    conv, bn = block.conv, block.bn
+    conv.weight = nn.Parameter(conv.weight.data[keep].clone())
+    if conv.bias is not None:
+        conv.bias = nn.Parameter(conv.bias.data[keep].clone())
+    conv.out_channels = len(keep)
+    bn.weight = nn.Parameter(bn.weight.data[keep].clone())
+    bn.bias = nn.Parameter(bn.bias.data[keep].clone())
+    bn.running_mean = bn.running_mean[keep].clone()
+    bn.running_var = bn.running_var[keep].clone()
+    bn.num_features = len(keep)
+
+
+def prune_inputs(layer, keep):
+    if isinstance(layer, nn.Linear):
+        layer.weight = nn.Parameter(layer.weight.data[:, keep].clone())
+        layer.in_features = len(keep)
+        return
+    conv = layer.conv
+    conv.weight = nn.Parameter(conv.weight.data[:, keep].clone())
+    conv.in_channels = len(keep)
+
+
+def prune_model(module, sparsity, round_to=8):
+    """
+    返回按稀疏度剪枝后的网络副本及剪枝摘要。剪枝位置：
+    C2f中Bottleneck的隐藏通道、顺序相连的各层之间的输出通道、分类头卷积到全连接层之间的通道；
+    C2f切分后参与残差相加的通道保持不变
+    """
+    pruned = copy.deepcopy(module)
+    layers = list(pruned.model)
+    pairs = []
+
+    for layer in layers:
+        if isinstance(layer, C2f):
+            pairs.extend((bottleneck.cv1, bottleneck.cv2) for bottleneck in layer.m)
+    for layer, consumer in zip(layers, layers[1:]):
+        if getattr(consumer, 'f', -1) == -1:
+            pairs.append((_output_block(layer), _input_block(consumer)))
+    if isinstance(layers[-1], Classify):
+        pairs.append((layers[-1].conv, layers[-1].linear))
+
+    channels_before = channels_after = 0
+    pruned_groups = 0
+    for producer, consumer in pairs:
+        if producer is None or consumer is None or not _prunable(producer):
+            continue
+        if not isinstance(consumer, nn.Linear) and not _prunable(consumer):
+            continue
+        keep = select_channels(producer, sparsity, round_to)
+        channels_before += producer.conv.out_channels
+        channels_after += len(keep)
+        # 保留全部通道（通道数过少）时不计为已剪枝
+        if len(keep) == producer.conv.out_channels:
+            continue
+        pruned_groups += 1
+        prune_outputs(producer, keep)
+        prune_inputs(consumer, keep)
+
+    return pruned, {
+        'sparsity': sparsity,
+        'pruned_groups': pruned_groups,
+        'candidate_groups': len(pairs),
+        'channels_before': channels_before,
+        'channels_after': channels_after,
+        'parameters_before': sum(p.numel() for p in module.parameters()),
+        'parameters_after': sum(p.numel() for p in pruned.parameters())
+    }
+
+
+def pareto_front(rows, accuracy_key='val_top1', latency_key='batch1_ms'):
+    """标记准确率与CPU延迟上的帕累托最优行：没有其他行准确率不低且延迟不高（至少一项严格更好）"""
+    for row in rows:
+        accuracy, latency = row[accuracy_key], row['cpu_latency'][latency_key]
+        row['pareto'] = not any(
+            other[accuracy_key] >= accuracy and other['cpu_latency'][latency_key] <= latency
+            and (other[accuracy_key] > accuracy or other['cpu_latency'][latency_key] < latency)
+            for other in rows if other is not row)
+    return rows
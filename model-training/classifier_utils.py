@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分类模型压缩（蒸馏、剪枝）共用的工具
+读取准备好的数据划分、评估Top-1准确率、测量CPU推理延迟，并保存可被 YOLO() 直接加载的权重
+"""
+
+import copy
+import time
+from pathlib import Path
+from datetime import datetime
+
+import numpy as np
+import torch
+import yaml
+from PIL import Image
+from torch.utils.data import Dataset, DataLoader
+from torchvision import transforms
+
+IMAGE_SUFFIXES = {'.jpg', '.jpeg', '.png', '.bmp'}
+
+
+def load_dataset_info(yolo_dir):
+    """读取 dataset.yaml 中的类别名称"""
+    with open(Path(yolo_dir) / "dataset.yaml", 'r', encoding='utf-8') as f:
+        info = yaml.safe_load(f)
+    names = info['names']
+    return list(names.values()) if isinstance(names, dict) else list(names)
+
+
+def find_split_samples(split_dir, class_names):
+    """
+    列出数据划分中的 (图像路径, 类别索引)。
+    支持 prepare_dataset 生成的 images/ + labels/ 布局，以及 ultralytics 分类训练使用的 <类别名>/ 子目录布局
+    """
+    split_dir = Path(split_dir)
+    samples = []
+    image_dir = split_dir / "images"
+    if image_dir.is_dir():
+        label_dir = split_dir / "labels"
+        for image_path in sorted(image_dir.iterdir()):
+            label_file = label_dir / f"{image_path.stem}.txt"
+            if image_path.suffix.lower() in IMAGE_SUFFIXES and label_file.exists():
+                samples.append((image_path, int(label_file.read_text().split()[0])))
+        return samples
+
+    class_index = {name: i for i, name in enumerate(class_names)}
+    for class_dir in sorted(d for d in split_dir.iterdir() if d.is_dir() and d.name in class_index):
+        for image_path in sorted(class_dir.iterdir()):
+            if image_path.suffix.lower() in IMAGE_SUFFIXES:
+                samples.append((image_path, class_index[class_dir.name]))
+    return samples
+
+
+def classify_transform(imgsz, augment=False):
+    """评估时与线上服务一致：短边缩放、中心裁剪、归一化到[0,1]；训练时随机裁剪与翻转"""
+    if augment:
+        return transforms.Compose([
+            transforms.RandomResizedCrop(imgsz, scale=(0.5, 1.0)),
+            transforms.RandomHorizontalFlip(0.5),
+            transforms.RandomVerticalFlip(0.5),
+            transforms.ColorJitter(brightness=0.4, saturation=0.7, hue=0.015),
+            transforms.ToTensor()
+        ])
+    return transforms.Compose([
+        transforms.Resize(imgsz),
+        transforms.CenterCrop(imgsz),
+        transforms.ToTensor()
+    ])
+
+
+class ClassificationImageDataset(Dataset):
+    def __init__(self, samples, imgsz, augment=False):
+        self.samples = samples
+        self.transform = classify_transform(imgsz, augment)
+
+    def __len__(self):
+        return len(self.samples)
+
+    def __getitem__(self, index):
+        image_path, label = self.samples[index]
+        with Image.open(image_path) as image:
+            return self.transform(image.convert('RGB')), label
+
+
+def make_loader(samples, imgsz, batch_size, augment=False, workers=8):
+    return DataLoader(
+        ClassificationImageDataset(samples, imgsz, augment),
+        batch_size=batch_size,
+        shuffle=augment,
+        num_workers=workers,
+        pin_memory=torch.cuda.is_available(),
+        drop_last=augment and len(samples) > batch_size
+    )
+
+
+def classifier_logits(module, batch):
+    """
+    返回分类网络的logits。训练模式下分类头直接输出logits；推理模式下输出 (softmax概率, logits)，
+    旧版本只输出概率，此时取对数（对softmax而言与logits等价）
+    """
+    output = module(batch)
+    if isinstance(output, (list, tuple)):
+        return output[1] if len(output) > 1 else output[0].clamp_min(1e-8).log()
+    if not module.training:
+        return output.clamp_min(1e-8).log()
+    return output
+
+
+def evaluate_top1(module, loader, device):
+    """在数据划分上评估，返回 (Top-1准确率, Top-5准确率)"""
+    module.eval()
+    correct1 = correct5 = total = 0
+    with torch.inference_mode():
+        for images, labels in loader:
+            images, labels = images.to(device), labels.to(device)
+            logits = classifier_logits(module, images)
+            top5 = logits.topk(min(5, logits.shape[1]), dim=1).indices
+            correct1 += (top5[:, 0] == labels).sum().item()
+            correct5 += (top5 == labels[:, None]).any(dim=1).sum().item()
+            total += labels.numel()
+    return (correct1 / total, correct5 / total) if total else (0.0, 0.0)
+
+
+def count_parameters(module):
+    return sum(p.numel() for p in module.parameters())
+
+
+def measure_cpu_latency(module, imgsz, batch_sizes=(1, 8), warmup=3, iterations=20):
+    """在CPU上测量融合后网络的推理延迟：各批大小的中位延迟（毫秒）与吞吐（张/秒）"""
+    module = copy.deepcopy(module).cpu().float().eval()
+    if hasattr(module, 'fuse'):
+        module = module.fuse(verbose=False)
+    report = {}
+    with torch.inference_mode():
+        for batch_size in batch_sizes:
+            batch = torch.rand(batch_size, 3, imgsz, imgsz)
+            for _ in range(warmup):
+                module(batch)
+            timings = []
+            for _ in range(iterations):
+                start = time.perf_counter()
+                module(batch)
+                timings.append(time.perf_counter() - start)
+            median = float(np.median(timings))
+            report[f"batch{batch_size}_ms"] = round(median * 1000, 2)
+            report[f"batch{batch_size}_images_per_second"] = round(batch_size / median, 1)
+    return report
+
+
+def save_classifier_checkpoint(module, path, class_names, imgsz, **extra):
+    """按 ultralytics 权重格式保存，YOLO(path) 与线上服务可直接加载"""
+    import ultralytics
+    module = copy.deepcopy(module).cpu().eval()
+    module.names = dict(enumerate(class_names))
+    args = getattr(module, 'args', None) or {}
+    args = dict(args if isinstance(args, dict) else vars(args), imgsz=imgsz, task='classify')
+    module.args = args
+    for parameter in module.parameters():
+        parameter.requires_grad_(False)
+    checkpoint = {
+        'model': module.half(),
+        'train_args': args,
+        'date': datetime.now().isoformat(),
+        'version': ultralytics.__version__,
+        'epoch': -1,
+        **extra
+    }
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    torch.save(checkpoint, path)
+    return Path(path)
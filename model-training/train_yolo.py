@@ -8,6 +8,7 @@
 import os
 import sys
 import torch
+import torch.nn.functional as F
 import yaml
 import shutil
 import argparse
@@ -19,9 +20,16 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import classification_report, confusion_matrix
-import cv2
 from PIL import Image
 import random
+import json
+import copy
+import time
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from classifier_utils import (load_dataset_info, find_split_samples, make_loader, classifier_logits,
+                              evaluate_top1, count_parameters, measure_cpu_latency, save_classifier_checkpoint)
 
 # 添加ultralytics支持
 try:
@@ -35,6 +43,52 @@ except ImportError:
 plt.rcParams['font.sans-serif'] = ['SimHei']
 plt.rcParams['axes.unicode_minus'] = False
 
+def materialize_file(src, dst, mode='hardlink'):
+    """
+    将源图像放到数据集目录，不解码像素。hardlink/symlink 失败（如跨磁盘、无创建符号链接权限）时退回复制，
+    返回实际使用的方式
+    """
+    if dst.exists() or dst.is_symlink():
+        dst.unlink()
+    if mode == 'hardlink':
+        try:
+            os.link(src, dst)
+            return 'hardlink'
+        except OSError:
+            pass
+    elif mode == 'symlink':
+        try:
+            os.symlink(os.path.abspath(src), dst)
+            return 'symlink'
+        except OSError:
+            pass
+    shutil.copy2(src, dst)
+    return 'copy'
+
+
+def destination_name(src, class_id, taken):
+    """
+    目标文件名加类别编号前缀，避免不同类别的同名文件互相覆盖；
+    仍然冲突（如大小写不敏感的文件系统）时再附加源路径摘要
+    """
+    src = Path(src)
+    name = f"{class_id:02d}_{src.name}"
+    if name.lower() in taken:
+        digest = hashlib.sha1(str(src).encode('utf-8')).hexdigest()[:8]
+        name = f"{class_id:02d}_{src.stem}_{digest}{src.suffix}"
+    taken.add(name.lower())
+    return name
+
+
+def distillation_loss(student_logits, teacher_logits, labels, temperature=4.0, alpha=0.7):
+    """软标签KL散度（乘以温度平方以保持梯度量级）与真实标签交叉熵的加权和"""
+    soft = F.kl_div(F.log_softmax(student_logits / temperature, dim=1),
+                    F.softmax(teacher_logits / temperature, dim=1),
+                    reduction='batchmean') * temperature ** 2
+    hard = F.cross_entropy(student_logits, labels)
+    return alpha * soft + (1 - alpha) * hard
+
+
 class CropDiseaseYOLOTrainer:
     def __init__(self, config):
         """初始化YOLO训练器"""
@@ -68,18 +122,9 @@ class CropDiseaseYOLOTrainer:
         """准备YOLO格式的数据集"""
         print("\n🔄 准备YOLO数据集...")
         
-        # 创建YOLO数据集目录结构
+        # 创建YOLO数据集目录，各划分的 images/ 与 labels/ 在放置图像时创建
         yolo_dir = self.output_dir / "yolo_dataset"
-        train_img_dir = yolo_dir / "train" / "images"
-        train_label_dir = yolo_dir / "train" / "labels"
-        val_img_dir = yolo_dir / "val" / "images"
-        val_label_dir = yolo_dir / "val" / "labels"
-        test_img_dir = yolo_dir / "test" / "images"
-        test_label_dir = yolo_dir / "test" / "labels"
-        
-        # 创建目录
-        for dir_path in [train_img_dir, train_label_dir, val_img_dir, val_label_dir, test_img_dir, test_label_dir]:
-            dir_path.mkdir(parents=True, exist_ok=True)
+        yolo_dir.mkdir(parents=True, exist_ok=True)
             
         # 获取所有类别
         class_dirs = [d for d in self.dataset_path.iterdir() if d.is_dir()]
@@ -131,30 +176,12 @@ class CropDiseaseYOLOTrainer:
         print(f"  验证集: {len(val_paths)} 张 ({len(val_paths)/len(all_image_paths)*100:.1f}%)")
         print(f"  测试集: {len(test_paths)} 张 ({len(test_paths)/len(all_image_paths)*100:.1f}%)")
         
-        # 复制图像并创建标签
-        def copy_images_and_create_labels(paths, labels, img_dir, label_dir, split_name):
-            print(f"🔄 处理{split_name}集...")
-            for img_path, label in zip(paths, labels):
-                # 复制图像
-                img_file = Path(img_path)
-                dst_img_path = img_dir / img_file.name
-                shutil.copy2(img_path, dst_img_path)
-                
-                # 创建YOLO格式标签 (对于分类任务，我们创建整图标注)
-                label_file = label_dir / f"{img_file.stem}.txt"
-                
-                # 读取图像尺寸
-                img = cv2.imread(img_path)
-                h, w = img.shape[:2]
-                
-                # YOLO格式: class_id center_x center_y width height (归一化)
-                # 对于分类任务，我们将整个图像作为一个边界框
-                with open(label_file, 'w') as f:
-                    f.write(f"{label} 0.5 0.5 1.0 1.0\n")
-                    
-        copy_images_and_create_labels(train_paths, train_labels, train_img_dir, train_label_dir, "训练")
-        copy_images_and_create_labels(val_paths, val_labels, val_img_dir, val_label_dir, "验证")
-        copy_images_and_create_labels(test_paths, test_labels, test_img_dir, test_label_dir, "测试")
+        # 并行放置图像并创建标签（不解码像素）
+        self.materialize_splits(yolo_dir, {
+            'train': (train_paths, train_labels),
+            'val': (val_paths, val_labels),
+            'test': (test_paths, test_labels)
+        })
         
         # 创建类别文件
         with open(yolo_dir / "classes.txt", 'w', encoding='utf-8') as f:
@@ -179,6 +206,72 @@ class CropDiseaseYOLOTrainer:
         
         return yolo_dir
         
+    def materialize_splits(self, yolo_dir, splits):
+        """
+        按 link_mode（hardlink / symlink / copy）并行放置各划分的图像并写入整图标签，
+        输出进度与吞吐
+        """
+        mode = self.config.get('link_mode', 'hardlink')
+        workers = self.config.get('prepare_workers') or min(32, (os.cpu_count() or 1) * 4)
+        
+        # 重新生成前清空旧的划分目录，避免上次残留的文件混入
+        tasks = []
+        for split, (paths, labels) in splits.items():
+            img_dir = yolo_dir / split / "images"
+            label_dir = yolo_dir / split / "labels"
+            for dir_path in (img_dir, label_dir):
+                if dir_path.exists():
+                    shutil.rmtree(dir_path)
+                dir_path.mkdir(parents=True)
+            taken = set()
+            for img_path, label in zip(paths, labels):
+                name = destination_name(img_path, label, taken)
+                tasks.append((img_path, img_dir / name, label_dir / f"{Path(name).stem}.txt", label))
+                
+        def place(task):
+            src, dst, label_file, label = task
+            used = materialize_file(src, dst, mode)
+            # YOLO格式: class_id center_x center_y width height (归一化)，分类任务以整幅图像作为边界框
+            with open(label_file, 'w') as f:
+                f.write(f"{label} 0.5 0.5 1.0 1.0\n")
+            return used
+            
+        print(f"🔄 放置 {len(tasks)} 张图像 (方式: {mode}, 线程: {workers})...")
+        counts = {}
+        start = time.time()
+        last_report = start
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(place, task) for task in tasks]
+            for done, future in enumerate(as_completed(futures), 1):
+                used = future.result()
+                counts[used] = counts.get(used, 0) + 1
+                now = time.time()
+                if now - last_report >= 1.0 or done == len(tasks):
+                    last_report = now
+                    rate = done / max(now - start, 1e-6)
+                    print(f"\r  进度: {done}/{len(tasks)} ({done / max(1, len(tasks)) * 100:.1f}%) "
+                          f"{rate:.0f} 张/秒", end='', flush=True)
+        print()
+        
+        elapsed = time.time() - start
+        print(f"✅ 图像放置完成: {elapsed:.1f}s, 平均 {len(tasks) / max(elapsed, 1e-6):.0f} 张/秒, "
+              + ", ".join(f"{used} {count} 张" for used, count in sorted(counts.items())))
+        if mode != 'copy' and counts.get('copy'):
+            print(f"⚠️ {counts['copy']} 张图像无法使用 {mode}，已改为复制")
+        return counts
+        
+    def ensure_dataset(self):
+        """已有准备好的数据集时直接读取类别信息，否则重新准备"""
+        yolo_dir = self.output_dir / "yolo_dataset"
+        if not (yolo_dir / "dataset.yaml").exists():
+            return self.prepare_dataset()
+            
+        self.class_names = load_dataset_info(yolo_dir)
+        self.class_mapping = {name: idx for idx, name in enumerate(self.class_names)}
+        self.yolo_dataset_path = yolo_dir / "dataset.yaml"
+        print(f"📂 使用已准备的数据集: {yolo_dir} ({len(self.class_names)} 个类别)")
+        return yolo_dir
+        
     def create_improved_model_config(self):
         """创建改进的YOLO模型配置"""
         print("\n⚙️ 创建改进的模型配置...")
@@ -308,6 +401,272 @@ class CropDiseaseYOLOTrainer:
         print("✅ 模型训练完成!")
         return results
         
+    def load_classifier(self, model_path, role="教师"):
+        """加载训练好的分类模型，检查类别与数据集一致，返回 (网络, 输入尺寸)"""
+        model = YOLO(model_path)
+        if model.task != 'classify':
+            raise ValueError(f"{role}模型任务为 {model.task}，需要 yolov8*-cls 分类模型（train模式产生的检测模型不能使用）")
+        names = [model.names[i] for i in range(len(model.names))]
+        if names != self.class_names:
+            raise ValueError(f"{role}模型的类别与数据集 dataset.yaml 中的类别不一致")
+        args = getattr(model.model, 'args', None) or {}
+        args = args if isinstance(args, dict) else vars(args)
+        return model.model, args.get('imgsz') or 224
+        
+    def split_loaders(self, imgsz, batch_size):
+        """训练集（带增强）、验证集与测试集的数据加载器"""
+        workers = min(8, os.cpu_count() or 1)
+        yolo_dir = self.output_dir / "yolo_dataset"
+        splits = {split: find_split_samples(yolo_dir / split, self.class_names) for split in ('train', 'val', 'test')}
+        print(f"📊 训练集 {len(splits['train'])} 张，验证集 {len(splits['val'])} 张，测试集 {len(splits['test'])} 张")
+        return {
+            'train': make_loader(splits['train'], imgsz, batch_size, augment=True, workers=workers),
+            'val': make_loader(splits['val'], imgsz, batch_size * 2, workers=workers),
+            'test': make_loader(splits['test'], imgsz, batch_size * 2, workers=workers) if splits['test'] else None
+        }
+        
+    def train_against_teacher(self, student_module, teacher_module, loaders, epochs, lr, temperature, alpha, device):
+        """
+        以教师软标签加真实标签训练学生网络，每轮在验证集上评估，
+        结束后学生网络恢复为验证Top-1最高的一轮，返回各轮记录
+        """
+        optimizer = torch.optim.AdamW(student_module.parameters(), lr=lr, weight_decay=0.0005)
+        scheduler = torch.optim.lr_scheduler.CosineAnnealingLR(
+            optimizer, T_max=max(1, epochs * len(loaders['train'])), eta_min=lr * 0.01)
+        
+        best_top1 = -1.0
+        best_state = copy.deepcopy(student_module.state_dict())
+        history = []
+        for epoch in range(1, epochs + 1):
+            student_module.train()
+            running_loss = 0.0
+            start = time.time()
+            for images, labels in loaders['train']:
+                images, labels = images.to(device, non_blocking=True), labels.to(device, non_blocking=True)
+                with torch.no_grad():
+                    teacher_logits = classifier_logits(teacher_module, images)
+                student_logits = classifier_logits(student_module, images)
+                loss = distillation_loss(student_logits, teacher_logits, labels, temperature, alpha)
+                
+                optimizer.zero_grad(set_to_none=True)
+                loss.backward()
+                optimizer.step()
+                scheduler.step()
+                running_loss += loss.item()
+                
+            top1, top5 = evaluate_top1(student_module, loaders['val'], device)
+            mean_loss = running_loss / max(1, len(loaders['train']))
+            history.append({'epoch': epoch, 'loss': round(mean_loss, 4), 'val_top1': round(top1, 4), 'val_top5': round(top5, 4)})
+            print(f"  第 {epoch}/{epochs} 轮: 损失 {mean_loss:.4f}, 验证Top-1 {top1:.4f}, "
+                  f"Top-5 {top5:.4f} ({time.time() - start:.0f}s)")
+            if top1 > best_top1:
+                best_top1 = top1
+                best_state = copy.deepcopy(student_module.state_dict())
+                
+        student_module.load_state_dict(best_state)
+        return history
+        
+    def summarize_classifier(self, module, weights, loaders, device, imgsz):
+        """模型的参数量、权重大小、验证/测试准确率与CPU延迟"""
+        val_top1, val_top5 = evaluate_top1(module, loaders['val'], device)
+        test_top1, test_top5 = evaluate_top1(module, loaders['test'], device) if loaders['test'] else (None, None)
+        weights = Path(weights)
+        return {
+            'weights': str(weights),
+            'parameters': count_parameters(module),
+            'weights_mb': round(weights.stat().st_size / 1024 / 1024, 2),
+            'val_top1': round(val_top1, 4),
+            'val_top5': round(val_top5, 4),
+            'test_top1': round(test_top1, 4) if test_top1 is not None else None,
+            'test_top5': round(test_top5, 4) if test_top5 is not None else None,
+            'cpu_latency': measure_cpu_latency(module, imgsz)
+        }
+        
+    def distill_student(self):
+        """
+        知识蒸馏：以训练好的教师模型的软标签训练小尺寸学生模型，
+        输出学生模型权重以及教师/学生的准确率与CPU延迟对比报告
+        """
+        print("\n🧪 开始知识蒸馏...")
+        
+        teacher_path = self.config['teacher']
+        student_size = self.config.get('student_size', 'n')
+        temperature = self.config.get('temperature', 4.0)
+        alpha = self.config.get('alpha', 0.7)
+        epochs = self.config.get('distill_epochs', 30)
+        device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+        
+        # 教师模型：冻结参数，只提供软标签
+        teacher_module, teacher_imgsz = self.load_classifier(teacher_path, "教师")
+        imgsz = self.config.get('distill_img_size') or teacher_imgsz
+        teacher_module = teacher_module.to(device).float().eval()
+        for parameter in teacher_module.parameters():
+            parameter.requires_grad_(False)
+            
+        # 学生模型：预训练的小尺寸分类模型，分类头替换为数据集类别数
+        from ultralytics.nn.tasks import ClassificationModel
+        student_name = f"yolov8{student_size}-cls.pt"
+        print(f"📦 教师模型: {teacher_path}")
+        print(f"📦 学生模型: {student_name} (温度 {temperature}, 软标签权重 {alpha}, 输入尺寸 {imgsz})")
+        student_module = YOLO(student_name).model
+        ClassificationModel.reshape_outputs(student_module, len(self.class_names))
+        student_module = student_module.to(device).float()
+        for parameter in student_module.parameters():
+            parameter.requires_grad_(True)
+            
+        loaders = self.split_loaders(imgsz, self.config.get('batch_size', 16))
+        history = self.train_against_teacher(student_module, teacher_module, loaders, epochs,
+                                             self.config.get('distill_lr', 0.001), temperature, alpha, device)
+        
+        distill_dir = self.output_dir / "distillation"
+        student_file = save_classifier_checkpoint(
+            student_module, distill_dir / f"crop_disease_student_{student_size}.pt", self.class_names, imgsz,
+            distillation={'teacher': str(teacher_path), 'temperature': temperature, 'alpha': alpha, 'epochs': epochs})
+        print(f"✅ 学生模型已保存: {student_file}")
+        
+        # 教师与学生对比：验证集用于挑选学生模型，测试集给出无偏的准确率
+        print("\n📊 对比教师与学生模型...")
+        comparison = {
+            'teacher': self.summarize_classifier(teacher_module, teacher_path, loaders, device, imgsz),
+            'student': self.summarize_classifier(student_module, student_file, loaders, device, imgsz)
+        }
+        report = {
+            'teacher': str(teacher_path),
+            'student_size': student_size,
+            'imgsz': imgsz,
+            'temperature': temperature,
+            'alpha': alpha,
+            'epochs': epochs,
+            'cpu_threads': torch.get_num_threads(),
+            'comparison': comparison,
+            'history': history,
+            'date': datetime.now().isoformat()
+        }
+        with open(distill_dir / "distillation_report.json", 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        self.write_distillation_report(report, distill_dir / "distillation_report.md")
+        
+        self.student_model_path = student_file
+        return report
+        
+    def prune_classifier(self, model_path, sparsity_levels):
+        """
+        结构化通道剪枝：按各目标稀疏度剪枝训练好的分类模型，并以未剪枝模型为教师短暂微调，
+        测量各级别的验证集Top-1与CPU延迟，输出帕累托表与剪枝后的模型
+        """
+        print("\n✂️ 开始结构化通道剪枝...")
+        from channel_pruning import prune_model, pareto_front
+        
+        epochs = self.config.get('prune_epochs', 3)
+        lr = self.config.get('prune_lr', 0.0005)
+        temperature = self.config.get('temperature', 4.0)
+        alpha = self.config.get('alpha', 0.7)
+        accuracy_floor = self.config.get('accuracy_floor')
+        device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+        
+        base_module, imgsz = self.load_classifier(model_path, "待剪枝")
+        base_module = base_module.to(device).float().eval()
+        for parameter in base_module.parameters():
+            parameter.requires_grad_(False)
+        loaders = self.split_loaders(imgsz, self.config.get('batch_size', 16))
+        
+        prune_dir = self.output_dir / "pruning"
+        prune_dir.mkdir(parents=True, exist_ok=True)
+        baseline = self.summarize_classifier(base_module, model_path, loaders, device, imgsz)
+        rows = [dict(baseline, sparsity=0.0, channels_kept=1.0)]
+        print(f"📏 原始模型: 验证Top-1 {baseline['val_top1']:.4f}, 单张延迟 {baseline['cpu_latency']['batch1_ms']}ms")
+        
+        for sparsity in sorted(sparsity_levels):
+            print(f"\n✂️ 稀疏度 {sparsity:.0%}:")
+            pruned_module, summary = prune_model(base_module, sparsity)
+            pruned_module = pruned_module.to(device)
+            for parameter in pruned_module.parameters():
+                parameter.requires_grad_(True)
+            print(f"  剪枝 {summary['pruned_groups']}/{summary['candidate_groups']} 组，"
+                  f"通道 {summary['channels_before']} -> {summary['channels_after']}，"
+                  f"参数 {summary['parameters_before'] / 1e6:.2f}M -> {summary['parameters_after'] / 1e6:.2f}M")
+            
+            history = self.train_against_teacher(pruned_module, base_module, loaders, epochs, lr, temperature, alpha, device)
+            pruned_file = save_classifier_checkpoint(
+                pruned_module, prune_dir / f"crop_disease_pruned_{round(sparsity * 100)}.pt", self.class_names, imgsz,
+                pruning={'source': str(model_path), 'sparsity': sparsity, 'finetune_epochs': epochs})
+            row = self.summarize_classifier(pruned_module, pruned_file, loaders, device, imgsz)
+            row.update(sparsity=sparsity, channels_kept=round(summary['channels_after'] / max(1, summary['channels_before']), 4),
+                       history=history)
+            rows.append(row)
+            print(f"  ✅ 验证Top-1 {row['val_top1']:.4f}, 单张延迟 {row['cpu_latency']['batch1_ms']}ms: {pruned_file}")
+            
+        pareto_front(rows)
+        # 满足准确率下限的模型中单张延迟最低的一个
+        eligible = [row for row in rows if accuracy_floor is None or row['val_top1'] >= accuracy_floor]
+        recommended = min(eligible, key=lambda row: row['cpu_latency']['batch1_ms']) if eligible else None
+        
+        report = {
+            'source': str(model_path),
+            'imgsz': imgsz,
+            'finetune_epochs': epochs,
+            'accuracy_floor': accuracy_floor,
+            'cpu_threads': torch.get_num_threads(),
+            'levels': rows,
+            'recommended': recommended['weights'] if recommended else None,
+            'date': datetime.now().isoformat()
+        }
+        with open(prune_dir / "pruning_report.json", 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        self.write_pruning_report(report, prune_dir / "pruning_report.md")
+        return report
+        
+    def write_pruning_report(self, report, report_file):
+        """输出各稀疏度的帕累托表"""
+        with open(report_file, 'w', encoding='utf-8') as f:
+            f.write("# 作物病害分类模型剪枝报告\n\n")
+            f.write(f"- 原始模型: {report['source']}\n")
+            f.write(f"- 输入尺寸: {report['imgsz']}，微调轮数: {report['finetune_epochs']}，CPU线程数: {report['cpu_threads']}\n")
+            if report['accuracy_floor'] is not None:
+                f.write(f"- 准确率下限: {report['accuracy_floor']:.4f}\n")
+            f.write("\n## 准确率与CPU延迟\n\n")
+            f.write("| 稀疏度 | 保留通道 | 参数量(M) | 权重(MB) | 验证Top-1 | 验证Top-5 | 批大小1延迟(ms) | 批大小8吞吐(张/秒) | 帕累托最优 | 模型 |\n")
+            f.write("|---|---|---|---|---|---|---|---|---|---|\n")
+            for row in report['levels']:
+                f.write(f"| {row['sparsity']:.0%} | {row['channels_kept']:.0%} | {row['parameters'] / 1e6:.2f} | "
+                        f"{row['weights_mb']} | {row['val_top1']:.4f} | {row['val_top5']:.4f} | "
+                        f"{row['cpu_latency']['batch1_ms']} | {row['cpu_latency']['batch8_images_per_second']} | "
+                        f"{'✓' if row['pareto'] else ''} | {row['weights']} |\n")
+            if report['recommended']:
+                f.write(f"\n满足准确率下限且单张延迟最低的模型: {report['recommended']}\n")
+            elif report['accuracy_floor'] is not None:
+                f.write("\n没有满足准确率下限的模型。\n")
+                
+        print(f"📄 剪枝报告已保存: {report_file}")
+        
+    def write_distillation_report(self, report, report_file):
+        """输出教师/学生对比的Markdown报告"""
+        teacher, student = report['comparison']['teacher'], report['comparison']['student']
+        
+        def fmt(value):
+            return '-' if value is None else f"{value:.4f}"
+            
+        with open(report_file, 'w', encoding='utf-8') as f:
+            f.write("# 作物病害分类模型蒸馏报告\n\n")
+            f.write(f"- 教师模型: {report['teacher']}\n")
+            f.write(f"- 学生模型: yolov8{report['student_size']}-cls\n")
+            f.write(f"- 输入尺寸: {report['imgsz']}，温度: {report['temperature']}，软标签权重: {report['alpha']}，"
+                    f"训练轮数: {report['epochs']}\n")
+            f.write(f"- CPU线程数: {report['cpu_threads']}\n\n")
+            f.write("## 准确率与CPU延迟\n\n")
+            f.write("| 模型 | 参数量(M) | 权重(MB) | 验证Top-1 | 测试Top-1 | 测试Top-5 | 批大小1延迟(ms) | 批大小8吞吐(张/秒) |\n")
+            f.write("|---|---|---|---|---|---|---|---|\n")
+            for role, label in (('teacher', '教师'), ('student', '学生')):
+                row = report['comparison'][role]
+                f.write(f"| {label} | {row['parameters'] / 1e6:.2f} | {row['weights_mb']} | {fmt(row['val_top1'])} | "
+                        f"{fmt(row['test_top1'])} | {fmt(row['test_top5'])} | {row['cpu_latency']['batch1_ms']} | "
+                        f"{row['cpu_latency']['batch8_images_per_second']} |\n")
+            speedup = teacher['cpu_latency']['batch1_ms'] / student['cpu_latency']['batch1_ms']
+            f.write(f"\n学生模型单张延迟为教师的 1/{speedup:.1f}，验证Top-1变化 "
+                    f"{(student['val_top1'] - teacher['val_top1']) * 100:+.2f} 个百分点。\n")
+            
+        print(f"📄 蒸馏报告已保存: {report_file}")
+        
     def evaluate_model(self):
         """评估模型性能"""
         print("\n📊 评估模型性能...")
@@ -481,8 +840,37 @@ def main():
     parser.add_argument('--batch-size', type=int, default=16, help='批次大小')
     parser.add_argument('--img-size', type=int, default=640, help='图像尺寸')
     parser.add_argument('--model-size', type=str, default='n', choices=['n', 's', 'm', 'l', 'x'], help='模型大小')
+    parser.add_argument('--link-mode', type=str, default='hardlink', choices=['hardlink', 'symlink', 'copy'],
+                       help='准备数据集时放置图像的方式，hardlink/symlink 失败时自动改为复制')
+    parser.add_argument('--prepare-workers', type=int, help='准备数据集的并行线程数，默认CPU核数的4倍（最多32）')
+    parser.add_argument('--mode', type=str, default='train', choices=['train', 'distill', 'prune'],
+                       help='train: 训练模型; distill: 以教师模型蒸馏小尺寸学生模型; prune: 剪枝已训练的分类模型')
+    parser.add_argument('--teacher', type=str,
+                       help='蒸馏使用的教师模型权重，必须是在本数据集类别上另行训练的 yolov8*-cls 分类模型'
+                            '（train模式产生的是检测模型，不能作为教师）')
+    parser.add_argument('--student-size', type=str, default='n', choices=['n', 's', 'm', 'l', 'x'], help='学生模型大小')
+    parser.add_argument('--distill-epochs', type=int, default=30, help='蒸馏训练轮数')
+    parser.add_argument('--distill-lr', type=float, default=0.001, help='蒸馏学习率')
+    parser.add_argument('--distill-img-size', type=int, help='蒸馏输入尺寸，默认与教师模型一致')
+    parser.add_argument('--temperature', type=float, default=4.0, help='蒸馏温度')
+    parser.add_argument('--alpha', type=float, default=0.7, help='软标签损失权重，其余为真实标签交叉熵')
+    parser.add_argument('--prune-levels', type=str,
+                       help='剪枝目标稀疏度，如 0.25,0.5,0.75；prune模式必填，distill模式下在蒸馏后对学生模型剪枝')
+    parser.add_argument('--prune-model', type=str, help='prune模式下待剪枝的分类模型权重')
+    parser.add_argument('--prune-epochs', type=int, default=3, help='每个稀疏度剪枝后的微调轮数')
+    parser.add_argument('--prune-lr', type=float, default=0.0005, help='剪枝微调学习率')
+    parser.add_argument('--accuracy-floor', type=float, help='验证集Top-1下限，用于推荐剪枝模型')
     
     args = parser.parse_args()
+    if args.mode == 'distill' and not args.teacher:
+        parser.error('蒸馏模式需要指定 --teacher')
+    if args.mode == 'prune' and not (args.prune_model and args.prune_levels):
+        parser.error('剪枝模式需要指定 --prune-model 与 --prune-levels')
+    if args.mode == 'train' and args.prune_levels:
+        parser.error('train模式训练的是检测模型，不支持剪枝；--prune-levels 只能用于 distill 或 prune 模式')
+    prune_levels = [float(level) for level in args.prune_levels.split(',')] if args.prune_levels else []
+    if any(not 0 < level < 1 for level in prune_levels):
+        parser.error('剪枝稀疏度必须在 (0, 1) 之间')
     
     # 配置参数
     config = {
@@ -494,7 +882,19 @@ def main():
         'model_size': args.model_size,
         'train_ratio': 0.7,
         'val_ratio': 0.2,
-        'random_seed': 42
+        'random_seed': 42,
+        'link_mode': args.link_mode,
+        'prepare_workers': args.prepare_workers,
+        'teacher': args.teacher,
+        'student_size': args.student_size,
+        'distill_epochs': args.distill_epochs,
+        'distill_lr': args.distill_lr,
+        'distill_img_size': args.distill_img_size,
+        'temperature': args.temperature,
+        'alpha': args.alpha,
+        'prune_epochs': args.prune_epochs,
+        'prune_lr': args.prune_lr,
+        'accuracy_floor': args.accuracy_floor
     }
     
     print("🌱 YOLO作物病害检测模型训练")
@@ -504,18 +904,34 @@ def main():
     trainer = CropDiseaseYOLOTrainer(config)
     
     try:
-        # 1. 准备数据集
-        trainer.prepare_dataset()
-        
-        # 2. 训练模型
-        trainer.train_model()
-        
-        # 3. 评估模型
-        trainer.evaluate_model()
-        
-        # 4. 保存最终模型
-        trainer.save_final_model()
-        
+        if args.mode == 'prune':
+            trainer.ensure_dataset()
+            trainer.prune_classifier(args.prune_model, prune_levels)
+            print("\n🎉 剪枝流程完成!")
+            print(f"📁 查看结果: {trainer.output_dir / 'pruning'}")
+            return
+            
+        if args.mode == 'distill':
+            # 蒸馏模式：复用已准备的数据集，训练学生模型并输出对比报告
+            trainer.ensure_dataset()
+            trainer.distill_student()
+            
+            # 可选：对学生模型做结构化剪枝
+            if prune_levels:
+                trainer.prune_classifier(trainer.student_model_path, prune_levels)
+        else:
+            # 1. 准备数据集
+            trainer.prepare_dataset()
+            
+            # 2. 训练模型
+            trainer.train_model()
+            
+            # 3. 评估模型
+            trainer.evaluate_model()
+            
+            # 4. 保存最终模型
+            trainer.save_final_model()
+            
         print("\n🎉 训练流程完成!")
         print(f"📁 查看结果: {trainer.output_dir}")
         